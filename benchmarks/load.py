@@ -0,0 +1,426 @@
+# Copyright 2022 Centro ALGORITMI - University of Minho and Instituto de Telecomunicações - Aveiro
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""
+Load test of Mp1 and Mm5 with local stand-ins (no MongoDB, cluster or network needed)
+
+Phases, run in order on the same platform:
+    onboarding     Mm5 configures every app (OAuth client, traffic and DNS rules), the app confirms it is
+                   ready on Mp1 and subscribes to its termination
+    registration   every app registers its services (with --batch, all of them in a single request)
+    subscription   subscribers ask to be notified of a service that does not exist yet
+    fanout         the service is registered, time until every subscriber was notified
+    liveness       heartbeats of every registered service (with --batch, of all the services of an app at once)
+    discovery      service queries (all services, by name and per app)
+    termination    Mm5 terminates every app (graceful, notifying the app)
+
+Usage (from the repository root):
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/load.py --apps 20 --services 5 --subscribers 50 --concurrency 8 --json load.json
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from report import summarize, table, write_json
+from servers import ServerProcesses
+from standins import CallbackSink, DnsApiStub, KubernetesStub, OAuthStub, Store, serve_store
+
+MP1_SUPPORT = ServerProcesses.url("mp1") + "/mec_app_support/v1"
+MP1_MGMT = ServerProcesses.url("mp1") + "/mec_service_mgmt/v1"
+MM5 = ServerProcesses.url("mm5") + "/mec_platform_mgmt/v1"
+
+FANOUT_SERVICE = "bench-fanout"
+
+
+def app_config(app_id: str) -> dict:
+    """
+    ConfigPlatformForAppRequest with one traffic rule and one DNS rule
+    """
+    return {
+        "appTrafficRule": [
+            {
+                "trafficRuleId": "tr-%s" % app_id,
+                "filterType": "FLOW",
+                "priority": 1,
+                "trafficFilter": [
+                    {
+                        "srcAddress": ["10.10.0.0/24"],
+                        "srcPort": ["8080"],
+                        "dstAddress": ["10.20.0.0/24"],
+                        "dstPort": ["80"],
+                        "protocol": ["TCP"],
+                    }
+                ],
+                "action": "FORWARD_DECAPSULATED",
+                "dstInterface": [{"interfaceType": "IP", "dstIpAddress": "10.20.0.1"}],
+            }
+        ],
+        "appDNSRule": [
+            {
+                "dnsRuleId": "dns-%s" % app_id,
+                "domainName": "%s.mec.local" % app_id,
+                "ipAddressType": "IP_V4",
+                "ipAddress": "10.20.0.1",
+                "ttl": 300,
+            }
+        ],
+    }
+
+
+def service_info(name: str) -> dict:
+    return {
+        "serName": name,
+        "version": "1.0",
+        "state": "ACTIVE",
+        "serializer": "JSON",
+        "livenessInterval": 60,
+        "scopeOfLocality": "MEC_HOST",
+        "consumedLocalOnly": True,
+        "isLocal": True,
+        "serCategory": {"href": "/example/catalogue1", "id": "cat-1", "name": "RNI", "version": "1.0"},
+        "transportInfo": {
+            "id": "transport-1",
+            "name": "REST",
+            "type": "REST_HTTP",
+            "protocol": "HTTP",
+            "version": "2.0",
+            "endpoint": {"uris": ["http://10.20.0.1:8000/%s" % name]},
+            "security": {
+                "oAuth2Info": {
+                    "grantTypes": ["OAUTH2_CLIENT_CREDENTIALS"],
+                    "tokenEndpoint": "/mec_app_support/v1/credentials/",
+                }
+            },
+        },
+    }
+
+
+class LoadTest:
+    def __init__(self, args, store: Store, sink: CallbackSink):
+        self.args = args
+        self.store = store
+        self.sink = sink
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        # operation -> durations, statuses and unexpected responses
+        self.durations = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.errors = Counter()
+        self.elapsed = {}
+        self.phase = None
+        self.extra = {}
+        self.apps = ["bench-app-%04d" % index for index in range(args.apps)]
+        self.tokens = {}
+        self.services = []
+
+    def session(self) -> requests.Session:
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def request(self, operation: str, method: str, url: str, expected=(200, 201, 204), **kwargs):
+        operation = "%s %s" % (self.phase, operation)
+        start = time.perf_counter()
+        response = self.session().request(method, url, timeout=60, **kwargs)
+        duration = time.perf_counter() - start
+        with self.lock:
+            self.durations[operation].append(duration)
+            self.statuses[operation][response.status_code] += 1
+            if response.status_code not in expected:
+                self.errors[operation] += 1
+        return response
+
+    def run_phase(self, name: str, jobs: list):
+        """
+        Runs the jobs (callables) with --concurrency client threads
+        """
+        self.phase = name
+        start = time.perf_counter()
+        with ThreadPoolExecutor(self.args.concurrency) as executor:
+            for future in [executor.submit(job) for job in jobs]:
+                future.result()
+        self.elapsed[name] = time.perf_counter() - start
+        print("%-13s %5d jobs in %.2fs" % (name, len(jobs), self.elapsed[name]), flush=True)
+
+    ############################################ PHASES ############################################
+
+    def onboard(self, app_id: str):
+        self.request(
+            "configure_platform_for_app",
+            "POST",
+            "%s/app_instances/%s/configure_platform_for_app" % (MM5, app_id),
+            json=app_config(app_id),
+        )
+        # The token reaches the app in a Kubernetes secret, read it from the database
+        status = self.store.call("appStatus", "find_one", ({"appInstanceId": app_id},), {})
+        self.tokens[app_id] = status["oauth"]["access_token"]
+
+        response = self.request(
+            "confirm_ready",
+            "POST",
+            "%s/applications/%s/confirm_ready" % (MP1_SUPPORT, app_id),
+            expected=(204, 429),
+            json={"indication": "READY"},
+            headers={"Authorization": "Bearer %s" % self.tokens[app_id]},
+        )
+        if response.status_code == 429:
+            # confirm_ready accepts one call every few seconds for the whole platform
+            self.store.call(
+                "appStatus", "update_one", ({"appInstanceId": app_id}, {"$set": {"indication": "READY"}}), {}
+            )
+            with self.lock:
+                self.extra["confirm_ready_rate_limited"] = self.extra.get("confirm_ready_rate_limited", 0) + 1
+
+        self.request(
+            "termination_subscription",
+            "POST",
+            "%s/applications/%s/subscriptions" % (MP1_SUPPORT, app_id),
+            json={
+                "subscriptionType": "AppTerminationNotificationSubscription",
+                "callbackReference": self.sink.callback("termination-%s" % app_id),
+                "appInstanceId": app_id,
+            },
+        )
+
+    def register(self, app_id: str, name: str):
+        response = self.request(
+            "register_service",
+            "POST",
+            "%s/applications/%s/services" % (MP1_MGMT, app_id),
+            expected=(201,),
+            params={"access_token": self.tokens[app_id]},
+            json=service_info(name),
+        )
+        if response.status_code == 201:
+            with self.lock:
+                self.services.append((app_id, response.json()["serInstanceId"], name))
+
+    def register_batch(self, app_id: str, names: list):
+        response = self.request(
+            "register_services_batch",
+            "POST",
+            "%s/applications/%s/services/batch" % (MP1_MGMT, app_id),
+            expected=(200,),
+            params={"access_token": self.tokens[app_id]},
+            json=[service_info(name) for name in names],
+        )
+        if response.status_code == 200:
+            with self.lock:
+                for name, result in zip(names, response.json()):
+                    if result["status"] == 201:
+                        self.services.append((app_id, result["serviceInfo"]["serInstanceId"], name))
+
+    def subscribe(self, app_id: str):
+        self.request(
+            "availability_subscription",
+            "POST",
+            "%s/applications/%s/subscriptions" % (MP1_MGMT, app_id),
+            expected=(201,),
+            params={"access_token": self.tokens[app_id]},
+            json={
+                "subscriptionType": "SerAvailabilityNotificationSubscription",
+                "callbackReference": self.sink.callback("fanout"),
+                "filteringCriteria": {"serNames": [FANOUT_SERVICE]},
+            },
+        )
+
+    def fanout(self):
+        start = time.perf_counter()
+        self.register(self.apps[0], FANOUT_SERVICE)
+        arrivals = self.sink.wait("fanout", self.args.subscribers, self.args.callback_timeout)
+        delays = [arrival - start for arrival in arrivals]
+        self.extra["fanout"] = {"subscribers": self.args.subscribers, "delivered": len(arrivals)}
+        self.extra["fanout"].update(
+            {"notified_" + key: value for key, value in summarize(delays).items() if key != "count"}
+        )
+
+    def heartbeat(self, app_id: str, service_id: str):
+        self.request(
+            "liveness_update",
+            "PATCH",
+            "%s/liveness/%s/%s" % (MP1_MGMT, app_id, service_id),
+            json={"state": "ACTIVE"},
+        )
+
+    def heartbeat_batch(self, app_id: str, service_ids: list):
+        self.request(
+            "liveness_update_batch",
+            "PATCH",
+            "%s/liveness/%s" % (MP1_MGMT, app_id),
+            json=[{"serviceId": service_id, "state": "ACTIVE"} for service_id in service_ids],
+        )
+
+    def discover(self, index: int):
+        app_id, _, name = self.services[index % len(self.services)]
+        kind = index % 3
+        if kind == 0:
+            self.request("get_services", "GET", "%s/services" % MP1_MGMT)
+        elif kind == 1:
+            self.request("get_services_by_name", "GET", "%s/services" % MP1_MGMT, params={"ser_name": name})
+        else:
+            self.request("get_app_services", "GET", "%s/applications/%s/services" % (MP1_MGMT, app_id))
+
+    def terminate(self, app_id: str):
+        self.request(
+            "terminate",
+            "POST",
+            "%s/app_instances/%s/terminate" % (MM5, app_id),
+            json={"appInstanceId": app_id, "terminationType": "GRACEFUL", "gracefulStopTimeout": 0},
+        )
+
+    def run(self):
+        args = self.args
+        self.run_phase("onboarding", [lambda app_id=app_id: self.onboard(app_id) for app_id in self.apps])
+        if args.batch:
+            registrations = [
+                lambda app_id=app_id: self.register_batch(
+                    app_id, ["%s-service-%d" % (app_id, index) for index in range(args.services)]
+                )
+                for app_id in self.apps
+            ]
+        else:
+            registrations = [
+                lambda app_id=app_id, index=index: self.register(app_id, "%s-service-%d" % (app_id, index))
+                for app_id in self.apps
+                for index in range(args.services)
+            ]
+        self.run_phase("registration", registrations)
+        self.run_phase(
+            "subscription",
+            [lambda index=index: self.subscribe(self.apps[index % len(self.apps)]) for index in range(args.subscribers)],
+        )
+        self.run_phase("fanout", [self.fanout])
+        if args.batch:
+            services = defaultdict(list)
+            for app_id, service_id, _ in self.services:
+                services[app_id].append(service_id)
+            heartbeats = [
+                lambda app_id=app_id, service_ids=service_ids: self.heartbeat_batch(app_id, service_ids)
+                for _ in range(args.heartbeats)
+                for app_id, service_ids in services.items()
+            ]
+        else:
+            heartbeats = [
+                lambda app_id=app_id, service_id=service_id: self.heartbeat(app_id, service_id)
+                for _ in range(args.heartbeats)
+                for app_id, service_id, _ in list(self.services)
+            ]
+        self.run_phase("liveness", heartbeats)
+        self.run_phase("discovery", [lambda index=index: self.discover(index) for index in range(args.queries)])
+        self.run_phase("termination", [lambda app_id=app_id: self.terminate(app_id) for app_id in self.apps])
+        delivered = sum(
+            1 for app_id in self.apps if self.sink.wait("termination-%s" % app_id, 1, args.callback_timeout)
+        )
+        self.extra["termination_notified"] = delivered
+
+    def results(self) -> list:
+        rows = []
+        for operation, durations in self.durations.items():
+            phase = operation.split(" ", 1)[0]
+            row = {"operation": operation}
+            row.update(summarize(durations, self.elapsed.get(phase)))
+            row["errors"] = self.errors[operation]
+            row["statuses"] = ",".join(
+                "%d:%d" % (status, count) for status, count in sorted(self.statuses[operation].items())
+            )
+            rows.append(row)
+        return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apps", type=int, default=10, help="MEC apps onboarded")
+    parser.add_argument("--services", type=int, default=3, help="services registered by each app")
+    parser.add_argument(
+        "--batch", action="store_true", help="register the services of an app and send their heartbeats in one request"
+    )
+    parser.add_argument("--subscribers", type=int, default=20, help="subscriptions notified in the fanout phase")
+    parser.add_argument("--heartbeats", type=int, default=5, help="liveness updates per service")
+    parser.add_argument("--queries", type=int, default=60, help="service discovery requests")
+    parser.add_argument("--concurrency", type=int, default=8, help="client threads")
+    parser.add_argument("--callback-timeout", type=float, default=30, help="seconds to wait for notifications")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--server-log", help="output of the servers (default: a temporary file)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="mep-bench-")
+    server_log = args.server_log or os.path.join(workdir, "servers.log")
+
+    store = Store()
+    authkey = os.urandom(16)
+    store_address = serve_store(store, authkey)
+    oauth, dns_api, kubernetes, sink = OAuthStub().start(), DnsApiStub().start(), KubernetesStub().start(), CallbackSink().start()
+    os.environ["KUBECONFIG"] = kubernetes.kubeconfig(workdir)
+
+    settings = {
+        "oauth": ("127.0.0.1", str(oauth.port)),
+        "dns_api": ("127.0.0.1", str(dns_api.port)),
+        "namespace": "mep-bench",
+        # Keep the slow request log out of the measurement
+        "slow_request_threshold": 60000,
+    }
+    servers = ServerProcesses(store_address, authkey, settings, server_log)
+    print("Starting Mp1 and Mm5 (server log: %s)" % server_log, flush=True)
+    servers.start()
+    try:
+        load_test = LoadTest(args, store, sink)
+        load_test.run()
+    finally:
+        servers.stop()
+        for stub in (oauth, dns_api, kubernetes, sink):
+            stub.stop()
+
+    rows = load_test.results()
+    print()
+    print(
+        table(
+            rows,
+            ["operation", "count", "ops_per_s", "p50_ms", "p90_ms", "p99_ms", "max_ms", "errors", "statuses"],
+        )
+    )
+    stubs = {
+        "oauth_requests": sum(oauth.requests.values()),
+        "dns_api_requests": sum(dns_api.requests.values()),
+        "kubernetes_requests": sum(kubernetes.requests.values()),
+        "callbacks_received": sum(len(arrivals) for arrivals in sink.arrivals.values()),
+    }
+    print()
+    for key, value in list(load_test.extra.items()) + list(stubs.items()):
+        print("%s: %s" % (key, value))
+
+    if args.json:
+        write_json(
+            args.json,
+            {
+                "parameters": vars(args),
+                "operations": rows,
+                "phases_s": {phase: round(elapsed, 3) for phase, elapsed in load_test.elapsed.items()},
+                "extra": load_test.extra,
+                "stubs": stubs,
+            },
+        )
+    return 1 if any(row["errors"] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
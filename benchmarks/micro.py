@@ -0,0 +1,457 @@
+# Copyright 2022 Centro ALGORITMI - University of Minho and Instituto de Telecomunicações - Aveiro
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""
+Microbenchmarks of the serialisation and query building hot paths of Mp1 and Mm5
+
+Every case runs for each payload size (--sizes, the meaning of the size is given next to each case) and
+for each package that has the code (mp1, mm5). The best time per call of the rounds (the least disturbed
+by the rest of the machine) is compared with the baseline file, a case slower than the baseline by more than
+the tolerance is a regression (exit status 1).
+
+Usage (from the repository root):
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/micro.py                            # compare with benchmarks/baseline.json
+    python benchmarks/micro.py --filter from_json --sizes 1,100
+    python benchmarks/micro.py --save-baseline            # store the results as the new baseline
+
+The baseline is only meaningful on the machine that produced it, save one before changing the code.
+"""
+
+import argparse
+import copy
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from load import app_config, service_info
+from report import percentile, table, write_json
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Source directory of each package, they can not be imported by the same process (both register the
+# same Prometheus metrics) so every package is benchmarked in its own process
+PACKAGES = {"mp1": "mep_app_com", "mm5": "mep_conf_mgmt"}
+
+CASES = {}
+
+
+def case(name: str, sized: bool = True, packages=tuple(PACKAGES)):
+    """
+    Registers a case, the decorated function receives the models module of the package and the payload size
+    and returns the function to be measured and a function giving the arguments of one call
+    (arguments are built before the time starts, calls that modify their input should use fresh)
+    """
+
+    def register(setup):
+        CASES[name] = (setup, sized, packages)
+        return setup
+
+    return register
+
+
+def fresh(payload):
+    return lambda: (copy.deepcopy(payload),)
+
+
+def same(*args):
+    return lambda: args
+
+
+################################################ PAYLOADS ################################################
+
+
+def service_payload(size: int, name: str = "svc") -> dict:
+    """
+    ServiceInfo whose transport has size endpoint URIs
+    """
+    payload = service_info(name)
+    payload["transportInfo"]["endpoint"] = {
+        "uris": ["http://10.20.%d.%d:8000/%s" % (i // 256, i % 256, name) for i in range(size)]
+    }
+    return payload
+
+
+def subscription_payload(size: int) -> dict:
+    return {
+        "callbackReference": "http://10.10.0.1:8000/callbacks/availability",
+        "filteringCriteria": {
+            "serNames": ["svc-%d" % i for i in range(size)],
+            "states": ["ACTIVE", "INACTIVE"],
+            "isLocal": True,
+        },
+    }
+
+
+def traffic_rule_payload(size: int) -> dict:
+    """
+    TrafficRule with size traffic filters
+    """
+    rule = app_config("app")["appTrafficRule"][0]
+    rule["trafficFilter"] = [
+        {
+            "srcAddress": ["10.10.%d.0/24" % (i % 256)],
+            "srcPort": [str(8000 + i)],
+            "dstAddress": ["10.20.%d.0/24" % (i % 256)],
+            "dstPort": [str(9000 + i)],
+            "protocol": ["TCP"],
+        }
+        for i in range(size)
+    ]
+    rule["state"] = "ACTIVE"
+    return rule
+
+
+def app_config_payload(size: int) -> dict:
+    """
+    ConfigPlatformForAppRequest with size traffic rules and size DNS rules
+    """
+    config = app_config("app")
+    traffic_rule, dns_rule = config["appTrafficRule"][0], config["appDNSRule"][0]
+    # Independent copies, from_json consumes the nested documents it is given
+    config["appTrafficRule"] = [dict(copy.deepcopy(traffic_rule), trafficRuleId="tr-%d" % i) for i in range(size)]
+    config["appDNSRule"] = [dict(dns_rule, dnsRuleId="dns-%d" % i) for i in range(size)]
+    return config
+
+
+def links_payload() -> dict:
+    return {
+        "self": {"href": "/mec_service_mgmt/v1/applications/app/subscriptions"},
+        "subscriptions": [
+            {
+                "href": "/mec_service_mgmt/v1/applications/app/subscriptions/%s" % uuid.uuid4(),
+                "subscriptionType": "SerAvailabilityNotificationSubscription",
+            }
+        ],
+    }
+
+
+################################################# CASES #################################################
+
+
+@case("NestedEncoder dumps")  # size: services in the list
+def nested_encoder(models, size):
+    services = [models.ServiceInfo.from_json(service_payload(1, "svc-%d" % i)) for i in range(size)]
+    return (lambda data: json.dumps(data, cls=models.NestedEncoder)), same(services)
+
+
+@case("json_out")  # size: services in the response
+def json_out(models, size):
+    services = [models.ServiceInfo.from_json(service_payload(1, "svc-%d" % i)) for i in range(size)]
+    return models.json_out(cls=models.NestedEncoder)(lambda: services), same()
+
+
+@case("object_to_mongodb_dict")  # size: endpoint URIs of the service
+def object_to_mongodb_dict(models, size):
+    service = models.ServiceInfo.from_json(service_payload(size))
+    return models.object_to_mongodb_dict, same(service, {"appInstanceId": "app"})
+
+
+@case("mongodb_query_replace")  # size: endpoint URIs of the service document used as query
+def mongodb_query_replace(models, size):
+    query = models.object_to_mongodb_dict(models.ServiceInfo.from_json(service_payload(size)))
+    return models.mongodb_query_replace, same(query)
+
+
+@case("ServiceGet.to_query")  # size: serInstanceIds in the query string
+def service_get_to_query(models, size):
+    query = models.ServiceGet(
+        ser_instance_id=",".join(str(uuid.uuid4()) for _ in range(size)),
+        ser_category_id=None,
+        scope_of_locality="MEC_HOST",
+    )
+    return models.ServiceGet.to_query, same(query)
+
+
+@case("ServiceInfo.to_filtering_criteria_json", sized=False)
+def to_filtering_criteria_json(models, size):
+    service = models.ServiceInfo.from_json(service_payload(1))
+    return models.ServiceInfo.to_filtering_criteria_json, same(service)
+
+
+@case("TrafficRule.toNetworkPolicy")  # size: traffic filters
+def to_network_policy(models, size):
+    rule = models.TrafficRule.from_json(traffic_rule_payload(size))
+    return models.TrafficRule.toNetworkPolicy, same(rule)
+
+
+@case("DeepDiff service update")  # size: endpoint URIs of the service
+def deepdiff_service_update(models, size):
+    # Same comparison as the service update of Mp1: stored document against the new one, only the state changed
+    from deepdiff import DeepDiff
+
+    stored = models.object_to_mongodb_dict(models.ServiceInfo.from_json(service_payload(size)))
+    updated = dict(stored, state="INACTIVE")
+    return (lambda old, new: DeepDiff(old, new, ignore_order=True)), same(stored, updated)
+
+
+@case("ServiceInfo.diff service update", packages=("mp1",))  # size: endpoint URIs of the service
+def service_info_diff(models, size):
+    # Replacement of the DeepDiff above
+    stored = models.object_to_mongodb_dict(models.ServiceInfo.from_json(service_payload(size)))
+    updated = models.ServiceInfo.from_json(service_payload(size))
+    updated.state = models.ServiceState.INACTIVE
+    return models.ServiceInfo.diff, same(updated, stored)
+
+
+def availability_notification(models):
+    # Same as the registration of a service: the liveness link is added before the notification is built
+    service = models.ServiceInfo.from_json(service_payload(1))
+    service._links = models.Links(liveness=models.LinkType("/mec_service_mgmt/v1/liveness/svc"))
+    service = json.loads(json.dumps(service, cls=models.NestedEncoder))
+    return models.ServiceAvailabilityNotification.from_json_service_list(data=[service], changeType="ADDED")
+
+
+@case("notification fan-out dumps", packages=("mp1",))  # size: subscribers
+def notification_fanout_dumps(models, size):
+    # Previous fan-out: the _links of the shared notification set and the whole notification encoded per subscriber
+    notification = availability_notification(models)
+    hrefs = ["/applications/app/subscriptions/%d" % i for i in range(size)]
+
+    def fanout(notification, hrefs):
+        for href in hrefs:
+            notification._links = models.Subscription(href=href)
+            json.dumps(notification, cls=models.NestedEncoder)
+
+    return fanout, same(notification, hrefs)
+
+
+@case("notification fan-out template", packages=("mp1",))  # size: subscribers
+def notification_fanout_template(models, size):
+    notification = availability_notification(models)
+    hrefs = ["/applications/app/subscriptions/%d" % i for i in range(size)]
+
+    def fanout(notification, hrefs):
+        template = notification.to_template()
+        for href in hrefs:
+            template.render(href)
+
+    return fanout, same(notification, hrefs)
+
+
+@case("from_json ServiceInfo")  # size: endpoint URIs
+def from_json_service_info(models, size):
+    return models.ServiceInfo.from_json, same(service_payload(size))
+
+
+@case("from_json SerAvailabilityNotificationSubscription")  # size: serNames of the filtering criteria
+def from_json_subscription(models, size):
+    return models.SerAvailabilityNotificationSubscription.from_json, same(subscription_payload(size))
+
+
+@case("from_json TrafficRule")  # size: traffic filters
+def from_json_traffic_rule(models, size):
+    return models.TrafficRule.from_json, same(traffic_rule_payload(size))
+
+
+@case("from_json ConfigPlatformForAppRequest", packages=("mm5",))  # size: traffic and DNS rules
+def from_json_app_config(models, size):
+    return models.ConfigPlatformForAppRequest.from_json, same(app_config_payload(size))
+
+
+@case("from_json DnsRule", sized=False)
+def from_json_dns_rule(models, size):
+    rule = dict(app_config("app")["appDNSRule"][0], state="ACTIVE")
+    return models.DnsRule.from_json, same(rule)
+
+
+@case("from_json AppReadyConfirmation", sized=False)
+def from_json_app_ready(models, size):
+    return models.AppReadyConfirmation.from_json, same({"indication": "READY"})
+
+
+@case("from_json AppTerminationConfirmation", sized=False)
+def from_json_app_termination(models, size):
+    return models.AppTerminationConfirmation.from_json, same({"operationAction": "TERMINATING"})
+
+
+@case("from_json AppTerminationNotificationSubscription", sized=False)
+def from_json_termination_subscription(models, size):
+    subscription = {
+        "subscriptionType": "AppTerminationNotificationSubscription",
+        "callbackReference": "http://10.10.0.1:8000/callbacks/termination",
+        "appInstanceId": "app",
+    }
+    return models.AppTerminationNotificationSubscription.from_json, same(subscription)
+
+
+@case("from_json ServiceLivenessUpdate", sized=False, packages=("mp1",))
+def from_json_liveness_update(models, size):
+    return models.ServiceLivenessUpdate.from_json, same({"state": "ACTIVE"})
+
+
+@case("from_json MecServiceMgmtApiSubscriptionLinkList", sized=False, packages=("mp1",))
+def from_json_subscription_link_list(models, size):
+    return models.MecServiceMgmtApiSubscriptionLinkList.from_json, same({"_links": links_payload()})
+
+
+@case("from_json ChangeAppInstanceState", sized=False, packages=("mm5",))
+def from_json_change_state(models, size):
+    change = {"appInstanceId": "app", "changeStateTo": "STOPPED", "stopType": "GRACEFUL", "gracefulStopTimeout": 10}
+    return models.ChangeAppInstanceState.from_json, same(change)
+
+
+@case("from_json TerminateAppInstance", sized=False, packages=("mm5",))
+def from_json_terminate(models, size):
+    terminate = {"appInstanceId": "app", "terminationType": "GRACEFUL", "gracefulStopTimeout": 10}
+    return models.TerminateAppInstance.from_json, same(terminate)
+
+
+############################################### MEASUREMENT ###############################################
+
+
+def measure(func, make_args, repeat: int, min_time: float) -> dict:
+    """
+    Like timeit: the number of calls per round grows until a round lasts min_time, the result is the
+    time per call of repeat rounds (garbage collection is disabled while a round runs)
+    """
+
+    def run(number: int) -> float:
+        calls = [make_args() for _ in range(number)]
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            for args in calls:
+                func(*args)
+            return time.perf_counter() - start
+        finally:
+            gc.enable()
+
+    number = 1
+    while True:
+        elapsed = run(number)
+        if elapsed >= min_time:
+            break
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9) * 1.2))
+    rounds = sorted([elapsed / number] + [run(number) / number for _ in range(repeat - 1)])
+    return {
+        "number": number,
+        "rounds": len(rounds),
+        "min_us": round(rounds[0] * 1e6, 3),
+        "median_us": round(percentile(rounds, 50) * 1e6, 3),
+        "max_us": round(rounds[-1] * 1e6, 3),
+    }
+
+
+def run_package(package: str, names: list, sizes: list, repeat: int, min_time: float) -> list:
+    """
+    Target of the process of one package
+    """
+    sys.path.insert(0, os.path.join(ROOT, PACKAGES[package]))
+    import importlib
+
+    models = importlib.import_module("%s.models" % package)
+
+    results = []
+    for name in names:
+        setup, sized, packages = CASES[name]
+        if package not in packages:
+            continue
+        for size in sizes if sized else [None]:
+            func, make_args = setup(models, size)
+            result = {"package": package, "case": name, "size": size if sized else "-"}
+            result.update(measure(func, make_args, repeat, min_time))
+            results.append(result)
+    return results
+
+
+def key(result: dict) -> str:
+    return "%s %s[%s]" % (result["package"], result["case"], result["size"])
+
+
+def compare(results: list, baseline: dict, tolerance: float) -> list:
+    """
+    Adds the ratio to the best time of the baseline and the verdict (regression, faster, ok or new) to every result
+    """
+    for result in results:
+        reference = baseline.get("results", {}).get(key(result))
+        if reference is None:
+            result["verdict"] = "new"
+            continue
+        result["baseline_us"] = reference["min_us"]
+        result["ratio"] = round(result["min_us"] / reference["min_us"], 3)
+        if result["ratio"] > 1 + tolerance:
+            result["verdict"] = "regression"
+        elif result["ratio"] < 1 - tolerance:
+            result["verdict"] = "faster"
+        else:
+            result["verdict"] = "ok"
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1,10,100", help="payload sizes, comma separated")
+    parser.add_argument("--packages", default=",".join(PACKAGES), help="packages to benchmark, comma separated")
+    parser.add_argument("--filter", default="", help="only the cases whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=7, help="rounds per case")
+    parser.add_argument("--min-time", type=float, default=0.05, help="minimum duration of a round in seconds")
+    parser.add_argument("--baseline", default=BASELINE, help="baseline file (default: %(default)s)")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown (0.2 is 20%%)")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results in the baseline file")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    names = [name for name in CASES if args.filter.lower() in name.lower()]
+    results = []
+    for package in args.packages.split(","):
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            results += executor.submit(run_package, package, names, sizes, args.repeat, args.min_time).result()
+
+    columns = ["package", "case", "size", "min_us", "median_us", "number"]
+    regressions = []
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            compare(results, json.load(baseline_file), args.tolerance)
+        columns += ["baseline_us", "ratio", "verdict"]
+        regressions = [result for result in results if result["verdict"] == "regression"]
+    print(table(results, columns))
+
+    if args.json:
+        write_json(args.json, {"results": results})
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as baseline_file:
+                baseline = json.load(baseline_file)
+        # Cases that did not run (--filter, --sizes) keep their previous baseline
+        baseline.setdefault("results", {}).update(
+            {key(result): {"median_us": result["median_us"], "min_us": result["min_us"]} for result in results}
+        )
+        baseline["machine"] = {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "processor": platform.processor() or platform.machine(),
+            "system": platform.platform(),
+        }
+        write_json(args.baseline, baseline)
+        print("\nbaseline written to %s" % args.baseline)
+    elif regressions:
+        print("\n%d regression(s) beyond %d%%:" % (len(regressions), args.tolerance * 100))
+        for result in regressions:
+            print("  %s  %.3fus -> %.3fus" % (key(result), result["baseline_us"], result["min_us"]))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
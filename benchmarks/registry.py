@@ -0,0 +1,141 @@
+# Copyright 2022 Centro ALGORITMI - University of Minho and Instituto de Telecomunicações - Aveiro
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""
+Memory and CPU per object of the Mp1 models when a whole service registry is held in memory (e.g. a cache)
+
+Builds --services ServiceInfo (each with its CategoryRef, TransportInfo, EndPointInfo, SecurityInfo, OAuth2Info
+and Links), as many SerAvailabilityNotificationSubscription and --services / 10 TrafficRule, then reports for
+each kind the bytes per object (tracemalloc), the time to build one and the time to serialise one (NestedEncoder).
+
+Usage (from the repository root):
+    python benchmarks/registry.py --services 100000 --json registry.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "mep_app_com"))
+
+from mp1 import models  # noqa: E402
+from mp1.enums import GrantTypes, SerializerType, ServiceState, TransportType  # noqa: E402
+
+from report import table, write_json  # noqa: E402
+
+
+def service(i: int) -> models.ServiceInfo:
+    serInstanceId = str(uuid.UUID(int=i))
+    return models.ServiceInfo(
+        serName="svc-%d" % i,
+        version="1.0",
+        state=ServiceState.ACTIVE,
+        serializer=SerializerType.JSON,
+        serInstanceId=serInstanceId,
+        serCategory=models.CategoryRef(href="/example/catalogue1", id="cat-%d" % (i % 16), name="RNI", version="1.0"),
+        transportInfo=models.TransportInfo(
+            id="transport-1",
+            name="REST",
+            type=TransportType.REST_HTTP,
+            version="2.0",
+            endpoint=models.EndPointInfo.Uris(["http://10.%d.%d.%d:8000/svc" % (i >> 16 & 255, i >> 8 & 255, i & 255)]),
+            security=models.SecurityInfo(
+                models.OAuth2Info([GrantTypes.OAUTH2_CLIENT_CREDENTIALS], "/mec_app_support/v1/credentials/")
+            ),
+        ),
+        livenessInterval=60,
+        _links=models.Links(liveness=models.LinkType("/mec_service_mgmt/v1/liveness/app/%s" % serInstanceId)),
+    )
+
+
+def subscription(i: int) -> models.SerAvailabilityNotificationSubscription:
+    return models.SerAvailabilityNotificationSubscription(
+        callbackReference="http://10.10.0.1:8000/callbacks/%d" % i,
+        filteringCriteria=models.FilteringCriteria(
+            states=[ServiceState.ACTIVE], isLocal=True, serNames=["svc-%d" % i]
+        ),
+    )
+
+
+def traffic_rule(i: int) -> models.TrafficRule:
+    return models.TrafficRule(
+        trafficRuleId="tr-%d" % i,
+        filterType="FLOW",
+        priority=1,
+        trafficFilter=[
+            models.TrafficFilter(
+                srcAddress=["10.10.0.0/24"], dstAddress=["10.20.0.0/24"], srcPort=["8080"], dstPort=["80"],
+                protocol=["TCP"],
+            )
+        ],
+        action="FORWARD_DECAPSULATED",
+        dstInterface=[models.DestinationInterface(interfaceType="IP", dstIpAddress="10.20.0.1")],
+        state="ACTIVE",
+    )
+
+
+def measure(name: str, build, count: int) -> dict:
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    objects = [build(i) for i in range(count)]
+    build_time = time.perf_counter() - start
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Time measured without tracemalloc, which slows allocations down
+    del objects
+    gc.collect()
+    start = time.perf_counter()
+    objects = [build(i) for i in range(count)]
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for obj in objects:
+        json.dumps(obj, cls=models.NestedEncoder)
+    encode_time = time.perf_counter() - start
+    return {
+        "model": name,
+        "count": count,
+        "bytes_per_object": round(memory / count),
+        "total_mb": round(memory / 2**20, 1),
+        "build_us": round(build_time / count * 1e6, 3),
+        "to_json_us": round(encode_time / count * 1e6, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--services", type=int, default=100000, help="services in the registry")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    results = [
+        measure("ServiceInfo", service, args.services),
+        measure("SerAvailabilityNotificationSubscription", subscription, args.services),
+        measure("TrafficRule", traffic_rule, max(args.services // 10, 1)),
+    ]
+    print(table(results, ["model", "count", "bytes_per_object", "total_mb", "build_us", "to_json_us"]))
+    if args.json:
+        write_json(args.json, {"results": results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# Copyright 2022 Centro ALGORITMI - University of Minho and Instituto de Telecomunicações - Aveiro
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""
+Latency percentiles and result tables shared by the benchmarks
+"""
+
+import json
+import math
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(values: list, q: float) -> float:
+    """
+    Linear interpolation between the closest ranks
+
+    :param values: sorted values
+    :param q: percentile (0-100)
+    """
+    if not values:
+        return float("nan")
+    rank = (len(values) - 1) * q / 100
+    lower, upper = math.floor(rank), math.ceil(rank)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+def summarize(durations: list, elapsed: float = None) -> dict:
+    """
+    :param durations: seconds of every operation
+    :param elapsed: wall time of the whole run in seconds (for the throughput)
+    :return: count, ops/s and the latency percentiles in milliseconds
+    """
+    values = sorted(durations)
+    summary = {"count": len(values)}
+    if elapsed:
+        summary["ops_per_s"] = round(len(values) / elapsed, 1)
+    summary["mean_ms"] = round(sum(values) / len(values) * 1000, 3) if values else float("nan")
+    for q in PERCENTILES:
+        summary["p%d_ms" % q] = round(percentile(values, q) * 1000, 3)
+    summary["max_ms"] = round(values[-1] * 1000, 3) if values else float("nan")
+    return summary
+
+
+def table(rows: list, columns: list) -> str:
+    """
+    Plain text table
+
+    :param rows: list of dicts
+    :param columns: keys to show, in order
+    """
+    cells = [[str(row.get(column, "")) for column in columns] for row in rows]
+    widths = [max([len(column)] + [len(cell[i]) for cell in cells]) for i, column in enumerate(columns)]
+    lines = ["  ".join(column.ljust(widths[i]) for i, column in enumerate(columns))]
+    lines.append("  ".join("-" * width for width in widths))
+    for cell in cells:
+        lines.append("  ".join(value.ljust(widths[i]) for i, value in enumerate(cell)))
+    return "\n".join(lines)
+
+
+def write_json(path: str, data: dict):
+    with open(path, "w") as output:
+        json.dump(data, output, indent=2, sort_keys=True)
+        output.write("\n")
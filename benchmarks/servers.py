@@ -0,0 +1,122 @@
+# Copyright 2022 Centro ALGORITMI - University of Minho and Instituto de Telecomunicações - Aveiro
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""
+Runs the unmodified Mp1 and Mm5 main() against the stand-ins
+
+Both servers use the global CherryPy engine, tree and Prometheus registry, so each one runs in its
+own (spawned) process, exactly as deployed; they share the database through the Store of standins.py.
+Mp1 listens on 8080 and Mm5 on 8085 (the ports set by their main()).
+"""
+
+import multiprocessing
+import os
+import sys
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+    # name: (source directory, package, port, URL answered once the server is up)
+    "mp1": ("mep_app_com", "mp1", 8080, "/mec_service_mgmt/v1/transports"),
+    "mm5": ("mep_conf_mgmt", "mm5", 8085, "/mec_platform_mgmt/v1/app_lcm_op_occs"),
+}
+
+
+def run_server(name: str, store_address, authkey: bytes, settings: dict, log_path: str):
+    """
+    Target of the server process
+
+    :param settings: oauth, dns_api (host, port) and namespace
+    """
+    directory, package, _, _ = SERVERS[name]
+    log_file = open(log_path, "a", buffering=1)
+    sys.stdout = sys.stderr = log_file
+    os.dup2(log_file.fileno(), 1)
+    os.dup2(log_file.fileno(), 2)
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, os.path.join(ROOT, directory))
+    os.chdir(os.path.join(ROOT, directory))
+
+    import importlib
+
+    import cherrypy
+
+    from standins import standin_database
+
+    main = importlib.import_module("main")
+    models = importlib.import_module("%s.models" % package)
+    dbmongo = importlib.import_module("%s.databases.dbmongo" % package)
+
+    cherrypy.config.update(
+        {
+            # Error and access log of the server go to log_path
+            "log.screen": True,
+            "oauth_server": models.OAuthServer(*settings["oauth"]),
+            "dns_api_server": models.DnsApiServer(*settings["dns_api"]),
+            "mepconfig": ("127.0.0.1", SERVERS["mm5"][2]),
+            "namespace": settings["namespace"],
+            "slow_request_threshold": settings.get("slow_request_threshold", 500),
+        }
+    )
+    main.main(standin_database(dbmongo.MongoDb, store_address, authkey))
+    cherrypy.engine.block()
+
+
+class ServerProcesses:
+    def __init__(self, store_address, authkey: bytes, settings: dict, log_path: str):
+        self.context = multiprocessing.get_context("spawn")
+        self.processes = {
+            name: self.context.Process(
+                target=run_server,
+                args=(name, store_address, authkey, settings, log_path),
+                name=name,
+                daemon=True,
+            )
+            for name in SERVERS
+        }
+
+    @staticmethod
+    def url(name: str) -> str:
+        return "http://127.0.0.1:%d" % SERVERS[name][2]
+
+    def start(self, timeout: float = 60):
+        for process in self.processes.values():
+            process.start()
+        deadline = time.monotonic() + timeout
+        for name, (_, _, _, ready_path) in SERVERS.items():
+            while True:
+                if not self.processes[name].is_alive():
+                    raise RuntimeError("%s exited while starting, see the server log" % name)
+                try:
+                    if requests.get(self.url(name) + ready_path, timeout=1).status_code < 500:
+                        break
+                except requests.exceptions.ConnectionError:
+                    pass
+                if time.monotonic() > deadline:
+                    raise RuntimeError("%s did not start in %ss" % (name, timeout))
+                time.sleep(0.2)
+        return self
+
+    def stop(self):
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes.values():
+            process.join(timeout=10)
+            if process.is_alive():
+                process.kill()
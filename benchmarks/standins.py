@@ -0,0 +1,362 @@
+# Copyright 2022 Centro ALGORITMI - University of Minho and Instituto de Telecomunicações - Aveiro
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""
+Local stand-ins for everything the MEP talks to
+
+    Store            MongoDB stand-in (mongomock) shared by the Mp1 and Mm5 processes, like the real
+                     deployment where both servers use the same database
+    OAuthStub        /register, /token, /validate_token and /delete of the auth server
+    DnsApiStub       record creation and removal of the DNS API
+    KubernetesStub   Kubernetes API answering NetworkPolicy/Secret creation, patching, deletion and listing
+    CallbackSink     receives the notifications sent to the MEC apps and records when they arrived
+
+Every stub is a ThreadingHTTPServer on an ephemeral port of 127.0.0.1 and counts the requests it handled.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing.managers import BaseManager
+from urllib.parse import parse_qs, urlparse
+
+import mongomock
+
+############################################# DATABASE #############################################
+
+
+class Store:
+    """
+    One mongomock database used by every connection, commands are executed one at a time
+    """
+
+    def __init__(self, database: str = "mep"):
+        self.db = mongomock.MongoClient()[database]
+        self.lock = threading.Lock()
+
+    def call(self, collection: str, method: str, args: tuple, kwargs: dict):
+        with self.lock:
+            result = getattr(self.db[collection], method)(*args, **kwargs)
+            # Cursors can not leave the process, the MEP only iterates them
+            if isinstance(result, mongomock.collection.Cursor):
+                result = list(result)
+            return result
+
+
+class StoreManager(BaseManager):
+    pass
+
+
+StoreManager.register("store")
+
+
+def serve_store(store: Store, authkey: bytes):
+    """
+    Serves the store to other processes from a thread of this one
+
+    :return: address of the store
+    """
+    StoreManager.register("store", callable=lambda: store)
+    manager = StoreManager(address=("127.0.0.1", 0), authkey=authkey)
+    server = manager.get_server()
+    threading.Thread(target=server.serve_forever, name="store", daemon=True).start()
+    return server.address
+
+
+class RemoteCollection:
+    def __init__(self, store, name: str):
+        self.store = store
+        self.name = name
+
+    def __getattr__(self, method: str):
+        def call(*args, **kwargs):
+            return self.store.call(self.name, method, args, kwargs)
+
+        return call
+
+
+class RemoteDatabase:
+    """
+    Behaves like the pymongo Database used by MongoDb (client[collection].method(...))
+    """
+
+    def __init__(self, address, authkey: bytes):
+        manager = StoreManager(address=address, authkey=authkey)
+        manager.connect()
+        self.store = manager.store()
+
+    def __getitem__(self, name: str) -> RemoteCollection:
+        return RemoteCollection(self.store, name)
+
+    def close(self):
+        pass
+
+
+def standin_database(database_class, address, authkey: bytes):
+    """
+    Instance of the MongoDb class of mp1 or mm5 connected to the shared store instead of MongoDB
+
+    :param database_class: mp1.databases.dbmongo.MongoDb or mm5.databases.dbmongo.MongoDb
+    """
+
+    class StandInDatabase(database_class):
+        def connect(self, thread_index):
+            import cherrypy
+
+            self.client = RemoteDatabase(address, authkey)
+            cherrypy.thread_data.db = self
+
+    return StandInDatabase("127.0.0.1", 0, None, None, "mep")
+
+
+############################################## STUBS ##############################################
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients closing their keep-alive connections are not errors
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Status line, headers and body leave in one segment (no Nagle/delayed ACK stalls)
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def reply(self, status: int, data=None):
+        payload = json.dumps(data).encode() if data is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def dispatch(self):
+        stub = self.server.stub
+        stub.requests[self.command] += 1
+        status, data = stub.handle(self.command, urlparse(self.path), self.body())
+        self.reply(status, data)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = dispatch
+
+
+class Stub:
+    name = "stub"
+
+    def __init__(self):
+        self.requests = Counter()
+        self.httpd = StubServer(("127.0.0.1", 0), StubHandler)
+        self.httpd.stub = self
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name=self.name, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.httpd.server_address[1]
+
+    @property
+    def url(self) -> str:
+        return "http://127.0.0.1:%d" % self.port
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def handle(self, method: str, url, body: bytes):
+        raise NotImplementedError
+
+
+class OAuthStub(Stub):
+    """
+    Issues one token per registered client and only accepts the tokens it issued
+    """
+
+    name = "oauth"
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.clients = {}
+        self.tokens = set()
+
+    def handle(self, method, url, body):
+        if url.path == "/register":
+            client_id, client_secret = str(uuid.uuid4()), uuid.uuid4().hex
+            with self.lock:
+                self.clients[client_id] = client_secret
+            return 200, dict(
+                message="Client registered successfully", client_id=client_id, client_secret=client_secret
+            )
+        if url.path == "/token":
+            credentials = json.loads(body)
+            if self.clients.get(credentials.get("client_id")) != credentials.get("client_secret"):
+                return 401, dict(error="invalid_client")
+            token = uuid.uuid4().hex
+            with self.lock:
+                self.tokens.add(token)
+            return 200, dict(access_token=token, token_type="Bearer", expires_in=3600)
+        if url.path == "/validate_token":
+            token = parse_qs(url.query).get("access_token", [None])[0]
+            if token is None and body:
+                token = json.loads(body).get("access_token")
+            return (200, dict(valid=True)) if token in self.tokens else (401, dict(valid=False))
+        if url.path == "/delete":
+            credentials = json.loads(body)
+            with self.lock:
+                self.clients.pop(credentials.get("client_id"), None)
+            return 200, dict(message="Client deleted")
+        return 404, dict(error="not found")
+
+
+class DnsApiStub(Stub):
+    name = "dns_api"
+
+    def __init__(self):
+        super().__init__()
+        self.records = {}
+
+    def handle(self, method, url, body):
+        query = parse_qs(url.query)
+        name = query.get("name", [None])[0]
+        if method == "POST":
+            self.records[name] = query.get("ip", [None])[0]
+            return 200, dict(message="Record created")
+        if method == "DELETE":
+            self.records.pop(name, None)
+            return 200, dict(message="Record removed")
+        return 200, dict(records=self.records)
+
+
+class KubernetesStub(Stub):
+    """
+    Accepts any object creation (echoing it back like the API server) and deletion
+    Names are unique (409 Conflict), patches only succeed on the objects created before (404 otherwise)
+    and the objects created are listed back (pods excepted)
+    """
+
+    name = "kubernetes"
+
+    def __init__(self):
+        super().__init__()
+        self.objects = Counter()
+        self.names = {}
+
+    def handle(self, method, url, body):
+        kind = url.path.rstrip("/").split("/")[-1] if method == "POST" else url.path.rstrip("/").split("/")[-2]
+        if method == "POST":
+            created = json.loads(body) if body else {}
+            if (kind, created.get("metadata", {}).get("name")) in self.names:
+                return 409, dict(kind="Status", apiVersion="v1", metadata={}, status="Failure", reason="AlreadyExists", code=409)
+            self.objects[kind] += 1
+            created.setdefault("metadata", {})["uid"] = str(uuid.uuid4())
+            self.names[(kind, created["metadata"].get("name"))] = created
+            return 201, created
+        name = url.path.rstrip("/").split("/")[-1]
+        if method == "PATCH":
+            if (kind, name) not in self.names:
+                return 404, dict(kind="Status", apiVersion="v1", metadata={}, status="Failure", reason="NotFound", code=404)
+            patched = self.names[(kind, name)]
+            patched.update(json.loads(body) if body else {})
+            return 200, patched
+        if method == "DELETE":
+            self.objects[kind] -= 1
+            self.names.pop((kind, name), None)
+            return 200, dict(kind="Status", apiVersion="v1", metadata={}, status="Success")
+        if url.path.endswith("/pods"):
+            return 200, dict(kind="PodList", apiVersion="v1", metadata={}, items=[])
+        collection = url.path.rstrip("/").split("/")[-1]
+        items = [created for (kind, _), created in self.names.items() if kind == collection]
+        # Equality based label selectors only (e.g labelSelector=key=value,other=value)
+        for requirement in filter(None, parse_qs(url.query).get("labelSelector", [""])[0].split(",")):
+            key, value = requirement.split("=", 1)
+            items = [item for item in items if item["metadata"].get("labels", {}).get(key) == value]
+        return 200, dict(kind="List", apiVersion="v1", metadata={}, items=items)
+
+    def kubeconfig(self, directory: str) -> str:
+        """
+        Writes a kubeconfig pointing to this stub (JSON is valid YAML)
+
+        :return: path of the kubeconfig, to be given in KUBECONFIG to the servers
+        """
+        path = os.path.join(directory, "kubeconfig")
+        with open(path, "w") as kubeconfig:
+            json.dump(
+                {
+                    "apiVersion": "v1",
+                    "kind": "Config",
+                    "clusters": [{"name": "bench", "cluster": {"server": self.url}}],
+                    "users": [{"name": "bench", "user": {"token": "bench"}}],
+                    "contexts": [{"name": "bench", "context": {"cluster": "bench", "user": "bench"}}],
+                    "current-context": "bench",
+                },
+                kubeconfig,
+            )
+        return path
+
+
+class CallbackSink(Stub):
+    """
+    Callback reference of every benchmark subscription (<url>/<key>)
+    The arrival time of the notifications is kept per key
+    """
+
+    name = "callbacks"
+
+    def __init__(self):
+        super().__init__()
+        self.condition = threading.Condition()
+        self.arrivals = defaultdict(list)
+
+    def handle(self, method, url, body):
+        with self.condition:
+            self.arrivals[url.path.strip("/")].append(time.perf_counter())
+            self.condition.notify_all()
+        return 204, None
+
+    def callback(self, key: str) -> str:
+        return "%s/%s" % (self.url, key)
+
+    def wait(self, key: str, count: int, timeout: float) -> list:
+        """
+        Waits until count notifications arrived for key
+
+        :return: arrival times (fewer than count on timeout)
+        """
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while len(self.arrivals[key]) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            return list(self.arrivals[key])
@@ -46,7 +46,11 @@ from mp1.databases.dbmongo import MongoDb
 from typing import Type
 import cherrypy
 from mp1.utils import check_port
+from mp1.server_config import load_server_config, log_server_profile
+from mp1.supervisor import Supervisor, worker_count
+from mp1 import metrics, outbox, profiler, reconciler, request_timing, scheduler, tracing
 from mp1.models import *
+from mp1.static_responses import static_responses
 import json
 import os
 
@@ -235,6 +239,23 @@ def main(database: Type[DatabaseBase]):
         conditions=dict(method=["POST"]),
     )
 
+    mgmt_dispatcher.connect(
+        name="Create applicationInstanceId Subscriptions in batch",
+        action="applications_subscriptions_batch_post",
+        controller=ApplicationServicesSubscriptionsController,
+        route="/applications/:appInstanceId/subscriptions/batch",
+        conditions=dict(method=["POST"]),
+    )
+
+    # Before the route with :subscriptionId, which would take "batch" as a subscriptionId
+    mgmt_dispatcher.connect(
+        name="Delete applicationInstanceId Subscriptions in batch",
+        action="applications_subscriptions_batch_delete",
+        controller=ApplicationServicesSubscriptionsController,
+        route="/applications/:appInstanceId/subscriptions/batch",
+        conditions=dict(method=["DELETE"]),
+    )
+
     mgmt_dispatcher.connect(
         name="Delete applicationInstanceID Subscriptions with subscriptionId",
         action="applications_subscriptions_delete",
@@ -263,6 +284,14 @@ def main(database: Type[DatabaseBase]):
         conditions=dict(method=["POST"]),
     )
 
+    mgmt_dispatcher.connect(
+        name="Create services for InstanceId in batch",
+        action="applications_services_batch_post",
+        controller=ApplicationServicesController,
+        route="/applications/:appInstanceId/services/batch",
+        conditions=dict(method=["POST"]),
+    )
+
     mgmt_dispatcher.connect(
         name="Get service from InstanceId and ServiceId",
         action="applicaton_services_get_with_service_id",
@@ -337,10 +366,21 @@ def main(database: Type[DatabaseBase]):
         conditions=dict(method=["PATCH"]),
     )
 
+    mgmt_dispatcher.connect(
+        name="Update MEC Services Liveness in batch",
+        action="mecServiceLiveness_batch_update",
+        controller=InvidualMecServiceLivenessController,
+        route="/liveness/:appInstanceId",
+        conditions=dict(method=["PATCH"]),
+    )
+
 
     cherrypy.config.update(
         {"server.socket_host": "0.0.0.0", "server.socket_port": 8080}
     )
+    # Thread pool, socket queues, timeouts and keep-alive (see server_config.py)
+    cherrypy.config.update(load_server_config())
+    log_server_profile()
 
     supp_conf = {"/": {"request.dispatch": support_dispatcher}}
     cherrypy.tree.mount(None, "/mec_app_support/v1", config=supp_conf)
@@ -349,6 +389,21 @@ def main(database: Type[DatabaseBase]):
 
 
 
+    # Request, database and outbound call metrics served at /metrics
+    metrics.mount()
+    # Server-Timing header and slow request log
+    request_timing.mount()
+    # Spans exported with MEP_TRACING_EXPORTER (disabled by default)
+    tracing.mount("mp1")
+    # Sampling profiler at /debug/profile (only with MEP_PROFILER_TOKEN)
+    profiler.mount()
+    # Delayed callbacks and Kubernetes/DNS configuration (MEP_SCHEDULER_WORKERS threads)
+    scheduler.mount()
+    # Notifications to the MEC apps delivered with retries from the notificationOutbox collection
+    outbox.mount()
+    # NetworkPolicies and DNS records kept in line with the traffic and DNS rules
+    reconciler.mount()
+
     # Config 404 and 403 landing pages
     cherrypy.config.update({'error_page.404': error_page_404})
     cherrypy.config.update({'error_page.403': error_page_403})
@@ -360,6 +415,12 @@ def main(database: Type[DatabaseBase]):
     ######################################
     if isinstance (database, DatabaseBase):
         cherrypy.engine.subscribe('start_thread', database.connect)
+        # Rebuild the pre-serialised responses when the configuration is reloaded (SIGHUP)
+        cherrypy.engine.subscribe('graceful', static_responses.reload)
+        if hasattr(cherrypy.engine, "signal_handler"):
+            # The default SIGHUP handler exits (or re-executes a daemonized process) instead of reloading
+            cherrypy.engine.signal_handler.handlers["SIGHUP"] = cherrypy.engine.graceful
+            cherrypy.engine.signal_handler.subscribe()
         cherrypy.engine.start()
     else:
         cherrypy.log("Invalid database provided to MEP. Shutting down.")
@@ -409,7 +470,18 @@ if __name__ == "__main__":
     mepconfig_port = os.environ.get("MEPCONFIG_PORT")
     cherrypy.config.update({"mepconfig": (mepconfig_url, mepconfig_port)})
 
+    slow_request_threshold = int(os.environ.get("MEP_SLOW_REQUEST_MS", 500))
+    cherrypy.config.update({"slow_request_threshold": slow_request_threshold})
+
+    static_responses_file = os.environ.get("MEP_STATIC_RESPONSES_FILE")
+    cherrypy.config.update({"static_responses_file": static_responses_file})
+
     with open("/var/run/secrets/kubernetes.io/serviceaccount/namespace") as namespace_file:
         cherrypy.config.update({"namespace":namespace_file.read()}) 
     
-    main(database)
+    # Several server processes sharing the port (SO_REUSEPORT) when MEP_WORKERS > 1
+    workers = worker_count()
+    if workers > 1:
+        Supervisor(workers, main, database).run()
+    else:
+        main(database)
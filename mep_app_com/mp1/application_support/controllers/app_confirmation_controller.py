@@ -13,6 +13,7 @@
 #     limitations under the License.
 
 import json
+import os
 import sys
 import jsonschema
 import cherrypy
@@ -30,10 +31,14 @@ from functools import wraps
 ATTEMPT_LIM = 1  # maximum no. of attempts in TIME_RESET seconds 
 TIME_RESET = 5  # in seconds
 RATE_LIM = ATTEMPT_LIM/TIME_RESET
+# Each worker process (see supervisor.py) has its own limiter, the period is scaled
+# so that all the workers together keep ATTEMPT_LIM attempts every TIME_RESET seconds
+WORKERS = max(int(os.environ.get("MEP_WORKERS", 1)), 1)
 
 class ApplicationConfirmationController:
     
     lock = Lock()
+    # Attempts per appInstanceId, counted by the worker process that received them
     attemps_dict = dict()
 
     @classmethod
@@ -133,7 +138,7 @@ class ApplicationConfirmationController:
     @cherrypy.tools.json_in()
     @json_out(cls=NestedEncoder)
     @exception_handler
-    @limits(calls=ATTEMPT_LIM, period=TIME_RESET)
+    @limits(calls=ATTEMPT_LIM, period=TIME_RESET * WORKERS)
     @validate_token
     def application_confirm_ready(self, appInstanceId: str, **kwargs):
         """
@@ -277,38 +282,15 @@ class ApplicationConfirmationController:
         oauth.delete_client(appStatus['oauth']['client_id'], appStatus['oauth']['client_secret'])
 
         query = {"appInstanceId": appInstanceId}
-        
-        result = cherrypy.thread_data.db.query_col(
-            "trafficRules", 
-            query=query,
-            fields=dict(appInstanceId=0)
-        )
 
-        for rule in result:
-
-            CallbackController.execute_callback(
-                args=[appInstanceId, rule],
-                func=CallbackController._removeTrafficRule,
-                sleep_time=0
-            )
-            
-            cherrypy.thread_data.db.remove(col= "trafficRules",
-            query=dict(trafficRuleId=rule['trafficRuleId']))
-            
+        # The reconciler removes the NetworkPolicies and DNS records of the rules
+        cherrypy.thread_data.db.remove_many("trafficRules", query)
 
         query = dict(appInstanceId=appInstanceId, state="ACTIVE")
 
-        result = cherrypy.thread_data.db.query_col("dnsRules", query)
+        cherrypy.thread_data.db.remove_many("dnsRules", query)
 
-        for rule in result:
-            CallbackController.execute_callback(
-                args=[appInstanceId, rule],
-                func=CallbackController._removeDnsRule,
-                sleep_time=0
-            )
-            
-            cherrypy.thread_data.db.remove(col= "dnsRules",
-            query=dict(dnsRuleId=rule['dnsRuleId']))           
+        CallbackController.reconcile_rules(appInstanceId, sleep_time=0)
 
 
         appInstanceDict = dict(appInstanceId=appInstanceId)
@@ -363,8 +345,8 @@ class ApplicationConfirmationController:
 
         
 
-        # remove appInstanceId from class dictionary
-        ApplicationConfirmationController.delete_app_attempts(appInstanceId)
+        # remove appInstanceId from class dictionary (attempts may have been counted by another worker)
+        ApplicationConfirmationController.delete_if_exists(appInstanceId)
 
         cherrypy.response.status = 204
         return None
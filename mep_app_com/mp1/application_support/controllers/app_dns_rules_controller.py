@@ -20,6 +20,7 @@ import requests
 
 sys.path.append("../../")
 from mp1.models import *
+from mp1.application_support.controllers.app_callback_controller import CallbackController
 from deepdiff import DeepDiff
 from hashlib import md5
 
@@ -253,30 +254,8 @@ class AppDnsRulesController:
             new_state = new_rec["state"]
 
             if prev_state != new_state:
-                # If there is a change in the state of the DNS rule, check if it is valid
-
-                #dict_dns = cherrypy.config.get("dns")
-                dnsApiServer = cherrypy.config.get("dns_api_server")
-
-                # If the DNS rule state changed from INACTIVE to ACTIVE
-                if new_state == "ACTIVE":
-                    domain = prev_dns_rule["domainName"]
-                    ip = prev_dns_rule["ipAddress"]
-                    ttl = prev_dns_rule["ttl"]
-
-                    # Create DNS rule in the DNS server (via API)
-                    dnsApiServer.create_record(domain, ip, ttl)
-                    cherrypy.log("Activated DNS rule %s, associated with app %s, in DNS server: %s" % (dnsRuleId, appInstanceId, domain))
-
-                # If the DNS rule state changed from ACTIVE to INACTIVE
-                elif new_state == "INACTIVE":
-                    print("Deactivating DNS rule...")
-                    
-                    domain = prev_dns_rule["domainName"]
-
-                    # Delete DNS rule in the DNS server (via API)
-                    dnsApiServer.delete_record(domain)
-                    cherrypy.log("Deactivated DNS rule %s, associated with app %s, in DNS server: %s" % (dnsRuleId, appInstanceId, domain))
+                # The DNS record is created (ACTIVE) or deleted (INACTIVE) by the reconciler once the rule is saved
+                cherrypy.log("DNS rule %s, associated with app %s, changed to %s: %s" % (dnsRuleId, appInstanceId, new_state, prev_dns_rule["domainName"]))
 
             # Check if conditional requests (ETag and Last-Modified) are satisfied
             # avoiding write conflicts
@@ -317,6 +296,7 @@ class AppDnsRulesController:
                                             query=dns_rule_query,
                                             newdata=new_rec|{"lastModified": new_date})
             cherrypy.response.headers['Last-Modified'] = new_date
+            CallbackController.reconcile_rules(appInstanceId, sleep_time=0)
 
             """
             diff = DeepDiff(new_rec, dns_rule_dict, ignore_order=True)
@@ -19,6 +19,7 @@ import cherrypy
 
 sys.path.append("../../")
 from mp1.models import *
+from mp1.static_responses import static_responses
 import uuid
 import jsonschema
 
@@ -37,8 +38,7 @@ class AppTimingController:
             error = BadRequest(error_msg)
             return error.message()
 
-        timmingCaps = TimingCaps()
-        return timmingCaps
+        return static_responses.get("timing_caps").send()
 
     # For now just for test
     @json_out(cls=NestedEncoder)
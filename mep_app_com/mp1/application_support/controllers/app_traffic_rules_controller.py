@@ -24,6 +24,7 @@ from deepdiff import DeepDiff
 
 sys.path.append("../../")
 from mp1.models import *
+from mp1.application_support.controllers.app_callback_controller import CallbackController
 from kubernetes import client, config
 
 class AppTrafficRulesController:
@@ -176,6 +177,8 @@ class AppTrafficRulesController:
                 query=query,
                 newdata=object_to_mongodb_dict(trafficRule)
             )
+            # The reconciler patches the NetworkPolicy with the new filters
+            CallbackController.reconcile_rules(appInstanceId, sleep_time=0)
         
         
         cherrypy.response.status = 200
@@ -0,0 +1,171 @@
+# Copyright 2022 Centro ALGORITMI - University of Minho and Instituto de Telecomunicações - Aveiro
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""
+Health of the callback destinations (host:port of the callbackReference of the MEC apps)
+
+Each destination has a circuit breaker:
+    CLOSED      deliveries go through, the latency (EWMA) and the outcome of the last WINDOW ones are kept
+    OPEN        at least FAILURE_RATIO of the window failed, deliveries are short-circuited for a cooldown
+                that doubles every time the destination opens again (up to MAX_OPEN_SECONDS)
+    HALF_OPEN   once the cooldown is over a single delivery probes the destination, it closes the breaker
+                when it succeeds and opens it again when it fails
+The timeout of a delivery follows the latency of its destination (TIMEOUT_FACTOR times the EWMA, between
+MIN_TIMEOUT and the timeout of the outbox) and at most MAX_CONCURRENT deliveries wait on the same
+destination, so a slow or hanging MEC app can't hold every worker of the scheduler.
+"""
+
+import threading
+import time
+from urllib.parse import urlparse
+
+from . import metrics
+
+CLOSED = "CLOSED"
+HALF_OPEN = "HALF_OPEN"
+OPEN = "OPEN"
+
+# Value of the mep_callback_circuit_state gauge
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+WINDOW = 20
+MIN_DELIVERIES = 5
+FAILURE_RATIO = 0.5
+EWMA_WEIGHT = 0.2
+TIMEOUT_FACTOR = 4
+# Seconds
+MIN_TIMEOUT = 1
+OPEN_SECONDS = 10
+MAX_OPEN_SECONDS = 300
+MAX_CONCURRENT = 4
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of one destination, shared by the threads delivering to it
+    """
+
+    def __init__(self, destination: str, max_timeout: float):
+        """
+        :param destination: host:port of the callback references
+        :type destination: String
+        :param max_timeout: Timeout used while the latency of the destination is unknown and upper bound
+        :type max_timeout: float
+        """
+        self.destination = destination
+        self.max_timeout = max_timeout
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.outcomes = []
+        self.latency = None
+        self.open_seconds = OPEN_SECONDS
+        self.opened_at = 0
+        self.in_flight = 0
+        metrics.CALLBACK_CIRCUIT_STATE.labels(destination).set(STATE_VALUES[CLOSED])
+        metrics.CALLBACK_TIMEOUT.labels(destination).set(max_timeout)
+
+    def acquire(self) -> float:
+        """
+        Ask to deliver to the destination, to be followed by succeeded or failed when allowed
+
+        :return: Seconds to wait before trying again, 0 if the delivery can go on
+        """
+        with self.lock:
+            now = time.monotonic()
+            if self.state == OPEN:
+                remaining = self.opened_at + self.open_seconds - now
+                if remaining > 0:
+                    return remaining
+                self.set_state(HALF_OPEN)
+            elif self.state == HALF_OPEN:
+                # A probe is already being sent, its outcome is known after its timeout at most
+                return self.timeout()
+            elif self.in_flight >= MAX_CONCURRENT:
+                return self.timeout()
+            self.in_flight += 1
+            return 0
+
+    def timeout(self) -> float:
+        """
+        :return: Seconds to wait for the destination in the next delivery
+        """
+        if self.latency is None:
+            return self.max_timeout
+        return min(self.max_timeout, max(MIN_TIMEOUT, TIMEOUT_FACTOR * self.latency))
+
+    def succeeded(self, duration: float):
+        with self.lock:
+            self.in_flight -= 1
+            self.observe(duration, True)
+            if self.state == HALF_OPEN:
+                self.outcomes = []
+                self.open_seconds = OPEN_SECONDS
+                self.set_state(CLOSED)
+
+    def failed(self, duration: float):
+        with self.lock:
+            self.in_flight -= 1
+            self.observe(duration, False)
+            if self.state == HALF_OPEN:
+                self.open_seconds = min(MAX_OPEN_SECONDS, self.open_seconds * 2)
+                self.open()
+            elif (
+                len(self.outcomes) >= MIN_DELIVERIES
+                and self.outcomes.count(False) >= FAILURE_RATIO * len(self.outcomes)
+            ):
+                self.open()
+
+    def observe(self, duration: float, success: bool):
+        if self.latency is None:
+            self.latency = duration
+        else:
+            self.latency = EWMA_WEIGHT * duration + (1 - EWMA_WEIGHT) * self.latency
+        self.outcomes.append(success)
+        del self.outcomes[:-WINDOW]
+        metrics.CALLBACK_TIMEOUT.labels(self.destination).set(self.timeout())
+
+    def open(self):
+        self.opened_at = time.monotonic()
+        self.set_state(OPEN)
+
+    def set_state(self, state: str):
+        self.state = state
+        metrics.CALLBACK_CIRCUIT_STATE.labels(self.destination).set(STATE_VALUES[state])
+
+
+class CircuitBreakers:
+    """
+    Circuit breaker of every destination, created on its first delivery
+    """
+
+    def __init__(self, max_timeout: float):
+        self.max_timeout = max_timeout
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def get(self, url: str) -> CircuitBreaker:
+        """
+        :param url: Callback reference
+        :type url: String
+        :return: CircuitBreaker of the host:port of the url
+        """
+        destination = urlparse(url).netloc
+        breaker = self.breakers.get(destination)
+        if breaker is None:
+            with self.lock:
+                breaker = self.breakers.get(destination)
+                if breaker is None:
+                    breaker = CircuitBreaker(destination, self.max_timeout)
+                    self.breakers[destination] = breaker
+        return breaker
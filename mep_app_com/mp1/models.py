@@ -20,11 +20,15 @@ from jsonschema import validate
 import cherrypy
 from urllib import request, parse
 from .utils import *
+from .metrics import outbound
+from .tracing import inject, propagate
 from .enums import *
 from .mep_exceptions import *
 from .schemas import *
-from uuid import UUID
+from uuid import UUID, uuid4
 import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import pprint # Dictionaries pretty print (for testing)
 
@@ -39,6 +43,8 @@ class LinkType:
     Section 6.3.2 - MEC 011
     """
 
+    __slots__ = ("href",)
+
     def __init__(self, href: str):
         self.href = href
 
@@ -74,12 +80,15 @@ class ProblemDetails:
 ####################################
 # Classes used by management api   #
 ####################################
+@json_fields("href", "subscriptionType")
 class Subscription:
     """
     The MEC application instance's subscriptions.
     Section 6.2.2
     """
 
+    __slots__ = ("href", "subscriptionType")
+
     def __init__(
             self,
             href: str,
@@ -95,18 +104,16 @@ class Subscription:
         self.href = href
         self.subscriptionType = subscriptionType
 
-    def to_json(self):
-        return ignore_none_value(
-            dict(href=self.href, subscriptionType=self.subscriptionType)
-        )
-
 
+@json_fields("self", "subscriptions", "liveness")
 class Links:
     """
     Internal structure to be compliant with MEC 011
     Section 6.2.2
     """
 
+    __slots__ = ("self", "subscriptions", "liveness")
+
     def __init__(
             self,
             _self: LinkType = None,
@@ -133,13 +140,6 @@ class Links:
 
         return Links(_self=_self, subscriptions=subscriptions, liveness=liveness)
 
-    def to_json(self):
-        return ignore_none_value(
-            dict(
-                self=self.self, subscriptions=self.subscriptions, liveness=self.liveness
-            )
-        )
-
 
 class MecServiceMgmtApiSubscriptionLinkList:
     """
@@ -148,6 +148,8 @@ class MecServiceMgmtApiSubscriptionLinkList:
     Section 6.2.2 - MEC 011
     """
 
+    __slots__ = ("_links",)
+
     def __init__(self, _links: Links):
         self._links = _links
 
@@ -163,6 +165,8 @@ class MecServiceMgmtApiSubscriptionLinkList:
 
 
 class CategoryRef:
+    __slots__ = ("href", "id", "name", "version")
+
     def __init__(self, href: str, id: str, name: str, version: str):
         """
         This type represents the category reference.
@@ -187,7 +191,10 @@ class CategoryRef:
         return dict(href=self.href, id=self.id, name=self.name, version=self.version)
 
 
+@json_fields("states", "isLocal", "serInstanceIds", "serNames", "serCategories")
 class FilteringCriteria:
+    __slots__ = ("states", "isLocal", "serInstanceIds", "serNames", "serCategories")
+
     def __init__(
             self,
             states: List[ServiceState],
@@ -221,12 +228,12 @@ class FilteringCriteria:
     @staticmethod
     def from_json(data: dict) -> FilteringCriteria:
         validate(instance=data, schema=filteringcriteria_schema)
-        tmp_states = data.pop("states", None)
+        tmp_states = data.get("states")
         if tmp_states == None:
             states = None
         else:
             states = [ServiceState[state] for state in tmp_states]
-        isLocal = data.pop("isLocal", None)
+        isLocal = data.get("isLocal")
 
         # Since only one is acceptable start all as none and then set only the one presented in the data
         # the validation from json schema deals with the mutually exclusive part
@@ -242,22 +249,11 @@ class FilteringCriteria:
         elif "serNames" in data:
             identifier_data["serNames"] = data["serNames"]
         elif "serInstanceIds" in data:
-            identifier_data["serInstanceIds"] = data["serInstanceId"]
+            identifier_data["serInstanceIds"] = data["serInstanceIds"]
 
         # The object is created from the two known variables and from the dictionary setting only one identifier data
         return FilteringCriteria(states=states, isLocal=isLocal, **identifier_data)
 
-    def to_json(self):
-        return ignore_none_value(
-            dict(
-                states=self.states,
-                isLocal=self.isLocal,
-                serInstanceIds=self.serInstanceIds,
-                serNames=self.serNames,
-                serCategories=self.serCategories,
-            )
-        )
-
     def to_query(self):
         """
         Different from to_json because it uses singular names instead of plural ones
@@ -274,8 +270,31 @@ class FilteringCriteria:
             )
         )
 
+    def matching_services(self, services: list) -> list:
+        """
+        Same match as the to_query query, for services already read from the database
+        (e.g to match several subscriptions against a single query of the services)
+
+        :param services: Services as stored in the database
+        :type services: List of dict
+        :return: The services that match
+        """
+        query = json.loads(json.dumps(self.to_query(), cls=NestedEncoder))
+        return [
+            service
+            for service in services
+            if all(
+                # $in for the lists
+                service.get(key) in value if isinstance(value, list) else service.get(key) == value
+                for key, value in query.items()
+            )
+        ]
+
 
+@json_fields("notificationType", "_links", "serviceReferences")
 class ServiceAvailabilityNotification:
+    __slots__ = ("notificationType", "serviceReferences", "_links")
+
     def __init__(
             self,
             serviceReferences: List[ServiceReferences],
@@ -297,6 +316,8 @@ class ServiceAvailabilityNotification:
         self._links = _links
 
     class ServiceReferences:
+        __slots__ = ("link", "serInstanceId", "serName", "state", "changeType")
+
         def __init__(
                 self,
                 link: LinkType,
@@ -312,10 +333,12 @@ class ServiceAvailabilityNotification:
             self.changeType = changeType
 
         @staticmethod
-        def from_json(data: dict):
+        def from_json(data: dict, changeType: str = None):
             """
             :param data: Data used to generate a ServiceReference
             :type data: JSON / Python Dict
+            :param changeType: Type of the change, overrides the one in data (if any)
+            :type changeType: ChangeType
             :return: ServiceReference
             """
             # Link is weird - ETSI overall structure for the _link type is really confusing
@@ -323,7 +346,7 @@ class ServiceAvailabilityNotification:
             serInstanceId = data.get("serInstanceId")
             state = data.get("state")
             serName = data.get("serName")
-            changeType = ChangeType(data.get("changeType"))
+            changeType = ChangeType(changeType or data.get("changeType"))
             return ServiceAvailabilityNotification.ServiceReferences(
                 link=link,
                 serInstanceId=serInstanceId,
@@ -361,31 +384,111 @@ class ServiceAvailabilityNotification:
         serviceReferences = []
 
         for service in data:
-            service["changeType"] = changeType
             tmpReference = ServiceAvailabilityNotification.ServiceReferences.from_json(
-                data=service
+                data=service, changeType=changeType
             )
             serviceReferences.append(tmpReference)
         return ServiceAvailabilityNotification(
             _links=_links, serviceReferences=serviceReferences
         )
 
-    def to_json(self):
-        return ignore_none_value(
-            dict(
-                notificationType=self.notificationType,
-                _links=self._links,
+    def to_template(self) -> NotificationTemplate:
+        """
+        Encode the notification once, leaving a slot for the _links.subscription.href of each subscriber
+        The notification itself isn't modified so it can be shared by concurrent fan-outs
+
+        :return: NotificationTemplate
+        """
+        placeholder = uuid4().hex
+        body = json.dumps(
+            ServiceAvailabilityNotification(
                 serviceReferences=self.serviceReferences,
-            )
-        )
+                _links=Subscription(href=placeholder),
+                notificationType=self.notificationType,
+            ),
+            cls=NestedEncoder,
+        ).encode("utf-8")
+        prefix, suffix = body.split(json.dumps(placeholder).encode("utf-8"))
+        return NotificationTemplate(prefix, suffix)
+
+    @staticmethod
+    def coalesce(serviceReferences: list[dict]) -> list[dict]:
+        """
+        Merge the changes of a coalescing window into one reference per service, carrying its final state
+        A service ADDED in the window stays ADDED (or is left out if it was REMOVED too), a REMOVED one gets its
+        last change (REMOVED, or ADDED when it came back) and otherwise ATTRIBUTES_CHANGED wins over STATE_CHANGED
+        (it may include a state change)
+
+        :param serviceReferences: Encoded ServiceReferences in the order the changes happened
+        :type serviceReferences: List of JSON / Python Dict
+        :return: Encoded ServiceReferences, in the order their services first changed
+        """
+        merged = {}
+        for reference in serviceReferences:
+            previous = merged.get(reference["serInstanceId"])
+            if previous is not None:
+                changeTypes = (previous["changeType"], reference["changeType"])
+                if changeTypes == (ChangeType.ADDED.value, ChangeType.REMOVED.value):
+                    # The subscriber never knew about it
+                    merged[reference["serInstanceId"]] = None
+                    continue
+                if previous["changeType"] == ChangeType.ADDED.value:
+                    changeType = ChangeType.ADDED.value
+                elif ChangeType.REMOVED.value in changeTypes:
+                    changeType = reference["changeType"]
+                elif ChangeType.ATTRIBUTES_CHANGED.value in changeTypes:
+                    changeType = ChangeType.ATTRIBUTES_CHANGED.value
+                else:
+                    changeType = reference["changeType"]
+                reference = dict(reference, changeType=changeType)
+            merged[reference["serInstanceId"]] = reference
+        return [reference for reference in merged.values() if reference is not None]
+
+
+class NotificationTemplate:
+    """
+    Encoded ServiceAvailabilityNotification of which only the subscription href changes between subscribers
+    """
 
+    __slots__ = ("prefix", "suffix")
 
+    def __init__(self, prefix: bytes, suffix: bytes):
+        """
+        :param prefix: Encoded notification up to the subscription href
+        :type prefix: bytes
+        :param suffix: Encoded notification after the subscription href
+        :type suffix: bytes
+        """
+        self.prefix = prefix
+        self.suffix = suffix
+
+    def render(self, href: str) -> bytes:
+        """
+        :param href: Path of the subscription of the subscriber being notified
+        :type href: String
+        :return: Request body, same bytes json.dumps would produce for the notification with this _links
+        """
+        return self.prefix + json.dumps(href).encode("utf-8") + self.suffix
+
+
+@json_fields("callbackReference", "_links", "filteringCriteria", "coalescingWindow", "subscriptionType")
 class SerAvailabilityNotificationSubscription:
+    __slots__ = (
+        "callbackReference",
+        "_links",
+        "filteringCriteria",
+        "coalescingWindow",
+        "subscriptionType",
+        "appInstanceId",
+        "subscriptionId",
+    )
+
     def __init__(
             self,
             callbackReference: str,
             _links: Links = None,
             filteringCriteria: FilteringCriteria = None,
+            coalescingWindow: float = None,
     ):
         """
         :param callbackReference: URI selected by the MEC application instance to receive notifications on the subscribed MEC service availability information. This shall be included in both the request and the response.".
@@ -394,12 +497,15 @@ class SerAvailabilityNotificationSubscription:
         :type _links: str (String is validated to be a correct URI)
         :param filteringCriteria: Filtering criteria to match services for which events are requested to be reported. If absent, matches all services. All child attributes are combined with the logical "AND" operation.
         :type filteringCriteria: FilteringCriteria
+        :param coalescingWindow: Seconds during which the service changes are merged into a single notification. If absent (or 0) every change is notified on its own. Not part of MEC 011.
+        :type coalescingWindow: float
         Raises TypeError
         Section 8.1.3.2
         """
         self.callbackReference = validate_uri(callbackReference)
         self._links = _links
         self.filteringCriteria = filteringCriteria
+        self.coalescingWindow = coalescingWindow
         self.subscriptionType = "SerAvailabilityNotificationSubscription"
         """
         AppInstanceId and subscriptionId are only used internally to deal with callbacks
@@ -417,24 +523,44 @@ class SerAvailabilityNotificationSubscription:
         filteringCriteria = {}
         if "filteringCriteria" in data:
             filteringCriteria = FilteringCriteria.from_json(
-                data.pop("filteringCriteria")
+                data["filteringCriteria"]
             )
         return SerAvailabilityNotificationSubscription(
-            filteringCriteria=filteringCriteria, **data
+            filteringCriteria=filteringCriteria, **exclude_keys(data, "filteringCriteria")
         )
 
-    def to_json(self):
-        return ignore_none_value(
-            dict(
-                callbackReference=self.callbackReference,
-                _links=self._links,
-                filteringCriteria=self.filteringCriteria,
-                subscriptionType=self.subscriptionType,
-            )
-        )
+
+@json_fields("status", "subscriptionId", "subscription", "problemDetails")
+class SubscriptionResult:
+    __slots__ = ("status", "subscriptionId", "subscription", "problemDetails")
+
+    def __init__(
+            self,
+            status: int,
+            subscriptionId: str = None,
+            subscription: SerAvailabilityNotificationSubscription = None,
+            problemDetails: ProblemDetails = None,
+    ):
+        """
+        Outcome of one subscription of a batch creation or deletion
+        :param status: HTTP status the single request would have answered (201, 204, 400 or 404)
+        :type status: int
+        :param subscriptionId: Subscription created or deleted
+        :type subscriptionId: String
+        :param subscription: Subscription created
+        :type subscription: SerAvailabilityNotificationSubscription
+        :param problemDetails: Why the subscription wasn't created or deleted
+        :type problemDetails: ProblemDetails
+        """
+        self.status = status
+        self.subscriptionId = subscriptionId
+        self.subscription = subscription
+        self.problemDetails = problemDetails
 
 
 class OAuth2Info:
+    __slots__ = ("grantTypes", "tokenEndpoint")
+
     def __init__(self, grantTypes: List[GrantTypes], tokenEndpoint: str):
         """
         This type represents security information related to a transport.
@@ -453,18 +579,20 @@ class OAuth2Info:
     @staticmethod
     def from_json(data: dict) -> OAuth2Info:
         # list(set()) to ignore possible duplicates from the user
-        data["grantTypes"] = list(set(data["grantTypes"]))
-        if 1 > len(data["grantTypes"]) > 4:
+        grantTypes = list(set(data["grantTypes"]))
+        if 1 > len(grantTypes) > 4:
             raise InvalidGrantType
 
-        grantTypes = [GrantTypes(grantType) for grantType in data.pop("grantTypes")]
-        return OAuth2Info(grantTypes=grantTypes, **data)
+        grantTypes = [GrantTypes(grantType) for grantType in grantTypes]
+        return OAuth2Info(grantTypes=grantTypes, **exclude_keys(data, "grantTypes"))
 
     def to_json(self):
         return dict(grantTypes=self.grantTypes, tokenEndpoint=self.tokenEndpoint)
 
 
 class SecurityInfo:
+    __slots__ = ("oAuth2Info",)
+
     def __init__(self, oAuth2Info: OAuth2Info):
         """
         :param oAuth2Info: Parameters related to use of OAuth 2.0.
@@ -487,6 +615,8 @@ class EndPointInfo:
     """
 
     class Uris:
+        __slots__ = ("uris",)
+
         def __init__(self, uris: List[str]):
             """
             :param uri: Entry point information of the service as string, formatted according to URI syntax
@@ -499,6 +629,8 @@ class EndPointInfo:
             return dict(uris=self.uris)
 
     class Address:
+        __slots__ = ("host", "port")
+
         def __init__(self, host: str, port: int):
             """
             :param host: Host portion of the address.
@@ -513,6 +645,8 @@ class EndPointInfo:
             return dict(host=self.host, port=self.port)
 
     class Addresses:
+        __slots__ = ("addresses",)
+
         def __init__(self, addresses: List[object]):
             """
             :param addresses: List of EndPointInfo.Addresses
@@ -542,7 +676,14 @@ class EndPointInfo:
             return EndPointInfo.Uris(uris=data["uris"])
 
 
+@json_fields(
+    "id", "name", "type", "protocol", "version", "endpoint", "security", "description", "implSpecificInfo"
+)
 class TransportInfo:
+    __slots__ = (
+        "id", "name", "type", "protocol", "version", "endpoint", "security", "description", "implSpecificInfo"
+    )
+
     def __init__(
             self,
             id: str,
@@ -588,28 +729,48 @@ class TransportInfo:
 
     @staticmethod
     def from_json(data: dict) -> TransportInfo:
-        _type = TransportType(data.pop("type"))
-        endpoint = EndPointInfo.from_json(data.pop("endpoint"))
-        security = SecurityInfo.from_json(data.pop("security"))
-        return TransportInfo(type=_type, endpoint=endpoint, security=security, **data)
-
-    def to_json(self):
-        return ignore_none_value(
-            dict(
-                id=self.id,
-                name=self.name,
-                type=self.type,
-                protocol=self.protocol,
-                version=self.version,
-                endpoint=self.endpoint,
-                security=self.security,
-                description=self.description,
-                implSpecificInfo=self.implSpecificInfo,
-            )
+        _type = TransportType(data["type"])
+        endpoint = EndPointInfo.from_json(data["endpoint"])
+        security = SecurityInfo.from_json(data["security"])
+        return TransportInfo(
+            type=_type,
+            endpoint=endpoint,
+            security=security,
+            **exclude_keys(data, "type", "endpoint", "security"),
         )
 
 
+@json_fields(
+    "version",
+    "serInstanceId",
+    "serName",
+    "serCategory",
+    "serializer",
+    "_links",
+    "scopeOfLocality",
+    "transportInfo",
+    "state",
+    "livenessInterval",
+    "consumedLocalOnly",
+    "isLocal",
+)
 class ServiceInfo:
+    __slots__ = (
+        "serInstanceId",
+        "serName",
+        "serCategory",
+        "version",
+        "state",
+        "transportId",
+        "transportInfo",
+        "serializer",
+        "scopeOfLocality",
+        "consumedLocalOnly",
+        "isLocal",
+        "livenessInterval",
+        "_links",
+    )
+
     def __init__(
         self,
         serName: str,
@@ -673,47 +834,32 @@ class ServiceInfo:
         # Validate the json via jsonschema
         validate(instance=data, schema=serviceinfo_schema)
         identifier_data = {}
-        categoryref = data.pop("serCategory", None)
+        categoryref = data.get("serCategory")
         if categoryref is not None:
             identifier_data["serCategory"] = CategoryRef(**categoryref)
-        identifier_data["serName"] = data.pop("serName", None)
-
-        # Each required element or element that can't be automatically generated from the unpacking is popped
-        # to avoid having the function received the element twice and throwing an exception
-        state = ServiceState(data.pop("state"))
-        transportInfo = TransportInfo.from_json(data.pop("transportInfo"))
-        serializer = SerializerType(data.pop("serializer"))
+        identifier_data["serName"] = data.get("serName")
+
+        # Each required element or element that can't be automatically generated from the unpacking is left out
+        # of it to avoid having the function received the element twice and throwing an exception
+        # (data itself is never modified, the request body can still be used by the caller)
+        state = ServiceState(data["state"])
+        transportInfo = TransportInfo.from_json(data["transportInfo"])
+        serializer = SerializerType(data["serializer"])
         scopeOfLocality = None
         if "scopeOfLocality" in data.keys():
-            scopeOfLocality = LocalityType(data.pop("scopeOfLocality"))
+            scopeOfLocality = LocalityType(data["scopeOfLocality"])
 
         return ServiceInfo(
             state=state,
             transportInfo=transportInfo,
             serializer=serializer,
             scopeOfLocality=scopeOfLocality,
-            **data,
+            **exclude_keys(
+                data, "serCategory", "serName", "state", "transportInfo", "serializer", "scopeOfLocality"
+            ),
             **identifier_data,
         )
 
-    def to_json(self):
-        return ignore_none_value(
-            dict(
-                version=self.version,
-                serInstanceId=self.serInstanceId,
-                serName=self.serName,
-                serCategory=self.serCategory,
-                serializer=self.serializer,
-                _links=self._links,
-                scopeOfLocality=self.scopeOfLocality,
-                transportInfo=self.transportInfo,
-                state=self.state,
-                livenessInterval=self.livenessInterval,
-                consumedLocalOnly=self.consumedLocalOnly,
-                isLocal=self.isLocal,
-            )
-        )
-
     def to_filtering_criteria_json(self):
         """
         Used with the $or mongodb operator which requires a list of dictionaries for each "or" operation
@@ -722,15 +868,7 @@ class ServiceInfo:
         Due to serInstancesIds,serNames,serCategories and states being addressable by various values we transform
         them into a list so that we can use the $in operator
         """
-        tmp_ret = ignore_none_value(
-            dict(
-                serInstanceIds=[self.serInstanceId],
-                serNames=[self.serName],
-                serCategories=[self.serCategory],
-                states=[self.state],
-                isLocal=self.isLocal,
-            )
-        )
+        tmp_ret = self.filtering_criteria_values()
 
         return {
             "$and": [
@@ -744,6 +882,120 @@ class ServiceInfo:
             ]
         }
 
+    def filtering_criteria_values(self) -> dict:
+        """
+        Values of the service compared with the filtering criteria of the subscriptions
+        """
+        return ignore_none_value(
+            dict(
+                serInstanceIds=[self.serInstanceId],
+                serNames=[self.serName],
+                serCategories=[self.serCategory],
+                states=[self.state],
+                isLocal=self.isLocal,
+            )
+        )
+
+    def matches(self, filteringCriteria: dict) -> bool:
+        """
+        Same match as the to_filtering_criteria_json query, for a subscription already read from the database
+        (e.g to know which services of a batch a subscription matched)
+
+        :param filteringCriteria: filteringCriteria of the stored subscription ({} or None matches everything)
+        :type filteringCriteria: dict
+        """
+        if not filteringCriteria:
+            return True
+        values = json.loads(json.dumps(self.filtering_criteria_values(), cls=NestedEncoder))
+        for key, value in values.items():
+            if key not in filteringCriteria:
+                continue
+            criteria = filteringCriteria[key]
+            if isinstance(value, list):
+                # $in with the stored list
+                if not isinstance(criteria, list):
+                    criteria = [criteria]
+                if not any(item in criteria for item in value):
+                    return False
+            elif criteria != value:
+                return False
+        return True
+
+    def diff(self, stored: dict) -> ServiceInfoChanges:
+        """
+        Compares the service with its stored document field by field, lists are compared ignoring the order
+        (but not the repeated items, see order_insensitive)
+
+        :param stored: Service document as stored in the database (i.e object_to_mongodb_dict of a ServiceInfo)
+        :type stored: dict
+        :return: Fields that changed, with their new value
+        :rtype: ServiceInfoChanges
+        """
+        new = object_to_mongodb_dict(self)
+        if stored is None:
+            return ServiceInfoChanges(changed=new, removed=[])
+        # Plain equality first, the order insensitive forms are only built for fields that differ as they are
+        changed = {
+            key: value
+            for key, value in new.items()
+            if key not in stored
+            or (stored[key] != value and order_insensitive(stored[key]) != order_insensitive(value))
+        }
+        removed = [key for key in stored if key not in new]
+        return ServiceInfoChanges(changed=changed, removed=removed)
+
+
+class ServiceInfoChanges:
+    def __init__(self, changed: dict, removed: List[str]):
+        """
+        Result of ServiceInfo.diff
+
+        :param changed: New value of every field that was added or changed, usable as the $set of the update
+        :type changed: dict
+        :param removed: Fields of the stored service that the new one doesn't have
+        :type removed: List[String]
+        """
+        self.changed = changed
+        self.removed = removed
+
+    def __len__(self):
+        return len(self.changed) + len(self.removed)
+
+    @property
+    def changeType(self) -> ChangeType:
+        """
+        STATE_CHANGED if only the state changed, ATTRIBUTES_CHANGED if anything else changed and None if nothing did
+        """
+        if len(self) == 0:
+            return None
+        if not self.removed and list(self.changed) == ["state"]:
+            return ChangeType.STATE_CHANGED
+        return ChangeType.ATTRIBUTES_CHANGED
+
+    def __str__(self):
+        return str(dict(changed=self.changed, removed=self.removed))
+
+
+@json_fields("status", "serviceInfo", "problemDetails")
+class ServiceRegistrationResult:
+    __slots__ = ("status", "serviceInfo", "problemDetails")
+
+    def __init__(self, status: int, serviceInfo: ServiceInfo = None, problemDetails: ProblemDetails = None):
+        """
+        Outcome of one ServiceInfo of a batch registration
+        :param status: 201 when the service was registered, 200 when it updated a service already registered by
+                       the app (the single registration answers 201 for both) and 400 when it is invalid or
+                       its serName is repeated in the batch
+        :type status: int
+        :param serviceInfo: Registered service, when successful
+        :type serviceInfo: ServiceInfo
+        :param problemDetails: Why the service wasn't registered
+        :type problemDetails: ProblemDetails
+        """
+        self.status = status
+        self.serviceInfo = serviceInfo
+        self.problemDetails = problemDetails
+
 
 class ServiceGet:
     def __init__(
@@ -946,9 +1198,9 @@ class AppTerminationNotificationSubscription:
 
     def from_json(data: dict):
         validate(instance=data, schema=appTerminationNotificationSubscription_schema)
-        callbackReference = data.pop("callbackReference")
-        appInstanceId = data.pop("appInstanceId")
-        subscriptionType = data.pop("subscriptionType")
+        callbackReference = data["callbackReference"]
+        appInstanceId = data["appInstanceId"]
+        subscriptionType = data["subscriptionType"]
         try:
             _links = Links.from_json(data["_links"])
         except KeyError:
@@ -1004,6 +1256,12 @@ class Error:
         cherrypy.response.status = self.status
         cherrypy.response.headers["Content-Type"] = "application/problem+json"
 
+        return self.problem_details()
+
+    def problem_details(self):
+        """
+        ProblemDetails of the error without changing the response (e.g an item of a batch)
+        """
         return ProblemDetails(
             type=self.type,
             title=self.title,
@@ -1103,7 +1361,38 @@ class TooManyRequests(Error):
         )
 
 
+@json_fields(
+    "srcAddress",
+    "dstAddress",
+    "srcPort",
+    "dstPort",
+    "protocol",
+    "token",
+    "srcTunnelAddress",
+    "tgtTunnelAddress",
+    "srcTunnelPort",
+    "dstTunnelPort",
+    "qCI",
+    "dSCP",
+    "tC",
+)
 class TrafficFilter:
+    __slots__ = (
+        "srcAddress",
+        "dstAddress",
+        "srcPort",
+        "dstPort",
+        "protocol",
+        "token",
+        "srcTunnelAddress",
+        "tgtTunnelAddress",
+        "srcTunnelPort",
+        "dstTunnelPort",
+        "qCI",
+        "dSCP",
+        "tC",
+    )
+
     def __init__(self, srcAddress: List[str] = None,
                  dstAddress: List[str] = None,
                  srcPort: List[str] = None,
@@ -1138,19 +1427,19 @@ class TrafficFilter:
         # cherrypy.log(json.dumps(data))
         # First validate the json via jsonschema
         validate(instance=data, schema=trafficFilter_schema)
-        srcAddress = data.pop("srcAddress") if "srcAddress" in data else None
-        dstAddress = data.pop("dstAddress") if "dstAddress" in data else None
-        srcPort = data.pop("srcPort") if "srcPort" in data else None
-        dstPort = data.pop("dstPort") if "dstPort" in data else None
-        protocol = data.pop("protocol") if "protocol" in data else None
-        token = data.pop("token") if "token" in data else None
-        srcTunnelAddress = data.pop("srcTunnelAddress") if "srcTunnelAddress" in data else None
-        tgtTunnelAddress = data.pop("tgtTunnelAddress") if "tgtTunnelAddress" in data else None
-        srcTunnelPort = data.pop("srcTunnelPort") if "srcTunnelPort" in data else None
-        dstTunnelPort = data.pop("dstTunnelPort") if "dstTunnelPort" in data else None
-        qCI = data.pop("qCI") if "qCI" in data else None
-        dSCP = data.pop("dSCP") if "dSCP" in data else None
-        tC = data.pop("tC") if "tC" in data else None
+        srcAddress = data.get("srcAddress")
+        dstAddress = data.get("dstAddress")
+        srcPort = data.get("srcPort")
+        dstPort = data.get("dstPort")
+        protocol = data.get("protocol")
+        token = data.get("token")
+        srcTunnelAddress = data.get("srcTunnelAddress")
+        tgtTunnelAddress = data.get("tgtTunnelAddress")
+        srcTunnelPort = data.get("srcTunnelPort")
+        dstTunnelPort = data.get("dstTunnelPort")
+        qCI = data.get("qCI")
+        dSCP = data.get("dSCP")
+        tC = data.get("tC")
 
         return TrafficFilter(srcAddress = srcAddress, dstAddress = dstAddress, srcPort = srcPort,
                              dstPort = dstPort, protocol = protocol, token = token,
@@ -1158,14 +1447,10 @@ class TrafficFilter:
                              srcTunnelPort = srcTunnelPort, dstTunnelPort = dstTunnelPort, qCI = qCI,
                              dSCP = dSCP, tC = tC)
 
-    def to_json(self):
-        return ignore_none_value(dict(srcAddress = self.srcAddress, dstAddress = self.dstAddress, srcPort = self.srcPort,
-                                      dstPort = self.dstPort, protocol = self.protocol, token = self.token,
-                                      srcTunnelAddress = self.srcTunnelAddress, tgtTunnelAddress = self.tgtTunnelAddress,
-                                      srcTunnelPort = self.srcTunnelPort, dstTunnelPort = self.dstTunnelPort,
-                                      qCI = self.qCI, dSCP = self.dSCP, tC = self.tC))
 
+@json_fields("tunnelType", "tunnelDstAddress", "tunnelSrcAddress")
 class TunnelInfo:
+    __slots__ = ("tunnelType", "tunnelDstAddress", "tunnelSrcAddress")
 
     def __init__(self, tunnelType: str, tunnelDstAddress: str,
                  tunnelSrcAddress: str):
@@ -1179,20 +1464,18 @@ class TunnelInfo:
         # First validate the json via jsonschema
         validate(instance=data, schema=tunnelInfo_schema)
 
-        tunnelType = data.pop("tunnelType")
-        tunnelDstAddress = data.pop("tunnelDstAddress") if "tunnelDstAddress" in data else None
-        tunnelSrcAddress = data.pop("tunnelSrcAddress") if "tunnelSrcAddress" in data else None
+        tunnelType = data["tunnelType"]
+        tunnelDstAddress = data.get("tunnelDstAddress")
+        tunnelSrcAddress = data.get("tunnelSrcAddress")
 
         return TunnelInfo(tunnelType = tunnelType, tunnelDstAddress = tunnelDstAddress,
                           tunnelSrcAddress = tunnelSrcAddress)
 
-    def to_json(self):
-        return ignore_none_value(dict(tunnelType = self.tunnelType,
-                                      tunnelDstAddress = self.tunnelDstAddress,
-                                      tunnelSrcAddress = self.tunnelSrcAddress) )
-
 
+@json_fields("interfaceType", "tunnelInfo", "srcMacAddress", "dstMacAddress", "dstIpAddress")
 class DestinationInterface:
+    __slots__ = ("interfaceType", "tunnelInfo", "srcMacAddress", "dstMacAddress", "dstIpAddress")
+
     def __init__(self, interfaceType: str,
                  tunnelInfo: TunnelInfo = None,
                  srcMacAddress: str = '',
@@ -1212,24 +1495,22 @@ class DestinationInterface:
         # cherrypy.log(json.dumps(data))
         validate(instance=data, schema=destinationInterface_schema)
 
-        interfaceType = data.pop("interfaceType")
-        tunnelInfo = TunnelInfo.from_json(data.pop("tunnelInfo")) if "tunnelInfo" in data else None
-        srcMacAddress = data.pop("srcMacAddress") if "srcMacAddress" in data else None
-        dstMacAddress = data.pop("dstMacAddress") if "dstMacAddress" in data else None
-        dstIpAddress = data.pop("dstIpAddress") if "dstIpAddress" in data else None
+        interfaceType = data["interfaceType"]
+        tunnelInfo = TunnelInfo.from_json(data["tunnelInfo"]) if "tunnelInfo" in data else None
+        srcMacAddress = data.get("srcMacAddress")
+        dstMacAddress = data.get("dstMacAddress")
+        dstIpAddress = data.get("dstIpAddress")
 
         return DestinationInterface(interfaceType = interfaceType, tunnelInfo = tunnelInfo,
                                     srcMacAddress = srcMacAddress, dstMacAddress = dstMacAddress,
                                     dstIpAddress = dstIpAddress)
 
-    def to_json(self):
-        return ignore_none_value(dict(interfaceType = self.interfaceType,
-                                      tunnelInfo = self.tunnelInfo, srcMacAddress = self.srcMacAddress,
-                                      dstMacAddress = self.dstMacAddress, dstIpAddress = self.dstIpAddress) )
-
 
 
+@json_fields("trafficRuleId", "filterType", "priority", "trafficFilter", "action", "dstInterface", "state")
 class TrafficRule:
+    __slots__ = ("trafficRuleId", "filterType", "priority", "trafficFilter", "action", "dstInterface", "state")
+
     def __init__(self, 
                  trafficRuleId: str, 
                  filterType: str,
@@ -1255,29 +1536,24 @@ class TrafficRule:
         # cherrypy.log("TrafficRule from_json data:")
         # cherrypy.log(json.dumps(data))
 
-        trafficRuleId = data.pop("trafficRuleId")
-        filterType = data.pop("filterType")
-        priority = data.pop("priority")
-        trafficFilters = data.pop("trafficFilter")
+        trafficRuleId = data["trafficRuleId"]
+        filterType = data["filterType"]
+        priority = data["priority"]
+        trafficFilters = data["trafficFilter"]
         trafficFilter = []
         for filter in trafficFilters:
             trafficFilter.append(TrafficFilter.from_json(filter))
-        action = data.pop("action")
-        dstInterfaces = data.pop("dstInterface")
+        action = data["action"]
+        dstInterfaces = data["dstInterface"]
         dstInterface = []
         for interface in dstInterfaces:
             dstInterface.append(DestinationInterface.from_json(interface))
-        state = data.pop("state")
+        state = data["state"]
 
         return TrafficRule(trafficRuleId = trafficRuleId, filterType = filterType,
                             priority = priority, trafficFilter = trafficFilter, action = action,
                             dstInterface = dstInterface, state = state)
 
-    def to_json(self):
-        return ignore_none_value(dict(trafficRuleId = self.trafficRuleId, filterType = self.filterType,
-                                      priority = self.priority, trafficFilter = self.trafficFilter,
-                                      action = self.action, dstInterface = self.dstInterface, state = self.state) )
-    
     def toNetworkPolicy(self):
         networkpolicy = dict(ingress=[self.getIngress()], egress=[self.getEgress()])
         # cherrypy.log(json.dumps(networkpolicy))
@@ -1350,6 +1626,11 @@ class ntpServer:
      self.authenticationOption = authenticationOption
      self.authenticationKeyNum = authenticationKeyNum
 
+    def to_json(self):
+        return ignore_none_value(dict(ntpServerAddrType = self.ntpServerAddrType, ntpServerAddr = self.ntpServerAddr,
+        minPollingInterval = self.minPollingInterval, maxPollingInterval = self.maxPollingInterval, localPriority = self.localPriority,
+        authenticationOption = self.authenticationOption, authenticationKeyNum = self.authenticationKeyNum) )
+
 class ptpMaster:
     def __init__(self, ptpMasterIpAddress: string, ptpMasterLocalPriority: int, delayReqMaxRate: int):
         self.ptpMasterIpAddress = ptpMasterIpAddress
@@ -1383,9 +1664,9 @@ class ServiceLivenessInfo:
         # cherrypy.log("validate service liveness info")
         validate(instance=data, schema=serviceLivenessInfo_schema)
 
-        state = data.pop("state")
-        timeStamp = data.pop("timeStamp")
-        interval = data.pop("interval")
+        state = data["state"]
+        timeStamp = data["timeStamp"]
+        interval = data["interval"]
 
         return ServiceLivenessInfo(state, timeStamp, interval)
 
@@ -1402,7 +1683,7 @@ class ServiceLivenessUpdate:
         # First validate the json via jsonschema
         # cherrypy.log("validate service liveness update")
         validate(instance=data, schema=serviceLivenessUpdate_schema)
-        state = data.pop("state")
+        state = data["state"]
 
         return ServiceLivenessUpdate(state)
 
@@ -1411,6 +1692,34 @@ class ServiceLivenessUpdate:
         return ignore_none_value(dict(state = self.state))
 
 
+@json_fields("serviceId", "status", "livenessInfo", "problemDetails")
+class ServiceLivenessResult:
+    __slots__ = ("serviceId", "status", "livenessInfo", "problemDetails")
+
+    def __init__(
+            self,
+            serviceId: str,
+            status: int,
+            livenessInfo: ServiceLivenessInfo = None,
+            problemDetails: ProblemDetails = None,
+    ):
+        """
+        Outcome of one service of a batch liveness update
+        :param serviceId: Service the update was for
+        :type serviceId: String
+        :param status: HTTP status the single update would have answered (200, 204, 400, 404 or 409)
+        :type status: int
+        :param livenessInfo: Liveness of the service, when the MEP was waiting for the update (200)
+        :type livenessInfo: ServiceLivenessInfo
+        :param problemDetails: Why the update wasn't applied
+        :type problemDetails: ProblemDetails
+        """
+        self.serviceId = serviceId
+        self.status = status
+        self.livenessInfo = livenessInfo
+        self.problemDetails = problemDetails
+
+
 
 ################################ MM5 data types #######################################
 # MEC 010v2 6.2.2.21
@@ -1614,10 +1923,10 @@ class ChangeAppInstanceState:
     
     def from_json(data: dict):
         validate(data, schema=changeAppInstanceState_schema)
-        appInstanceId = data.pop("appInstanceId")
-        changeStateTo = ChangeStateTo(data.pop("changeStateTo"))
-        stopType = StopType(data.pop("stopType"))
-        gracefulStopTimeout = int(data.pop("gracefulStopTimeout"))
+        appInstanceId = data["appInstanceId"]
+        changeStateTo = ChangeStateTo(data["changeStateTo"])
+        stopType = StopType(data["stopType"])
+        gracefulStopTimeout = int(data["gracefulStopTimeout"])
 
         return ChangeAppInstanceState(
             appInstanceId=appInstanceId,
@@ -1644,10 +1953,10 @@ class TerminateAppInstance:
     
     def from_json(data: dict):
         validate(data, schema=terminateAppInstance_schema)
-        appInstanceId = data.pop("appInstanceId")
-        terminationType = TerminationType(data.pop("terminationType"))
+        appInstanceId = data["appInstanceId"]
+        terminationType = TerminationType(data["terminationType"])
         try:
-            gracefulStopTimeout = int(data.pop("gracefulStopTimeout"))
+            gracefulStopTimeout = int(data["gracefulStopTimeout"])
         except KeyError:
             gracefulStopTimeout = 0
 
@@ -1690,7 +1999,8 @@ class OAuthServer:
         self.port = port
     
     def register(self):
-        response = requests.get("http://%s:%s/register" %(self.url, self.port))
+        with outbound("oauth", "register"):
+            response = requests.get("http://%s:%s/register" %(self.url, self.port), headers=inject())
         response = json.loads(response.content)
         if (response['message'] == 'Client registered successfully'):
             response.pop('message')
@@ -1701,7 +2011,8 @@ class OAuthServer:
     
     def get_token(self, client_id:str, client_secret:str):
         credentials = dict(grant_type="client_credentials", client_id=client_id, client_secret=client_secret)
-        response = requests.post("http://%s:%s/token" %(self.url, self.port), json=credentials)
+        with outbound("oauth", "get_token"):
+            response = requests.post("http://%s:%s/token" %(self.url, self.port), json=credentials, headers=inject())
         if response.status_code == 200:
             token = json.loads(response.content)['access_token']
             return token
@@ -1710,39 +2021,101 @@ class OAuthServer:
     
     def validate_token(self, access_token:str):
         #data = dict(access_token=access_token)
-        response = requests.post("http://%s:%s/validate_token?access_token=%s" %(self.url, self.port,access_token))
+        with outbound("oauth", "validate_token"):
+            response = requests.post("http://%s:%s/validate_token?access_token=%s" %(self.url, self.port,access_token), headers=inject())
         return response.status_code == 200
     
     def delete_client(self, client_id:str, client_secret:str):
         credentials = dict(client_id=client_id, client_secret=client_secret)
-        response = requests.post("http://%s:%s/delete" %(self.url, self.port), json=credentials)        
+        with outbound("oauth", "delete_client"):
+            response = requests.post("http://%s:%s/delete" %(self.url, self.port), json=credentials, headers=inject())
         return response.status_code == 200
 
 class DnsApiServer:
-    def __init__(self, url: str, port: str, zone: str = "zone0") -> None:
+    def __init__(
+            self, url: str, port: str, zone: str = "zone0", concurrency: int = 4, timeout: float = 10
+    ) -> None:
+        """
+        :param concurrency: Requests of a batch of records sent at the same time
+        :param timeout: Seconds to wait for the DNS API to connect and to answer
+        """
         self.url = url
         self.port = port
         self.zone = zone
+        self.timeout = timeout
+        # Keep-alive connection of each thread to the DNS API (a requests.Session isn't shared between threads)
+        self.local = threading.local()
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="dns_api")
+
+    def session(self) -> requests.Session:
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        return self.local.session
 
     def create_record(self, domain: str, ip: str, ttl: int):
+        return self.create_records([(domain, ip, ttl)])[0]
 
-        headers = {"Content-Type": "application/json"}
-        query = {"name": domain, "ip": ip, "ttl": ttl}
+    def remove_record(self, domain: str):
+        return self.remove_records([domain])[0]
 
+    def create_records(self, records: list, throttle=None) -> list:
+        """
+        Create many records, concurrency requests at a time on the keep-alive connections of the threads
+        The DNS API has no bulk endpoint and a connection carries one request at a time (no pipelining), so
+        each record is still a request but a batch takes about len(records) / concurrency round-trips
+
+        :param records: Domain name, IP address and TTL of each record
+        :type records: List of (String, String, int)
+        :param throttle: Function called before each request (e.g to limit the requests per second)
+        :return: Whether each record was created
+        """
+        headers = inject({"Content-Type": "application/json"})
         url_0 = 'http://%s:%s/dns_support/v1/api/%s/record' % (self.url, self.port, self.zone)
 
-        response = requests.post(url_0, headers=headers, params=query)
+        return self._send_all(
+            "create_record",
+            [dict(method="POST", url=url_0, headers=headers, params={"name": domain, "ip": ip, "ttl": ttl})
+             for domain, ip, ttl in records],
+            throttle,
+        )
 
-        # print(f"\n# DNS rule creation #\nresponse: {response.json()}\n")
+    def remove_records(self, domains: list, throttle=None) -> list:
+        """
+        Remove many records, concurrency requests at a time (see create_records)
 
-        return response.status_code == 200
+        :param domains: Domain name of each record
+        :type domains: List of String
+        :param throttle: Function called before each request (e.g to limit the requests per second)
+        :return: Whether each record was removed
+        """
+        headers = inject({"Content-Type": "application/json"})
+        url = 'http://%s:%s/dns_support/v1/api/%s/record' % (self.url, self.port, self.zone)
 
-    def remove_record(self, domain: str):
-        
-        headers = {"Content-Type": "application/json"}
-        
-        url = 'http://%s:%s/dns_support/v1/api/%s/record?name=%s' %(self.url, self.port, self.zone, domain)
-        
-        response = requests.delete(url, headers=headers)
+        return self._send_all(
+            "remove_record",
+            [dict(method="DELETE", url=url, headers=headers, params={"name": domain}) for domain in domains],
+            throttle,
+        )
+
+    def _send_all(self, operation: str, requests_kwargs: list, throttle=None) -> list:
+        """
+        A connection error (or timeout) fails the records that weren't sent yet too (they would wait for the
+        same error)
+        """
+        failed = threading.Event()
+
+        def send_record(kwargs: dict) -> bool:
+            if failed.is_set():
+                return False
+            if throttle is not None:
+                throttle()
+            try:
+                with outbound("dns_api", operation):
+                    response = self.session().request(timeout=self.timeout, **kwargs)
+            except requests.RequestException as e:
+                failed.set()
+                cherrypy.log("DNS API %s of %s failed: %s" % (operation, kwargs["params"]["name"], e))
+                return False
+            return response.status_code == 200
 
-        return response.status_code == 200
\ No newline at end of file
+        return list(self.executor.map(propagate(send_record), requests_kwargs))
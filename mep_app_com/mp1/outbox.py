@@ -0,0 +1,367 @@
+# Copyright 2022 Centro ALGORITMI - University of Minho and Instituto de Telecomunicações - Aveiro
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""
+Notification outbox
+
+Notifications sent to the MEC applications (service availability, app termination) are written to the
+notificationOutbox collection by the request that caused them, together with its other database changes,
+and delivered afterwards by the workers of the scheduler. The request never waits for a subscriber.
+
+A worker claims a notification by moving its nextAttemptAt forward by the lease, so a notification
+claimed by a worker (or a pod) that died is claimed again once the lease expires: delivery is at least once.
+Every pod sweeps the collection every MEP_OUTBOX_SWEEP_INTERVAL seconds for those and for the retries.
+A failed delivery (connection error, timeout or non 2xx answer) is retried with exponential backoff and
+jitter and, after MEP_OUTBOX_MAX_ATTEMPTS attempts, is kept in the collection with state DEAD and its
+last error for an operator to look at. An error of the MEP itself (e.g rendering the body) fails the
+delivery the same way, and a notification claimed again after its last attempt never ended (the worker
+died) is dead-lettered when claimed.
+
+Notifications can also be coalesced: the changes sent to the same key (e.g a subscription) while its
+notification waits for its window are added to it, and the body is only encoded, by the renderer of the
+kind, when it is delivered. Once claimed, a notification isn't changed anymore and a new one is started.
+Mp1 and Mm5 share the collection, a server only claims the coalesced notifications it has a renderer for.
+
+Deliveries go through the circuit breaker of their destination (see circuit_breaker), which sets their
+timeout from the latency of the subscriber (MEP_OUTBOX_TIMEOUT is the upper bound). A notification to a
+destination whose breaker is open, or that already has enough deliveries waiting on it, is put back
+without spending an attempt.
+"""
+
+import os
+import random
+import time
+import uuid
+
+import cherrypy
+import requests
+from cherrypy.process import plugins
+
+from . import metrics
+from .circuit_breaker import CircuitBreakers
+from .metrics import outbound
+from .scheduler import scheduler
+from .tracing import inject
+
+OUTBOX_COLLECTION = "notificationOutbox"
+
+PENDING = "PENDING"
+DEAD = "DEAD"
+
+DEFAULT_MAX_ATTEMPTS = 10
+# Seconds
+DEFAULT_BASE_DELAY = 1
+DEFAULT_MAX_DELAY = 300
+DEFAULT_TIMEOUT = 10
+DEFAULT_SWEEP_INTERVAL = 5
+DEFAULT_BATCH_SIZE = 100
+
+
+class NotificationOutbox(plugins.SimplePlugin):
+    """
+    Engine plugin delivering the notifications of the outbox, started after the scheduler
+    """
+
+    def __init__(
+            self,
+            bus,
+            max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+            base_delay: float = DEFAULT_BASE_DELAY,
+            max_delay: float = DEFAULT_MAX_DELAY,
+            timeout: float = DEFAULT_TIMEOUT,
+            sweep_interval: float = DEFAULT_SWEEP_INTERVAL,
+            batch_size: int = DEFAULT_BATCH_SIZE,
+    ):
+        """
+        :param max_attempts: Deliveries tried before the notification is dead-lettered
+        :param base_delay: Seconds before the first retry, doubled on every following one
+        :param max_delay: Maximum seconds between two retries
+        :param timeout: Seconds to wait for a subscriber (connect and read)
+        :param sweep_interval: Seconds between two sweeps of the collection
+        :param batch_size: Notifications claimed by a sweep before the next one is scheduled
+        """
+        super().__init__(bus)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.sweep_interval = sweep_interval
+        self.batch_size = batch_size
+        # A claimed notification is only claimed again once every possible attempt of the worker has ended
+        self.lease = 2 * timeout + 5
+        self.indexed = False
+        self.breakers = CircuitBreakers(timeout)
+        self.renderers = {}
+
+    def start(self):
+        scheduler.schedule(0, self.sweep)
+
+    # After the scheduler (priority 50) is started
+    start.priority = 75
+
+    def enqueue(self, kind: str, notifications: list, delay: float = 0):
+        """
+        Write notifications to the outbox, to be delivered after delay seconds
+        Runs in the thread of the request (uses its database connection)
+
+        :param kind: What is being notified (e.g service_availability, app_termination)
+        :type kind: String
+        :param notifications: Pairs of callbackReference and encoded body
+        :type notifications: List of (String, bytes)
+        :param delay: Seconds to wait before the first delivery (e.g the subscriber is still receiving its answer)
+        :type delay: float
+        """
+        if not notifications:
+            return
+        now = time.time()
+        cherrypy.thread_data.db.create_many(
+            OUTBOX_COLLECTION,
+            [
+                dict(
+                    notificationId=str(uuid.uuid4()),
+                    kind=kind,
+                    callbackReference=callbackReference,
+                    body=body.decode("utf-8"),
+                    state=PENDING,
+                    attempts=0,
+                    createdAt=now,
+                    nextAttemptAt=now + delay,
+                )
+                for callbackReference, body in notifications
+            ],
+        )
+        scheduler.schedule(delay, self.poll)
+
+    def coalesce(
+            self, kind: str, key: str, callbackReference: str, items: list, window: float, envelope: dict = None
+    ):
+        """
+        Add items to the notification of key that is waiting for its window or start one, delivered window
+        seconds from now, with them
+        Runs in the thread of the request (uses its database connection)
+
+        :param kind: What is being notified, must have a renderer
+        :type kind: String
+        :param key: What the items are merged for (e.g the subscription)
+        :type key: String
+        :param callbackReference: URL the notification is sent to
+        :type callbackReference: String
+        :param items: JSON encodable items, the renderer gets every item added during the window in order
+        :type items: List
+        :param window: Seconds the notification waits for more items
+        :type window: float
+        :param envelope: JSON encodable data the renderer needs besides the items (same for the whole window)
+        :type envelope: dict
+        """
+        now = time.time()
+        result = cherrypy.thread_data.db.upsert(
+            OUTBOX_COLLECTION,
+            # A claim counts an attempt, so a notification without attempts hasn't been read by a worker yet
+            {"coalesceKey": key, "state": PENDING, "attempts": 0},
+            {
+                "$push": {"items": {"$each": items}},
+                "$setOnInsert": dict(
+                    notificationId=str(uuid.uuid4()),
+                    kind=kind,
+                    callbackReference=callbackReference,
+                    envelope=envelope,
+                    createdAt=now,
+                    nextAttemptAt=now + window,
+                ),
+            },
+        )
+        if result.upserted_id is None:
+            metrics.NOTIFICATIONS.labels(kind, "coalesced").inc()
+        else:
+            scheduler.schedule(window, self.poll)
+
+    def renderer(self, kind: str, render):
+        """
+        Set how the coalesced notifications of a kind are encoded
+
+        :param kind: What is being notified
+        :type kind: String
+        :param render: Function of the outbox entry (envelope and items) returning the request body (bytes)
+                       or None when, once merged, the items leave nothing to notify
+        """
+        self.renderers[kind] = render
+
+    def sweep(self):
+        """
+        Periodic poll, picks up the retries and the notifications whose lease expired
+        """
+        try:
+            db = cherrypy.thread_data.db
+            if not self.indexed:
+                db.create_index(OUTBOX_COLLECTION, [("state", 1), ("nextAttemptAt", 1)])
+                db.create_index(OUTBOX_COLLECTION, [("coalesceKey", 1), ("state", 1)])
+                self.indexed = True
+            self.poll()
+            metrics.NOTIFICATION_OUTBOX_PENDING.set(
+                db.count_documents(OUTBOX_COLLECTION, {"state": PENDING})
+            )
+        finally:
+            scheduler.schedule(self.sweep_interval, self.sweep)
+
+    def poll(self):
+        """
+        Claim the notifications that are due (at most batch_size) and deliver each one in a worker
+        """
+        db = cherrypy.thread_data.db
+        for _ in range(self.batch_size):
+            now = time.time()
+            notification = db.find_one_and_update(
+                OUTBOX_COLLECTION,
+                {
+                    "state": PENDING,
+                    "nextAttemptAt": {"$lte": now},
+                    "$or": [{"body": {"$exists": True}}, {"kind": {"$in": list(self.renderers)}}],
+                },
+                {"$set": {"nextAttemptAt": now + self.lease}, "$inc": {"attempts": 1}},
+                sort=[("nextAttemptAt", 1)],
+            )
+            if notification is None:
+                return
+            if notification["attempts"] > self.max_attempts:
+                self.dead_letter(notification, notification.get("lastError", "Last attempt never ended"))
+                continue
+            scheduler.schedule(0, self.deliver, notification)
+        # More might be due, continue once the claimed ones are queued
+        scheduler.schedule(0, self.poll)
+
+    def deliver(self, notification: dict):
+        try:
+            self.send(notification)
+        except Exception as e:
+            # Not a failure of the subscriber (e.g the renderer or the database), retried just the same so
+            # the notification isn't claimed again on every lease
+            cherrypy.log("Notification %s could not be sent" % notification["notificationId"], traceback=True)
+            self.failed(notification, e)
+
+    def send(self, notification: dict):
+        kind = notification["kind"]
+        if "body" in notification:
+            body = notification["body"].encode("utf-8")
+        else:
+            body = self.renderers[kind](notification)
+            if body is None:
+                cherrypy.thread_data.db.remove(
+                    OUTBOX_COLLECTION, dict(notificationId=notification["notificationId"])
+                )
+                return
+
+        breaker = self.breakers.get(notification["callbackReference"])
+        delay = breaker.acquire()
+        if delay:
+            self.short_circuited(notification, delay)
+            return
+
+        start = time.monotonic()
+        delivered = False
+        try:
+            with outbound("callback", kind):
+                response = requests.post(
+                    notification["callbackReference"],
+                    data=body,
+                    headers=inject({"Content-Type": "application/json"}),
+                    timeout=breaker.timeout(),
+                )
+                response.raise_for_status()
+            delivered = True
+        except requests.RequestException as e:
+            self.failed(notification, e)
+            return
+        finally:
+            # Whatever the error, the slot of the destination (or its HALF_OPEN probe) is given back
+            if delivered:
+                breaker.succeeded(time.monotonic() - start)
+            else:
+                breaker.failed(time.monotonic() - start)
+
+        cherrypy.thread_data.db.remove(
+            OUTBOX_COLLECTION, dict(notificationId=notification["notificationId"])
+        )
+        metrics.NOTIFICATIONS.labels(kind, "delivered").inc()
+        metrics.NOTIFICATION_DELIVERY_LAG.labels(kind).observe(time.time() - notification["createdAt"])
+
+    def failed(self, notification: dict, error: Exception):
+        kind = notification["kind"]
+        attempts = notification["attempts"]
+        query = dict(notificationId=notification["notificationId"])
+        if attempts >= self.max_attempts:
+            self.dead_letter(notification, error)
+            return
+
+        delay = self.backoff(attempts)
+        cherrypy.thread_data.db.update(
+            OUTBOX_COLLECTION, query, dict(nextAttemptAt=time.time() + delay, lastError=str(error))
+        )
+        metrics.NOTIFICATIONS.labels(kind, "retried").inc()
+        scheduler.schedule(delay, self.poll)
+
+    def dead_letter(self, notification: dict, error):
+        """
+        Keep a notification that won't be tried anymore, with its last error, for an operator to look at
+        """
+        cherrypy.thread_data.db.update(
+            OUTBOX_COLLECTION,
+            dict(notificationId=notification["notificationId"]),
+            dict(state=DEAD, lastError=str(error)),
+        )
+        metrics.NOTIFICATIONS.labels(notification["kind"], "dead").inc()
+        cherrypy.log(
+            "Notification %s to %s dead-lettered after %d attempts: %s"
+            % (notification["notificationId"], notification["callbackReference"], notification["attempts"], error)
+        )
+
+    def short_circuited(self, notification: dict, delay: float):
+        """
+        Put a notification back, undelivered, until its destination can be tried again
+        The claim counted an attempt that wasn't made, it is given back
+        """
+        cherrypy.thread_data.db.update(
+            OUTBOX_COLLECTION,
+            dict(notificationId=notification["notificationId"]),
+            dict(nextAttemptAt=time.time() + delay, attempts=notification["attempts"] - 1),
+        )
+        metrics.NOTIFICATIONS.labels(notification["kind"], "short_circuited").inc()
+        scheduler.schedule(delay, self.poll)
+
+    def backoff(self, attempts: int) -> float:
+        """
+        Exponential backoff with equal jitter: half of the delay is fixed and the other half random,
+        so the retries to a subscriber that was down don't all arrive at the same time
+
+        :param attempts: Deliveries already tried
+        :return: Seconds until the next attempt
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+
+outbox = NotificationOutbox(
+    cherrypy.engine,
+    max_attempts=int(os.environ.get("MEP_OUTBOX_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS)),
+    base_delay=float(os.environ.get("MEP_OUTBOX_BASE_DELAY", DEFAULT_BASE_DELAY)),
+    max_delay=float(os.environ.get("MEP_OUTBOX_MAX_DELAY", DEFAULT_MAX_DELAY)),
+    timeout=float(os.environ.get("MEP_OUTBOX_TIMEOUT", DEFAULT_TIMEOUT)),
+    sweep_interval=float(os.environ.get("MEP_OUTBOX_SWEEP_INTERVAL", DEFAULT_SWEEP_INTERVAL)),
+)
+
+
+def mount():
+    """
+    Starts delivering the outbox with the engine (the scheduler must be mounted too)
+    """
+    outbox.subscribe()
@@ -0,0 +1,463 @@
+# Copyright 2022 Centro ALGORITMI - University of Minho and Instituto de Telecomunicações - Aveiro
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""
+Reconciler of the traffic rules and DNS rules
+
+The trafficRules and dnsRules collections are the desired state. A reconciliation compares them with what
+is actually configured and applies only the changes that make both match, so a configuration that failed
+(or was lost with its pod) is done again by the next reconciliation instead of being forgotten:
+    NetworkPolicies   the ones named networkpolicy-* in the namespace of the MEP, created when missing,
+                      patched when their spec differs and deleted when no traffic rule needs them.
+                      With MEP_NETWORK_POLICY_MODE=rule there is one per traffic rule, with app a single
+                      one per application with its traffic rules merged
+    DNS records       the DNS API can't list its records so the records it accepted are kept in the
+                      dnsRecords collection. Records of ACTIVE DNS rules missing from it are created,
+                      the ones of removed (or changed) rules are deleted
+A change to the rules of an application reconciles that application and every MEP_RECONCILE_INTERVAL
+seconds one pod reconciles all of them. The reconciliations of every pod (and worker) run one at a time, each
+one claims the lease document of the reconcilerLease collection first: a reconciliation of an application
+that finds it claimed is tried again shortly after, a pod whose periodic one finds it claimed leaves it to
+the pod that swept last unless that was more than an interval ago. A lease claimed by a pod that died expires
+after a batch. At most MEP_RECONCILE_RATE changes are applied per second (the
+DNS records of a reconciliation are sent a few at a time, each one still counts) and
+MEP_RECONCILE_BATCH_SIZE per reconciliation, the next one starts right away when some were left and
+the batch applied at least one (otherwise, e.g the Kubernetes or DNS API is down, it waits for the interval).
+The actual state is read before the desired state: the NetworkPolicy of a traffic rule added in between is
+then desired too, and never deleted.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+
+import cherrypy
+import jsonschema
+from cherrypy.process import plugins
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+from ratelimit import limits, sleep_and_retry
+
+from . import metrics
+from .metrics import outbound
+from .models import TrafficRule
+from .scheduler import scheduler
+from .tracing import propagate
+from .utils import load_kubernetes_config, trafficRuleToNetworkPolicy, trafficRulesToNetworkPolicy
+
+DNS_RECORDS_COLLECTION = "dnsRecords"
+
+NETWORK_POLICY_PREFIX = "networkpolicy-"
+# Application of the NetworkPolicies created by the MEP, the label lets the API server list the ones of an application
+APP_ANNOTATION = "mep/appInstanceId"
+APP_LABEL = "mep/appInstanceId"
+
+RULE = "rule"
+APP = "app"
+
+LEASE_COLLECTION = "reconcilerLease"
+LEASE_ID = "reconciler"
+# Seconds before a reconciliation that found the lease claimed is tried again
+LEASE_RETRY = 0.2
+
+DEFAULT_INTERVAL = 60
+DEFAULT_BATCH_SIZE = 50
+# Changes per second
+DEFAULT_RATE = 10
+
+
+def normalized_spec(spec: dict) -> str:
+    """
+    NetworkPolicy spec as compared by the reconciler: the API server leaves out the empty lists and
+    sets the protocol of the ports (TCP)
+
+    :param spec: Spec of the NetworkPolicy (as sent to or read from the API server)
+    :type spec: dict
+    """
+    spec = dict(spec)
+    for key, peersKey in (("ingress", "from"), ("egress", "to")):
+        spec[key] = [
+            {
+                peersKey: rule.get(peersKey) or [],
+                "ports": [dict({"protocol": "TCP"}, **port) for port in rule.get("ports") or []],
+            }
+            for rule in spec.get(key) or []
+        ]
+    return json.dumps(spec, sort_keys=True)
+
+
+class Reconciler(plugins.SimplePlugin):
+    """
+    Engine plugin reconciling the NetworkPolicies and DNS records with the rules, started after the scheduler
+    """
+
+    def __init__(
+            self,
+            bus,
+            mode: str = RULE,
+            interval: float = DEFAULT_INTERVAL,
+            batch_size: int = DEFAULT_BATCH_SIZE,
+            rate: int = DEFAULT_RATE,
+    ):
+        """
+        :param mode: One NetworkPolicy per traffic rule (rule) or per application (app)
+        :param interval: Seconds between two reconciliations of every application
+        :param batch_size: Changes applied by a reconciliation before the next one is scheduled
+        :param rate: Changes applied per second
+        """
+        super().__init__(bus)
+        self.mode = mode
+        self.interval = interval
+        self.batch_size = batch_size
+        self.throttle = sleep_and_retry(limits(calls=rate, period=1)(lambda: None))
+        # Applications with a reconciliation that didn't start yet (it reads the rules when it runs)
+        self.pending = set()
+        self.lock = threading.Lock()
+        # Longer than a reconciliation of batch_size changes takes at the rate
+        self.lease = 2 * batch_size / rate + 30
+        self.prepared = False
+
+    def start(self):
+        scheduler.schedule(0, self.sweep)
+
+    # After the scheduler (priority 50) is started
+    start.priority = 75
+
+    def trigger(self, appInstanceId: str, delay: float = 0):
+        """
+        Reconcile an application after its rules changed, unless a reconciliation of it is already waiting
+
+        :param appInstanceId: Application whose traffic or DNS rules were written
+        :type appInstanceId: String
+        :param delay: Seconds to wait before the reconciliation
+        :type delay: float
+        """
+        with self.lock:
+            if appInstanceId in self.pending:
+                return
+            self.pending.add(appInstanceId)
+        scheduler.schedule(delay, propagate(self.reconcile_app), appInstanceId)
+
+    def reconcile_app(self, appInstanceId: str):
+        with self.lock:
+            self.pending.discard(appInstanceId)
+        token = self.acquire()
+        if token is None:
+            # Another reconciliation is running, in this pod or another one
+            self.trigger(appInstanceId, LEASE_RETRY)
+            return
+        try:
+            left = self.reconcile(appInstanceId)
+        finally:
+            self.release(token)
+        if left:
+            self.trigger(appInstanceId)
+
+    def sweep(self):
+        """
+        Periodic reconciliation of every application
+        """
+        try:
+            self.sweep_batch(first=True)
+        finally:
+            scheduler.schedule(self.interval, self.sweep)
+
+    def sweep_batch(self, first: bool = False):
+        """
+        Reconciliation of every application, the first batch of a sweep is only made when no pod swept in
+        the last interval
+        """
+        token = self.acquire(sweep=first)
+        if token is None:
+            lease = cherrypy.thread_data.db.query_col(LEASE_COLLECTION, {"_id": LEASE_ID}, find_one=True)
+            # Claimed by a reconciliation (rather than swept by another pod), the sweep waits for it
+            if not first or lease["lastSweepAt"] <= time.time() - self.interval:
+                scheduler.schedule(LEASE_RETRY, self.sweep_batch, first)
+            return
+        try:
+            left = self.reconcile()
+        finally:
+            self.release(token)
+        if left and self.bus.state == cherrypy.engine.states.STARTED:
+            scheduler.schedule(0, self.sweep_batch)
+
+    def acquire(self, sweep: bool = False) -> str:
+        """
+        Claim the lease of the reconciliations, until it is released or expires
+
+        :param sweep: Claim it for the first batch of a sweep, which sets when the last sweep was made
+        :type sweep: bool
+        :return: Token to release the lease with, None when it is claimed already (or was swept recently)
+        """
+        db = cherrypy.thread_data.db
+        if not self.prepared:
+            db.create_index(DNS_RECORDS_COLLECTION, [("domainName", 1)])
+            db.create_index(DNS_RECORDS_COLLECTION, [("appInstanceId", 1)])
+            db.upsert(LEASE_COLLECTION, {"_id": LEASE_ID}, {"$setOnInsert": {"expiresAt": 0, "lastSweepAt": 0}})
+            self.prepared = True
+        now = time.time()
+        token = str(uuid.uuid4())
+        query = {"_id": LEASE_ID, "expiresAt": {"$lt": now}}
+        update = {"token": token, "expiresAt": now + self.lease}
+        if sweep:
+            query["lastSweepAt"] = {"$lte": now - self.interval}
+            update["lastSweepAt"] = now
+        if db.find_one_and_update(LEASE_COLLECTION, query, {"$set": update}) is None:
+            return None
+        return token
+
+    def release(self, token: str):
+        """
+        Release the lease, unless it expired and was claimed again
+        """
+        cherrypy.thread_data.db.update(LEASE_COLLECTION, {"_id": LEASE_ID, "token": token}, {"expiresAt": 0})
+
+    def reconcile(self, appInstanceId: str = None) -> bool:
+        """
+        Apply the changes (up to batch_size) that make the actual state match the rules
+
+        :param appInstanceId: Application to reconcile, every one when None
+        :type appInstanceId: String
+        :return: True when changes were left for the next reconciliation and this one made progress
+        """
+        scope = "all" if appInstanceId is None else "app"
+        start = time.perf_counter()
+        try:
+            nameSpace = cherrypy.config.get("namespace")
+            load_kubernetes_config()
+            api_instance = client.NetworkingV1Api(client.ApiClient())
+
+            policyChanges = self.network_policy_changes(api_instance, nameSpace, appInstanceId)
+            recordChanges = self.dns_record_changes(appInstanceId)
+            if appInstanceId is None:
+                metrics.RECONCILE_DRIFT.labels("network_policy").set(len(policyChanges))
+                metrics.RECONCILE_DRIFT.labels("dns_record").set(len(recordChanges))
+
+            batch = self.batch_size
+            applied = self.apply_network_policy_changes(api_instance, nameSpace, policyChanges[:batch])
+            batch -= min(batch, len(policyChanges))
+            applied += self.apply_dns_record_changes(recordChanges[:batch])
+            # Changes that keep failing would be tried again right away otherwise
+            return applied > 0 and len(policyChanges) + len(recordChanges) > self.batch_size
+        finally:
+            metrics.RECONCILE_DURATION.labels(scope).observe(time.perf_counter() - start)
+
+    def network_policy_changes(self, api_instance: client.NetworkingV1Api, nameSpace: str, appInstanceId: str) -> list:
+        """
+        :return: Changes to the NetworkPolicies, pairs of operation (create, patch or delete) and NetworkPolicy
+        """
+        # NetworkPolicies created before the label was added are only reconciled with every application (and
+        # labeled by it)
+        kwargs = {} if appInstanceId is None else dict(label_selector="%s=%s" % (APP_LABEL, appInstanceId))
+        with outbound("kubernetes", "list_network_policies"):
+            items = api_instance.list_namespaced_network_policy(namespace=nameSpace, **kwargs).items
+        actual = {}
+        for item in items:
+            if not item.metadata.name.startswith(NETWORK_POLICY_PREFIX):
+                continue
+            spec = api_instance.api_client.sanitize_for_serialization(item.spec)
+            actual[item.metadata.name] = (
+                (item.metadata.annotations or {}).get(APP_ANNOTATION),
+                (item.metadata.labels or {}).get(APP_LABEL),
+                normalized_spec(spec),
+            )
+
+        changes = []
+        for name, networkPolicy in self.desired_network_policies(nameSpace, appInstanceId).items():
+            if name not in actual:
+                changes.append(("create", networkPolicy))
+            elif actual[name] != (
+                networkPolicy["metadata"]["annotations"][APP_ANNOTATION],
+                networkPolicy["metadata"]["labels"][APP_LABEL],
+                normalized_spec(networkPolicy["spec"]),
+            ):
+                changes.append(("patch", networkPolicy))
+            actual.pop(name, None)
+        for name in actual:
+            changes.append(("delete", dict(metadata=dict(name=name, namespace=nameSpace))))
+        return changes
+
+    def desired_network_policies(self, nameSpace: str, appInstanceId: str) -> dict:
+        """
+        :return: NetworkPolicies of the traffic rules by name
+        """
+        query = {} if appInstanceId is None else dict(appInstanceId=appInstanceId)
+        trafficRules = {}
+        for rule in cherrypy.thread_data.db.query_col("trafficRules", query=query, fields=dict(nsId=0)):
+            ruleAppInstanceId = rule.pop("appInstanceId")
+            try:
+                trafficRules.setdefault(ruleAppInstanceId, []).append(TrafficRule.from_json(rule))
+            except (TypeError, KeyError, jsonschema.exceptions.ValidationError) as e:
+                cherrypy.log("Traffic rule %s of app %s is not valid: %s" % (rule.get("trafficRuleId"), ruleAppInstanceId, e))
+
+        networkPolicies = []
+        for ruleAppInstanceId, rules in trafficRules.items():
+            if self.mode == APP:
+                networkPolicies.append(
+                    trafficRulesToNetworkPolicy(
+                        nameSpace=nameSpace,
+                        appInstanceId=ruleAppInstanceId,
+                        data=[rule.toNetworkPolicy() for rule in rules],
+                    )
+                )
+                continue
+            for rule in rules:
+                networkPolicies.append(
+                    trafficRuleToNetworkPolicy(
+                        nameSpace=nameSpace,
+                        appInstanceId=ruleAppInstanceId,
+                        trafficRuleId=rule.trafficRuleId,
+                        data=rule.toNetworkPolicy(),
+                    )
+                )
+        return {networkPolicy["metadata"]["name"]: networkPolicy for networkPolicy in networkPolicies}
+
+    def apply_network_policy_changes(self, api_instance: client.NetworkingV1Api, nameSpace: str, changes: list) -> int:
+        """
+        :return: Number of changes applied
+        """
+        applied = 0
+        for operation, networkPolicy in changes:
+            self.throttle()
+            name = networkPolicy["metadata"]["name"]
+            outcome = "error"
+            try:
+                if operation == "create":
+                    self.create_network_policy(api_instance, nameSpace, networkPolicy)
+                elif operation == "patch":
+                    self.patch_network_policy(api_instance, nameSpace, networkPolicy)
+                else:
+                    try:
+                        with outbound("kubernetes", "delete_network_policy"):
+                            api_instance.delete_namespaced_network_policy(name=name, namespace=nameSpace)
+                    except ApiException as e:
+                        if e.status != 404:
+                            raise
+                outcome = "ok"
+                applied += 1
+            except ApiException as e:
+                cherrypy.log("Network policy %s could not be %sd: %s" % (name, operation, e.reason))
+            finally:
+                metrics.RECONCILE_CHANGES.labels("network_policy", operation, outcome).inc()
+        return applied
+
+    def create_network_policy(self, api_instance: client.NetworkingV1Api, nameSpace: str, networkPolicy: dict):
+        try:
+            with outbound("kubernetes", "create_network_policy"):
+                api_instance.create_namespaced_network_policy(namespace=nameSpace, body=networkPolicy)
+        except ApiException as e:
+            # Created before the annotation was added (or by another pod in the meantime)
+            if e.status != 409:
+                raise
+            self.patch_network_policy(api_instance, nameSpace, networkPolicy)
+
+    def patch_network_policy(self, api_instance: client.NetworkingV1Api, nameSpace: str, networkPolicy: dict):
+        """
+        JSON merge patch, the ingress and egress lists are replaced
+        """
+        with outbound("kubernetes", "patch_network_policy"):
+            api_instance.patch_namespaced_network_policy(
+                name=networkPolicy["metadata"]["name"],
+                namespace=nameSpace,
+                body=networkPolicy,
+                _content_type="application/merge-patch+json",
+            )
+
+    def dns_record_changes(self, appInstanceId: str) -> list:
+        """
+        :return: Changes to the DNS records, pairs of operation (create or delete) and record
+        """
+        db = cherrypy.thread_data.db
+        query = {} if appInstanceId is None else dict(appInstanceId=appInstanceId)
+        applied = {record["domainName"]: record for record in db.query_col(DNS_RECORDS_COLLECTION, query)}
+        desired = {}
+        for rule in db.query_col("dnsRules", dict(query, state="ACTIVE")):
+            desired[rule["domainName"]] = dict(
+                domainName=rule["domainName"],
+                ipAddress=rule["ipAddress"],
+                ttl=rule.get("ttl"),
+                appInstanceId=rule["appInstanceId"],
+            )
+
+        # A changed record is deleted before it is created again
+        changes = [
+            ("delete", record) for domainName, record in applied.items() if desired.get(domainName) != record
+        ]
+        changes.extend(
+            ("create", record) for domainName, record in desired.items() if applied.get(domainName) != record
+        )
+        return changes
+
+    def apply_dns_record_changes(self, changes: list) -> int:
+        """
+        :return: Number of changes applied
+        """
+        if not changes:
+            return 0
+        dnsApiServer = cherrypy.config.get("dns_api_server")
+        # The stale records are removed before the new ones so a renamed domain doesn't point to both IPs
+        removals = [record for operation, record in changes if operation == "delete"]
+        creations = [record for operation, record in changes if operation == "create"]
+        removed = []
+        created = []
+        if removals:
+            applied = dnsApiServer.remove_records(
+                [record["domainName"] for record in removals], throttle=self.throttle
+            )
+            removed = self.applied("delete", removals, applied)
+        if creations:
+            applied = dnsApiServer.create_records(
+                [(record["domainName"], record["ipAddress"], record["ttl"]) for record in creations],
+                throttle=self.throttle,
+            )
+            created = self.applied("create", creations, applied)
+
+        db = cherrypy.thread_data.db
+        if created or removed:
+            db.remove_many(
+                DNS_RECORDS_COLLECTION,
+                {"domainName": {"$in": [record["domainName"] for record in removed + created]}},
+            )
+        if created:
+            db.create_many(DNS_RECORDS_COLLECTION, [dict(record) for record in created])
+        return len(removed) + len(created)
+
+    @staticmethod
+    def applied(operation: str, records: list, results: list) -> list:
+        """
+        :return: The records the DNS API applied (the others are retried by the next sweep)
+        """
+        for record, result in zip(records, results):
+            metrics.RECONCILE_CHANGES.labels("dns_record", operation, "ok" if result else "error").inc()
+            if not result:
+                cherrypy.log("DNS record %s could not be %sd" % (record["domainName"], operation))
+        return [record for record, result in zip(records, results) if result]
+
+
+reconciler = Reconciler(
+    cherrypy.engine,
+    mode=os.environ.get("MEP_NETWORK_POLICY_MODE", RULE).lower(),
+    interval=float(os.environ.get("MEP_RECONCILE_INTERVAL", DEFAULT_INTERVAL)),
+    batch_size=int(os.environ.get("MEP_RECONCILE_BATCH_SIZE", DEFAULT_BATCH_SIZE)),
+    rate=int(os.environ.get("MEP_RECONCILE_RATE", DEFAULT_RATE)),
+)
+
+
+def mount():
+    """
+    Starts reconciling the traffic and DNS rules with the engine (the scheduler must be mounted too)
+    """
+    reconciler.subscribe()
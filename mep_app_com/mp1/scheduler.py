@@ -0,0 +1,137 @@
+# Copyright 2022 Centro ALGORITMI - University of Minho and Instituto de Telecomunicações - Aveiro
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""
+Scheduler of the deferred work (callbacks, Kubernetes and DNS configuration)
+
+Jobs are kept in a heap ordered by the time they are due. A single thread waits for the earliest one
+and hands it to a bounded pool of workers, so a job waiting for its delay costs a heap entry instead
+of a thread parked in time.sleep. Jobs without delay go straight to the pool.
+Workers go through the engine acquire_thread channel like the server threads, so each one gets its
+own database connection (cherrypy.thread_data.db). The pool size is set with MEP_SCHEDULER_WORKERS.
+"""
+
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cherrypy
+from cherrypy.process import plugins
+
+DEFAULT_WORKERS = 8
+
+
+class Scheduler(plugins.SimplePlugin):
+    """
+    Engine plugin running func(*args) after a delay, started and stopped with the engine
+    """
+
+    def __init__(self, bus, workers: int = DEFAULT_WORKERS):
+        super().__init__(bus)
+        self.workers = workers
+        self.jobs = []
+        # Tie breaker of jobs due at the same time (functions can't be compared)
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.executor = None
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="scheduler",
+                initializer=self.bus.publish,
+                initargs=("acquire_thread",),
+            )
+            self.thread = threading.Thread(target=self.release_due_jobs, name="scheduler", daemon=True)
+            self.thread.start()
+        self.bus.log("Scheduler started with %d workers" % self.workers)
+
+    def stop(self):
+        with self.condition:
+            if not self.running:
+                return
+            self.running = False
+            pending = len(self.jobs)
+            self.jobs = []
+            self.condition.notify()
+        self.thread.join()
+        self.executor.shutdown(wait=False)
+        if pending:
+            self.bus.log("Scheduler stopped, %d pending jobs dropped" % pending)
+
+    def schedule(self, delay: float, func, *args):
+        """
+        Run func(*args) in a worker once delay seconds have passed
+
+        :param delay: seconds to wait before running the job (0 runs it as soon as a worker is free)
+        :type delay: float
+        :param func: function to be run
+        :param args: positional arguments of func
+        """
+        with self.condition:
+            if not self.running:
+                raise RuntimeError("Scheduler is not running")
+            if delay <= 0:
+                self.executor.submit(self.run, func, args)
+                return
+            job = (time.monotonic() + delay, next(self.sequence), func, args)
+            heapq.heappush(self.jobs, job)
+            # The scheduler thread only needs to recompute its timeout when this is the earliest job
+            if self.jobs[0] is job:
+                self.condition.notify()
+
+    def pending(self) -> int:
+        """
+        :return: number of jobs waiting for their delay
+        """
+        return len(self.jobs)
+
+    def release_due_jobs(self):
+        with self.condition:
+            while self.running:
+                if not self.jobs:
+                    self.condition.wait()
+                    continue
+                timeout = self.jobs[0][0] - time.monotonic()
+                if timeout > 0:
+                    self.condition.wait(timeout)
+                    continue
+                _, _, func, args = heapq.heappop(self.jobs)
+                self.executor.submit(self.run, func, args)
+
+    def run(self, func, args: tuple):
+        try:
+            func(*args)
+        except Exception:
+            # Same as a failed BackgroundTask, the job is lost but the worker keeps going
+            self.bus.log("Error in scheduled job %r." % func, level=40, traceback=True)
+
+
+scheduler = Scheduler(cherrypy.engine, int(os.environ.get("MEP_SCHEDULER_WORKERS", DEFAULT_WORKERS)))
+
+
+def mount():
+    """
+    Starts the scheduler with the engine
+    """
+    scheduler.subscribe()
@@ -101,6 +101,8 @@ seravailabilitynotificationsubscription_schema = {
         "callbackReference": {"type": "string"},
         "_links": links_schema, #changed
         "filteringCriteria": filteringcriteria_schema,
+        # Extension, merges the notifications of the changes made within the window (seconds)
+        "coalescingWindow": {"type": "number", "minimum": 0, "maximum": 60},
     },
     "additionalProperties": False,
     "required": ["callbackReference"],
@@ -407,6 +409,17 @@ serviceLivenessUpdate_schema = {
     "additionalProperties": False,
 }
 
+# Item of a batch liveness update
+serviceLivenessBatchUpdate_schema = {
+    "type": "object",
+    "properties": {
+        "serviceId": {"type": "string"},
+        "state": serviceLivenessUpdate_schema["properties"]["state"],
+    },
+    "required": ["serviceId", "state"],
+    "additionalProperties": False,
+}
+
 
 trafficFilter_schema = {
     "type": "object",
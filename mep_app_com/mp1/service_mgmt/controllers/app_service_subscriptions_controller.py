@@ -26,6 +26,9 @@ sys.path.append("../../")
 from mp1.models import *
 from .services_callbacks_controller import CallbackController
 
+# Subscriptions accepted by a single batch creation or deletion
+MAX_BATCH_SIZE = 100
+
 
 class ApplicationServicesSubscriptionsController:
     @json_out(cls=NestedEncoder)
@@ -237,6 +240,204 @@ class ApplicationServicesSubscriptionsController:
             return error.message()
 
 
+    @cherrypy.tools.json_in()
+    @json_out(cls=NestedEncoder)
+    def applications_subscriptions_batch_post(self, appInstanceId: str, **kwargs):
+        """
+        Creates several SerAvailabilityNotificationSubscriptions in a single request (not part of MEC 011)
+        The subscriptions are inserted at once and the services they already match are read with a single query,
+        every callbackReference then gets one notification with the services matching any of its subscriptions
+
+        :param appInstanceId: Represents a MEC application instance. Note that the appInstanceId is allocated by the MEC platform manager.
+        :type appInstanceId: str
+
+        :request body: List of the SerAvailabilityNotificationSubscriptions to be created.
+
+        :return: List of SubscriptionResult (in the order of the request) or ProblemDetails
+        HTTP STATUS CODE: 200, 400, 401, 403, 404
+        """
+        error = access_token_error(kwargs)
+        if error is not None:
+            return error.message()
+
+        data = cherrypy.request.json
+        if not isinstance(data, list) or not 0 < len(data) <= MAX_BATCH_SIZE:
+            error_msg = "The request body must be a list of 1 to %d subscriptions." % MAX_BATCH_SIZE
+            error = BadRequest(error_msg)
+            return error.message()
+
+        appStatus = cherrypy.thread_data.db.query_col(
+            "appStatus",
+            query=dict(appInstanceId=appInstanceId),
+            find_one=True,
+        )
+        if appStatus is None:
+            error_msg = "Application %s was not found." % (appInstanceId)
+            error = NotFound(error_msg)
+            return error.message()
+
+        if appStatus['indication'] != IndicationType.READY.name:
+            error_msg = "Application %s is in %s state. This operation not allowed in this state." % (
+            appInstanceId, appStatus["indication"])
+            error = Forbidden(error_msg)
+            return error.message()
+
+        results = [None] * len(data)
+        # (position in the request, subscriptionId, SerAvailabilityNotificationSubscription)
+        created = []
+        for index, item in enumerate(data):
+            try:
+                if isinstance(item, dict):
+                    item = exclude_keys(item, "subscriptionType")
+                availability_notification = SerAvailabilityNotificationSubscription.from_json(item)
+            except (TypeError, jsonschema.exceptions.ValidationError) as e:
+                results[index] = SubscriptionResult(400, problemDetails=BadRequest(e).problem_details())
+                continue
+            created.append((index, str(uuid.uuid4()), availability_notification))
+
+        if created:
+            cherrypy.thread_data.db.create_many(
+                "subscriptions",
+                [
+                    object_to_mongodb_dict(
+                        availability_notification,
+                        extra=dict(appInstanceId=appInstanceId, subscriptionId=subscriptionId),
+                    )
+                    for _, subscriptionId, availability_notification in created
+                ],
+            )
+            self._notify_existing_services(appInstanceId, created)
+
+        subscriptions_uri = cherrypy.url(f"/applications/{appInstanceId}/subscriptions", relative="server")
+        for index, subscriptionId, availability_notification in created:
+            if availability_notification._links is None:
+                availability_notification._links = Links(
+                    _self=LinkType(f"{subscriptions_uri}/{subscriptionId}")
+                )
+            results[index] = SubscriptionResult(
+                201, subscriptionId=subscriptionId, subscription=availability_notification
+            )
+
+        cherrypy.response.status = 200
+        return results
+
+    @staticmethod
+    def _notify_existing_services(appInstanceId: str, created: list):
+        """
+        Send the services that already match the new subscriptions, like the single creation does
+        The services are queried once for every subscription and the subscriptions sharing a callbackReference
+        get a single notification (referencing the first of them) with every service they match
+
+        :param appInstanceId: App that created the subscriptions
+        :type appInstanceId: String
+        :param created: Position in the request, subscriptionId and SerAvailabilityNotificationSubscription
+        :type created: List of (int, String, SerAvailabilityNotificationSubscription)
+        """
+        # As with the single creation, only the subscriptions with filtering criteria are sent the existing services
+        filtered = [
+            (subscriptionId, availability_notification)
+            for _, subscriptionId, availability_notification in created
+            if availability_notification.filteringCriteria
+        ]
+        if not filtered:
+            return
+        query = {"$or": [availability_notification.filteringCriteria.to_query() for _, availability_notification in filtered]}
+        services = list(cherrypy.thread_data.db.query_col("services", query))
+        if not services:
+            return
+
+        # callbackReference -> first subscription and the services matched by all of them (by serInstanceId)
+        groups = {}
+        for subscriptionId, availability_notification in filtered:
+            matched = availability_notification.filteringCriteria.matching_services(services)
+            if not matched:
+                continue
+            group = groups.setdefault(
+                availability_notification.callbackReference, (subscriptionId, availability_notification, {})
+            )
+            for service in matched:
+                group[2].setdefault(service["serInstanceId"], service)
+
+        # default sleep_time is 10 due to the fact that the subscriber hasn't receive his request response
+        # stating that he will receive subscription notifications
+        CallbackController.execute_callbacks(
+            [
+                (
+                    availability_notification,
+                    ServiceAvailabilityNotification.from_json_service_list(
+                        data=list(matched.values()),
+                        subscription=f"/applications/{appInstanceId}/subscriptions/{subscriptionId}",
+                        changeType="ADDED",
+                    ),
+                )
+                for subscriptionId, availability_notification, matched in groups.values()
+            ]
+        )
+
+    @json_out(cls=NestedEncoder)
+    def applications_subscriptions_batch_delete(self, appInstanceId: str, subscription_id: str = None, **kwargs):
+        """
+        Deletes several mecSrvMgmtSubscriptions in a single request (not part of MEC 011)
+
+        :param appInstanceId: Represents a MEC application instance. Note that the appInstanceId is allocated by the MEC platform manager.
+        :type appInstanceId: str
+        :param subscription_id: Comma separated subscriptionIds to be deleted
+        :type subscription_id: str
+
+        :return: List of SubscriptionResult (in the order of the request) or ProblemDetails
+        HTTP STATUS CODE: 200, 400, 401, 403, 404
+        """
+        error = access_token_error(kwargs)
+        if error is not None:
+            return error.message()
+
+        subscriptionIds = [subscriptionId for subscriptionId in (subscription_id or "").split(",") if subscriptionId]
+        if not 0 < len(subscriptionIds) <= MAX_BATCH_SIZE:
+            error_msg = "'subscription_id' must have 1 to %d comma separated subscriptionIds." % MAX_BATCH_SIZE
+            error = BadRequest(error_msg)
+            return error.message()
+
+        appStatus = cherrypy.thread_data.db.query_col(
+            "appStatus",
+            query=dict(appInstanceId=appInstanceId),
+            find_one=True,
+        )
+        if appStatus is None:
+            error_msg = "Application %s was not found." % (appInstanceId)
+            error = NotFound(error_msg)
+            return error.message()
+        if appStatus['indication'] != IndicationType.READY.name:
+            error_msg = "Application %s is in %s state. This operation not allowed in this state." % (
+                appInstanceId, appStatus["indication"])
+            error = Forbidden(error_msg)
+            return error.message()
+
+        existing = cherrypy.thread_data.db.query_col(
+            "subscriptions",
+            query=dict(appInstanceId=appInstanceId, subscriptionId=list(set(subscriptionIds))),
+            fields=dict(subscriptionId=1),
+        )
+        existing = {subscription["subscriptionId"] for subscription in existing}
+        if existing:
+            cherrypy.thread_data.db.remove_many(
+                "subscriptions",
+                {"appInstanceId": appInstanceId, "subscriptionId": {"$in": list(existing)}},
+            )
+
+        results = []
+        for subscriptionId in subscriptionIds:
+            if subscriptionId in existing:
+                results.append(SubscriptionResult(204, subscriptionId=subscriptionId))
+            else:
+                error_msg = "Subscription %s was not found." % (subscriptionId)
+                results.append(
+                    SubscriptionResult(
+                        404, subscriptionId=subscriptionId, problemDetails=NotFound(error_msg).problem_details()
+                    )
+                )
+        cherrypy.response.status = 200
+        return results
+
     @json_out(cls=NestedEncoder)
     def applications_subscriptions_get_with_subscription_id(
         self, appInstanceId: str, subscriptionId: str, **kwargs
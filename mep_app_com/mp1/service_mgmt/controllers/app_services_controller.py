@@ -22,7 +22,11 @@ from mp1.models import *
 import uuid
 from .services_callbacks_controller import CallbackController
 import jsonschema
-from deepdiff import DeepDiff
+from mp1.request_timing import span
+
+# Services accepted by a single batch registration
+MAX_BATCH_SIZE = 100
+
 
 class ApplicationServicesController:
     @json_out(cls=NestedEncoder)
@@ -147,56 +151,19 @@ class ApplicationServicesController:
         # TODO: When OAuth gets updated one should request, when it's a new 
         # service, a request body with correspondent parameters to check if this
         # app have permission to subscript notifications
-        try:
-            access_token = kwargs["access_token"]
-        except KeyError:
-            error_msg = "No access token provided."
-            error = Unauthorized(error_msg)
+        error = access_token_error(kwargs)
+        if error is not None:
             return error.message()
-            
-        if access_token is None:
-            error_msg = "No access token provided."
-            error = Unauthorized(error_msg)
-            return error.message()
-        
-        oauth = cherrypy.config.get("oauth_server")
-        if oauth.validate_token(access_token) is False:
-            error_msg = "Invalid access token."
-            error = Unauthorized(error_msg)
-            return error.message()
-
 
         # TODO ADD RATE LIMITING OTHERWISE APP CAN CONTINOUSLY GENERATE NEW SERVICES
         # TODO NEEDS TO BE RATE LIMIT SINCE AN APP CAN HAVE N SERVICES
         data = cherrypy.request.json
         # The process of generating the class allows for "automatic" validation of the json
         try:
-            serviceInfo = ServiceInfo.from_json(data)
-
-            # checks if there is a service info in the request, if it does not have it, create one
-            # Add serInstanceId (uuid) to serviceInfo according to Section 8.1.2.2
-            # serInstaceId is used as serviceId appServices
-            if serviceInfo.serInstanceId is None:
-                serviceInfo.serInstanceId = str(uuid.uuid4())
-
-            # Add _links data to serviceInfo
-            server_self_referencing_uri = cherrypy.url(
-                qs=cherrypy.request.query_string, relative="server"
-            )
-            _links = Links(
-                liveness=LinkType(
-                    f"/mec_service_mgmt/v1/liveness/{appInstanceId}/{serviceInfo.serInstanceId}"
-                )
-            )
-            serviceInfo._links = _links
+            with span("validate"):
+                serviceInfo = self._new_service_info(appInstanceId, data)
             notify_changeType = None
 
-            if serviceInfo.livenessInterval is None:
-                serviceInfo.livenessInterval = 0
-
-            # TODO serCategory IF NOT PRESENT NEEDS TO BE SET BY MEP (SOMEHOW TELL ME ETSI)
-            # Should receive it from MEPM
-
         except (TypeError, jsonschema.exceptions.ValidationError) as e:
             error = BadRequest(e)
             return error.message()
@@ -235,26 +202,24 @@ class ApplicationServicesController:
                 )
 
                 serviceInfo.serInstanceId = appService["serInstanceId"]
+                serviceInfo._links = self._links(appInstanceId, serviceInfo.serInstanceId)
 
-                diff = DeepDiff(service, object_to_mongodb_dict(serviceInfo), ignore_order=True)
+                with span("diff"):
+                    diff = serviceInfo.diff(service)
 
                 # If something changed in the service, must update db
                 if (len(diff) > 0):
 
-                    # At least one attribute of the service other than state was changed. The change may or may not include changing the state.
-                    notify_changeType = ChangeType.ATTRIBUTES_CHANGED
+                    # STATE_CHANGED if only the state of the service was changed, ATTRIBUTES_CHANGED otherwise
+                    notify_changeType = diff.changeType
 
-                    # Only the state of the service was changed.
-                    if len(diff) == 1 and 'values_changed' in diff and "root['state']" in diff[
-                        'values_changed'] and len(diff['values_changed']) == 1:
-                        notify_changeType = ChangeType.STATE_CHANGED
-
-                    # Checks new service state and updates
-                    cherrypy.thread_data.db.update(
-                        "services",
-                        query=dict(serName=serviceInfo.serName),
-                        newdata=object_to_mongodb_dict(serviceInfo)
-                    )
+                    # Only the fields that changed are written
+                    if diff.changed:
+                        cherrypy.thread_data.db.update(
+                            "services",
+                            query=dict(serName=serviceInfo.serName),
+                            newdata=diff.changed
+                        )
 
                     cherrypy.thread_data.db.update(
                         "appStatus",
@@ -356,6 +321,214 @@ class ApplicationServicesController:
             error = Forbidden(error_msg)
             return error.message()
 
+    @cherrypy.tools.json_in()
+    @json_out(cls=NestedEncoder)
+    def applications_services_batch_post(self, appInstanceId: str, **kwargs):
+        """
+        This method is used to create (or update, as applications_services_post does) several mecService resources
+        in a single request. Every ServiceInfo is validated first, the valid ones are then stored with a single
+        appStatus update and a single insert and each subscriber gets one notification with all the services
+        matching its filtering criteria (not part of MEC 011)
+        :param appInstanceId: Represents a MEC application instance. Note that the appInstanceId is allocated by the MEC platform manager.
+        :type appInstanceId: String
+        :return: List of ServiceRegistrationResult (in the order of the request) or ProblemDetails
+        HTTP STATUS CODE: 200, 400, 401, 403, 404
+        """
+        error = access_token_error(kwargs)
+        if error is not None:
+            return error.message()
+
+        data = cherrypy.request.json
+        if not isinstance(data, list) or not 0 < len(data) <= MAX_BATCH_SIZE:
+            error_msg = "The request body must be a list of 1 to %d ServiceInfo." % MAX_BATCH_SIZE
+            error = BadRequest(error_msg)
+            return error.message()
+
+        appStatus = cherrypy.thread_data.db.query_col(
+            "appStatus",
+            query=dict(appInstanceId=appInstanceId),
+            find_one=True,
+        )
+        if appStatus is None:
+            error_msg = "Application %s was not found." % (appInstanceId)
+            error = NotFound(error_msg)
+            return error.message()
+        if appStatus['indication'] != IndicationType.READY.name:
+            error_msg = "Application %s is in %s state. This operation not allowed in this state." % (
+            appInstanceId, appStatus["indication"])
+            error = Forbidden(error_msg)
+            return error.message()
+
+        results = [None] * len(data)
+        # serName -> (position in the request, ServiceInfo)
+        services = {}
+        with span("validate"):
+            for index, item in enumerate(data):
+                try:
+                    serviceInfo = self._new_service_info(appInstanceId, item)
+                except (TypeError, jsonschema.exceptions.ValidationError) as e:
+                    results[index] = ServiceRegistrationResult(400, problemDetails=BadRequest(e).problem_details())
+                    continue
+                if serviceInfo.serName in services:
+                    error_msg = "Service %s is more than once in the request." % serviceInfo.serName
+                    results[index] = ServiceRegistrationResult(
+                        400, problemDetails=BadRequest(error_msg).problem_details()
+                    )
+                    continue
+                services[serviceInfo.serName] = (index, serviceInfo)
+
+        # The services of the app being updated are read at once
+        appServices = {appService["serName"]: appService for appService in appStatus["services"]}
+        stored = cherrypy.thread_data.db.query_col(
+            "services",
+            query=dict(
+                serInstanceId=[
+                    appServices[serName]["serInstanceId"] for serName in services if serName in appServices
+                ]
+            ),
+        )
+        stored = {service["serInstanceId"]: service for service in stored}
+
+        created = []
+        # (ServiceInfo, ChangeType) of every service the subscribers are notified about
+        changes = []
+        for serName, (index, serviceInfo) in services.items():
+            appService = appServices.get(serName)
+            if appService is None:
+                appStatus["services"].append({"serName": serviceInfo.serName,
+                                              "serInstanceId": serviceInfo.serInstanceId,
+                                              "state": serviceInfo.state.name,
+                                              "liveness": {
+                                                    "interval": serviceInfo.livenessInterval,
+                                                    "update": 0
+                                              },
+                                              "timeStamp": {
+                                                    "seconds": 0,
+                                                    "nanoseconds": 0
+                                                }
+                                              })
+                created.append(serviceInfo)
+                changes.append((serviceInfo, ChangeType.ADDED))
+                results[index] = ServiceRegistrationResult(201, serviceInfo=serviceInfo)
+                continue
+
+            appService["state"] = serviceInfo.state.name
+            serviceInfo.serInstanceId = appService["serInstanceId"]
+            serviceInfo._links = self._links(appInstanceId, serviceInfo.serInstanceId)
+            with span("diff"):
+                diff = serviceInfo.diff(stored.get(serviceInfo.serInstanceId))
+            if len(diff) > 0:
+                changes.append((serviceInfo, diff.changeType))
+                # Only the fields that changed are written
+                if diff.changed:
+                    cherrypy.thread_data.db.update(
+                        "services",
+                        query=dict(serInstanceId=serviceInfo.serInstanceId),
+                        newdata=diff.changed
+                    )
+            results[index] = ServiceRegistrationResult(200, serviceInfo=serviceInfo)
+
+        if changes:
+            cherrypy.thread_data.db.update(
+                "appStatus",
+                query=dict(appInstanceId=appInstanceId),
+                newdata=dict(services=appStatus["services"])
+            )
+        if created:
+            cherrypy.thread_data.db.create_many(
+                "services", [object_to_mongodb_dict(serviceInfo) for serviceInfo in created]
+            )
+        cherrypy.log(
+            "Application %s registered %d services: %d new, %d changed, %d invalid."
+            % (appInstanceId, len(data), len(created), len(changes) - len(created), len(data) - len(services))
+        )
+
+        if changes:
+            self._notify_changes(changes)
+
+        cherrypy.response.status = 200
+        return results
+
+    @staticmethod
+    def _notify_changes(changes: list):
+        """
+        Notify the subscribers of a batch of changed services, the subscriptions are queried once and
+        each subscriber gets a single notification with the services that match its filtering criteria
+
+        :param changes: Pairs of ServiceInfo and ChangeType
+        :type changes: List of (ServiceInfo, ChangeType)
+        """
+        query = {"$or": [serviceInfo.to_filtering_criteria_json() for serviceInfo, _ in changes]}
+        subscriptions = cherrypy.thread_data.db.query_col("subscriptions", query)
+        # Subscribers matching the same services share the notification (and its encoding)
+        groups = {}
+        for subscription in subscriptions:
+            matched = tuple(
+                position
+                for position, (serviceInfo, _) in enumerate(changes)
+                if serviceInfo.matches(subscription.get("filteringCriteria"))
+            )
+            if not matched:
+                continue
+            appInstanceId = subscription.pop("appInstanceId")
+            subscriptionId = subscription.pop("subscriptionId")
+            subscription.pop("subscriptionType")
+            availability_notification = SerAvailabilityNotificationSubscription.from_json(subscription)
+            availability_notification.appInstanceId = appInstanceId
+            availability_notification.subscriptionId = subscriptionId
+            groups.setdefault(matched, []).append(availability_notification)
+
+        for matched, availability_notifications in groups.items():
+            serviceReferences = [
+                ServiceAvailabilityNotification.ServiceReferences.from_json(
+                    data=json.loads(json.dumps(changes[position][0], cls=NestedEncoder)),
+                    changeType=changes[position][1].name,
+                )
+                for position in matched
+            ]
+            CallbackController.execute_callback(
+                availability_notifications=availability_notifications,
+                data=ServiceAvailabilityNotification(serviceReferences=serviceReferences, _links=None),
+                sleep_time=0,
+            )
+
+    @staticmethod
+    def _new_service_info(appInstanceId: str, data: dict) -> ServiceInfo:
+        """
+        Validate a ServiceInfo sent by an app and complete it with what the MEP sets
+
+        :param appInstanceId: App registering the service
+        :type appInstanceId: String
+        :param data: ServiceInfo in json
+        :type data: dict
+        :return: ServiceInfo
+        Raises TypeError, jsonschema.exceptions.ValidationError
+        """
+        serviceInfo = ServiceInfo.from_json(data)
+
+        # checks if there is a service info in the request, if it does not have it, create one
+        # Add serInstanceId (uuid) to serviceInfo according to Section 8.1.2.2
+        # serInstaceId is used as serviceId appServices
+        if serviceInfo.serInstanceId is None:
+            serviceInfo.serInstanceId = str(uuid.uuid4())
+
+        # Add _links data to serviceInfo
+        serviceInfo._links = ApplicationServicesController._links(appInstanceId, serviceInfo.serInstanceId)
+
+        if serviceInfo.livenessInterval is None:
+            serviceInfo.livenessInterval = 0
+
+        # TODO serCategory IF NOT PRESENT NEEDS TO BE SET BY MEP (SOMEHOW TELL ME ETSI)
+        # Should receive it from MEPM
+        return serviceInfo
+
+    @staticmethod
+    def _links(appInstanceId: str, serInstanceId: str) -> Links:
+        """
+        _links of a registered service (its liveness resource)
+        """
+        return Links(liveness=LinkType(f"/mec_service_mgmt/v1/liveness/{appInstanceId}/{serInstanceId}"))
+
     @json_out(cls=NestedEncoder)
     def applicaton_services_get_with_service_id(
         self, 
@@ -471,7 +644,8 @@ class ApplicationServicesController:
                 data.pop('serInstanceId')
 
 
-            serviceInfo = ServiceInfo.from_json(data)
+            with span("validate"):
+                serviceInfo = ServiceInfo.from_json(data)
             # Add _links data to serviceInfo
             server_self_referencing_uri = cherrypy.url(
                 qs=cherrypy.request.query_string, relative="server"
@@ -523,25 +697,22 @@ class ApplicationServicesController:
 
                 serviceInfo.serInstanceId = appService["serInstanceId"]
 
-                diff = DeepDiff(service, object_to_mongodb_dict(serviceInfo), ignore_order=True)
+                with span("diff"):
+                    diff = serviceInfo.diff(service)
 
                 # If something changed in the service, must update db
                 if (len(diff) > 0):
 
-                    # At least one attribute of the service other than state was changed. The change may or may not include changing the state.
-                    notify_changeType = ChangeType.ATTRIBUTES_CHANGED
+                    # STATE_CHANGED if only the state of the service was changed, ATTRIBUTES_CHANGED otherwise
+                    notify_changeType = diff.changeType
 
-                    # Only the state of the service was changed.
-                    if len(diff) == 1 and 'values_changed' in diff and "root['state']" in diff[
-                        'values_changed'] and len(diff['values_changed']) == 1:
-                        notify_changeType = ChangeType.STATE_CHANGED
-
-                    # Checks new service state and updates
-                    cherrypy.thread_data.db.update(
-                        "services",
-                        query=dict(serName=serviceInfo.serName),
-                        newdata=object_to_mongodb_dict(serviceInfo)
-                    )
+                    # Only the fields that changed are written
+                    if diff.changed:
+                        cherrypy.thread_data.db.update(
+                            "services",
+                            query=dict(serName=serviceInfo.serName),
+                            newdata=diff.changed
+                        )
 
                     cherrypy.thread_data.db.update(
                         "appStatus",
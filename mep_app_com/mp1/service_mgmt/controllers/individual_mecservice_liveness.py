@@ -21,6 +21,9 @@ import jsonschema
 sys.path.append("../../")
 from mp1.models import *
 
+# Services accepted by a single batch liveness update
+MAX_BATCH_SIZE = 100
+
 
 class InvidualMecServiceLivenessController:
     
@@ -69,43 +72,131 @@ class InvidualMecServiceLivenessController:
             return error.message()
 
         # Checks if service already exists or if it is a new one
-        hasService = False
-        for appService in appStatus["services"]:
-            if appService["serInstanceId"] == serviceId:
-                hasService = True
+        appService = None
+        for service in appStatus["services"]:
+            if service["serInstanceId"] == serviceId:
+                appService = service
                 break
 
-        # If it already exists updates service state
-        if hasService is False:
-            error_msg = "Service %s was not found." % (serviceId)
+        livenessInfo = self._heartbeat(appService, serviceId, livenessUpdate)
+        if isinstance(livenessInfo, Error):
+            return livenessInfo.message()
+
+        if livenessInfo is None:
+            cherrypy.response.status = 204
+
+        cherrypy.thread_data.db.update(
+            "appStatus",
+            query=dict(appInstanceId=appInstanceId),
+            newdata=dict(services=appStatus["services"])
+        )
+
+        return livenessInfo
+
+    @cherrypy.tools.json_in()
+    @json_out(cls=NestedEncoder)
+    def mecServiceLiveness_batch_update(self, appInstanceId: str, **kwargs):
+        """
+        Liveness updates of several services of an app in a single request (not part of MEC 011)
+        appStatus is read and written once for the whole batch
+        :request body: List of {"serviceId": ..., "state": ...}
+        :return: List of ServiceLivenessResult (in the order of the request) or ProblemDetails
+        HTTP STATUS CODE: 200, 400, 403, 404
+        """
+        data = cherrypy.request.json
+        if not isinstance(data, list) or not 0 < len(data) <= MAX_BATCH_SIZE:
+            error_msg = "The request body must be a list of 1 to %d liveness updates." % MAX_BATCH_SIZE
+            error = BadRequest(error_msg)
+            return error.message()
+
+        #  If kwargs isn't None the request was made with invalid atributes
+        if kwargs != {}:
+            error_msg = "Invalid attribute(s): %s" % (str(kwargs))
+            error = BadRequest(error_msg)
+            return error.message()
+
+        appStatus = cherrypy.thread_data.db.query_col(
+            "appStatus",
+            query=dict(appInstanceId=appInstanceId),
+            find_one=True,
+        )
+        if appStatus is None:
+            error_msg = "Application %s was not found." % (appInstanceId)
             error = NotFound(error_msg)
             return error.message()
+        if appStatus["indication"] != IndicationType.READY.name:
+            error_msg = "Application %s is in %s state. This operation not allowed in this state." % (
+            appInstanceId, appStatus["indication"])
+            error = Forbidden(error_msg)
+            return error.message()
+
+        appServices = {appService["serInstanceId"]: appService for appService in appStatus["services"]}
+        results = []
+        updated = False
+        for item in data:
+            serviceId = item.get("serviceId") if isinstance(item, dict) else None
+            try:
+                validate(instance=item, schema=serviceLivenessBatchUpdate_schema)
+            except jsonschema.exceptions.ValidationError as e:
+                results.append(ServiceLivenessResult(serviceId, 400, problemDetails=BadRequest(e).problem_details()))
+                continue
+
+            livenessInfo = self._heartbeat(
+                appServices.get(serviceId), serviceId, ServiceLivenessUpdate(item["state"])
+            )
+            if isinstance(livenessInfo, Error):
+                results.append(
+                    ServiceLivenessResult(serviceId, livenessInfo.status, problemDetails=livenessInfo.problem_details())
+                )
+                continue
+            updated = True
+            if livenessInfo is None:
+                results.append(ServiceLivenessResult(serviceId, 204))
+            else:
+                results.append(ServiceLivenessResult(serviceId, 200, livenessInfo=livenessInfo))
+
+        if updated:
+            cherrypy.thread_data.db.update(
+                "appStatus",
+                query=dict(appInstanceId=appInstanceId),
+                newdata=dict(services=appStatus["services"])
+            )
+
+        cherrypy.response.status = 200
+        return results
+
+    @staticmethod
+    def _heartbeat(appService: dict, serviceId: str, livenessUpdate: ServiceLivenessUpdate):
+        """
+        Apply a liveness update to a service of appStatus, the caller writes appStatus back
+
+        :param appService: Entry of the service in appStatus["services"] (None if the app doesn't have it)
+        :type appService: dict
+        :param serviceId: Service being updated
+        :type serviceId: String
+        :param livenessUpdate: Update sent by the app
+        :type livenessUpdate: ServiceLivenessUpdate
+        :return: ServiceLivenessInfo, None if the MEP wasn't waiting for the update (i.e 204) or the Error
+        """
+        # If it already exists updates service state
+        if appService is None:
+            error_msg = "Service %s was not found." % (serviceId)
+            return NotFound(error_msg)
 
         if appService["state"] == ServiceState.INACTIVE.name:
             error_msg = "Service %s is in %s state. This operation not allowed in this state." % (
             serviceId, appService["state"])
-            error = Conflict(error_msg)
-            return error.message()
-
+            return Conflict(error_msg)
 
         appService["timeStamp"] = TimeStamp(time_ns(), time_ns()).to_json()
         if appService["state"] == ServiceState.SUSPENDED.name and livenessUpdate.state == ServiceState.ACTIVE.name:
             appService["state"] = ServiceState.ACTIVE.name
-                
-        livenessInfo = None
 
         if appService["liveness"]["update"] == 0:
-            cherrypy.response.status = 204
-        else:
-            livenessInfo = ServiceLivenessInfo(appService["state"], appService["timeStamp"], appService["liveness"]["interval"])
-            appService["liveness"]["update"] = 0
-
-        cherrypy.thread_data.db.update(
-            "appStatus",
-            query=dict(appInstanceId=appInstanceId),
-            newdata=dict(services=appStatus["services"])
-        )
+            return None
 
+        livenessInfo = ServiceLivenessInfo(appService["state"], appService["timeStamp"], appService["liveness"]["interval"])
+        appService["liveness"]["update"] = 0
         return livenessInfo
 
     @json_out(cls=NestedEncoder)
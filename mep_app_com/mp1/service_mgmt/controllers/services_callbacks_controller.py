@@ -13,11 +13,9 @@
 #     limitations under the License.
 
 import cherrypy
-import requests
 from mp1.models import *
-import time
 from typing import Union
-from cherrypy.process.plugins import BackgroundTask
+from mp1.outbox import outbox
 
 
 class CallbackController:
@@ -32,48 +30,19 @@ class CallbackController:
     ):
         """
         Send the callback to the specified url (i.e callbackreference)
-        Start a cherrypy BackgroundTask https://docs.cherrypy.dev/en/latest/pkg/cherrypy.process.plugins.html
-        Pass the callbackreference (i.e url to call) and the data
+        The notifications are written to the notification outbox (see outbox.py) and delivered from there
+        after sleep_time seconds, with retries if the subscriber can't be reached
+        Subscribers with a coalescingWindow get the changes made within their window in a single notification
 
         :param availability_notifications: The python object containing the callbackreference
         :type availability_notifications: AvailabilityNotification
         :param data: Data containing the services that match the filtering criteria of the subscriber
-        :type data: Json/Dict
+        :type data: ServiceAvailabilityNotification
+        :param sleep_time: Seconds to wait before sending the callback
+        :type sleep_time: int
         """
-        if availability_notifications:
-            callback_task = BackgroundTask(
-                interval=0,
-                function=CallbackController._callback_function,
-                args=[availability_notifications, data, sleep_time],
-                bus=cherrypy.engine,
-            )
-            # Add the callback_task to itself to allow to cancel itself
-            # (needed since BackgroundTask is usually repeatable)
-            callback_task.args.insert(0, callback_task)
-            callback_task.start()
-
-    @staticmethod
-    def _callback_function(
-        task,
-        availability_notifications: Union[
-            List[SerAvailabilityNotificationSubscription],
-            SerAvailabilityNotificationSubscription,
-        ],
-        data: dict,
-        sleep_time: int,
-    ):
-        """
-        :param task: Reference to the background task itself
-        :type task: BackgroundTask
-        :param availability_notifications:  Used to obtain the callback references
-        :type availability_notifications: SerAvailabilityNotificationSubscription or List of SerAvailabilityNotificationSubscription (each one contains a callbackreference)
-        :param data: Data containing the information to be sent in a callback
-        :type data: Json/Dict
-        """
-        cherrypy.log("Starting callback function")
-        # Wait for a bit since client might still be receiving the answer from the subscriptions and thus might
-        # not be ready to receive the callback
-        time.sleep(sleep_time)
+        if not availability_notifications:
+            return
         # Check if the type is a list or not due to the two instances where callback can be used
         # Instance 1: A new services is created and thus we need to check all subscriptions and
         # send the new service to each
@@ -83,25 +52,84 @@ class CallbackController:
         # Instance 1 - A list of SerAvailabilityNotifications and the data of the newly added service
         # Add the _links.subscription
         if isinstance(availability_notifications, list):
+            # Only the subscription (_links) differs between subscribers so the rest of the
+            # ServiceAvailabilityNotification is encoded once and shared by every request
+            template = None
+            serviceReferences = None
+            notifications = []
             for callbackUrl in availability_notifications:
                 # When using this method (i.e when a service registers and there are various subscribers)
                 # we need to append the subscription (_links) parameter to the ServiceAvailabilityNotification
                 # this data is storage in the SerAvailabilityNotificationSubscription object
                 appInstanceId = callbackUrl.appInstanceId
                 subscriptionId = callbackUrl.subscriptionId
-                data._links = Subscription(
-                    href=f"/applications/{appInstanceId}/subscriptions/{subscriptionId}"
-                )
-                requests.post(
-                    callbackUrl.callbackReference,
-                    data=json.dumps(data, cls=NestedEncoder),
-                    headers={"Content-Type": "application/json"},
-                )
+                subscription = f"/applications/{appInstanceId}/subscriptions/{subscriptionId}"
+                if callbackUrl.coalescingWindow:
+                    if serviceReferences is None:
+                        serviceReferences = json.loads(json.dumps(data.serviceReferences, cls=NestedEncoder))
+                    outbox.coalesce(
+                        "service_availability",
+                        key=subscriptionId,
+                        callbackReference=callbackUrl.callbackReference,
+                        items=serviceReferences,
+                        window=max(callbackUrl.coalescingWindow, sleep_time),
+                        envelope=dict(subscription=subscription),
+                    )
+                    continue
+                if template is None:
+                    template = data.to_template()
+                notifications.append((callbackUrl.callbackReference, template.render(subscription)))
         # Instance 2
         else:
-            requests.post(
-                availability_notifications.callbackReference,
-                data=json.dumps(data, cls=NestedEncoder),
-                headers={"Content-Type": "application/json"},
-            )
-        task.cancel()
+            notifications = [
+                (
+                    availability_notifications.callbackReference,
+                    json.dumps(data, cls=NestedEncoder).encode("utf-8"),
+                )
+            ]
+        # Wait for a bit since client might still be receiving the answer from the subscriptions and thus might
+        # not be ready to receive the callback
+        outbox.enqueue("service_availability", notifications, delay=sleep_time)
+
+    @staticmethod
+    def execute_callbacks(notifications: list, sleep_time: int = 10):
+        """
+        Send a different notification to each subscriber, written to the outbox at once
+        (e.g the services that already match the subscriptions of a batch)
+
+        :param notifications: Pairs of subscription and the notification it gets
+        :type notifications: List of (SerAvailabilityNotificationSubscription, ServiceAvailabilityNotification)
+        :param sleep_time: Seconds to wait before sending the callbacks
+        :type sleep_time: int
+        """
+        outbox.enqueue(
+            "service_availability",
+            [
+                (subscription.callbackReference, json.dumps(data, cls=NestedEncoder).encode("utf-8"))
+                for subscription, data in notifications
+            ],
+            delay=sleep_time,
+        )
+
+    @staticmethod
+    def render_coalesced(notification: dict):
+        """
+        Encode a coalesced ServiceAvailabilityNotification from its outbox entry
+
+        :param notification: Outbox entry with the changes of the window (items) and the subscription (envelope)
+        :type notification: dict
+        :return: Request body or None if the changes cancel each other out
+        """
+        serviceReferences = ServiceAvailabilityNotification.coalesce(notification["items"])
+        if not serviceReferences:
+            return None
+        return json.dumps(
+            ServiceAvailabilityNotification(
+                serviceReferences=serviceReferences,
+                _links=Subscription(href=notification["envelope"]["subscription"]),
+            ),
+            cls=NestedEncoder,
+        ).encode("utf-8")
+
+
+outbox.renderer("service_availability", CallbackController.render_coalesced)
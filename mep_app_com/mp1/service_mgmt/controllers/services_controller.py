@@ -19,6 +19,22 @@ from mp1.models import *
 import jsonschema
 import uuid
 
+# Indications of apps whose services must not be discovered
+NOT_READY_INDICATIONS = [OperationActionType.STOPPING.name, OperationActionType.TERMINATING.name]
+
+
+def unavailable_services() -> list:
+    """
+    Obtain the serInstanceIds of the services produced by apps which state IS NOT READY
+
+    :return: list of serInstanceIds
+    """
+    return cherrypy.thread_data.db.distinct(
+        "appStatus",
+        "services.serInstanceId",
+        {"indication": {"$in": NOT_READY_INDICATIONS}},
+    )
+
 
 class ServicesController:
     #@url_query_validator(cls=ServicesQueryValidator)
@@ -83,7 +99,10 @@ class ServicesController:
                     error = BadRequest(error_msg)
                     return error.message()
 
-            result = cherrypy.thread_data.db.query_col("services", query)
+            # Services of apps which state IS NOT READY are excluded by the query itself
+            result = cherrypy.thread_data.db.query_col(
+                "services", query, raw_query={"serInstanceId": {"$nin": unavailable_services()}}
+            )
             result = list(result)
 
         except jsonschema.exceptions.ValidationError as e:
@@ -97,27 +116,6 @@ class ServicesController:
             error = BadRequest(error_msg)
             return error.message()
 
-        # Apps which state IS NOT READY
-        appNotReady = cherrypy.thread_data.db.query_col(
-            "appStatus",
-            query={"$or": [{"indication": "STOPPING"}, {"indication": "TERMINATING"}]},)
-
-        appNotReady = list(appNotReady)
-        if appNotReady:
-            # create a list of serInstanceIds from not ready apps
-            servs_to_del = []
-            for app in appNotReady:
-                for service in app["services"]:
-                    servs_to_del.append(service["serInstanceId"])
-            
-            print(f"servs_to_del:\n{servs_to_del}")
-            # remove them from the result (list of all services)
-            res = []
-            for idx, service_info in enumerate(result):
-                if service_info["serInstanceId"] not in servs_to_del:
-                    res.append(service_info)
-            print(f"result:\n{res}")
-            return res
         # Data is a pymongo cursor we first need to convert it into a json serializable object
         # Since this query is supposed to return various valid Services we can simply convert into a list
         return result
@@ -152,20 +150,15 @@ class ServicesController:
         data = cherrypy.thread_data.db.query_col("services", query)
         result = list(data)
 
-        # Apps which state IS NOT READY
-        appNotReady = cherrypy.thread_data.db.query_col(
+        # Check if the service producing app IS NOT READY
+        appNotReady = cherrypy.thread_data.db.count_documents(
             "appStatus",
-            query={"$or": [{"indication": "STOPPING"}, {"indication": "TERMINATING"}]},)
-        
-        appNotReady = list(appNotReady)
-        if appNotReady:
-            for app in appNotReady:
-                for service in app["services"]:
-                    if service["serInstanceId"] == serviceId:
-                        #return list()
-                        error_msg = "Service producing app isn't in READY state."
-                        error = Forbidden(error_msg)
-                        return error.message()
+            query={"indication": {"$in": NOT_READY_INDICATIONS}, "services.serInstanceId": str(serviceId)},)
+
+        if appNotReady > 0:
+            error_msg = "Service producing app isn't in READY state."
+            error = Forbidden(error_msg)
+            return error.message()
 
         return result
 
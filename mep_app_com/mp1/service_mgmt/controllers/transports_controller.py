@@ -17,6 +17,7 @@ import cherrypy
 
 sys.path.append("../../")
 from mp1.models import *
+from mp1.static_responses import static_responses
 
 
 class TransportsController:
@@ -33,9 +34,6 @@ class TransportsController:
             error_msg = "Invalid attribute(s): %s" % (str(kwargs))
             error = BadRequest(error_msg)
             return error.message()
-        
-        data = json.loads(
-            '{"id":"0","name":"REST","description":"REST API","type":"REST_HTTP","protocol":"HTTP","version":"2.0","security":{"oAuth2Info":{"grantTypes":["OAUTH2_CLIENT_CREDENTIALS"],"tokenEndpoint":"/mec_app_support/v1/credentials/"}},"implSpecificInfo":{}}'
-        )
-        # transportInfo = TransportInfo.from_json(data)
-        return data
+
+        # Built once from the static response configuration
+        return static_responses.get("transports").send()
@@ -0,0 +1,169 @@
+# Copyright 2022 Centro ALGORITMI - University of Minho and Instituto de Telecomunicações - Aveiro
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+import json
+import os
+import threading
+from hashlib import md5
+
+import cherrypy
+
+from . import models
+from .enums import NtpServerAddrType, AuthenticationOption
+from .utils import NestedEncoder
+
+# Transport advertised when no configuration file is provided
+DEFAULT_TRANSPORTS = {
+    "id": "0",
+    "name": "REST",
+    "description": "REST API",
+    "type": "REST_HTTP",
+    "protocol": "HTTP",
+    "version": "2.0",
+    "security": {
+        "oAuth2Info": {
+            "grantTypes": ["OAUTH2_CLIENT_CREDENTIALS"],
+            "tokenEndpoint": "/mec_app_support/v1/credentials/",
+        }
+    },
+    "implSpecificInfo": {},
+}
+
+DEFAULT_MAX_AGE = 300
+
+
+class StaticResponse:
+    """
+    Payload that is identical for every request, kept as the bytes that are sent on the wire
+    together with its ETag and Cache-Control headers
+    """
+
+    def __init__(self, payload, max_age: int = DEFAULT_MAX_AGE):
+        self.body = json.dumps(payload, cls=NestedEncoder).encode("utf-8")
+        self.etag = '"%s"' % md5(self.body).hexdigest()
+        self.headers = {
+            "Content-Type": "application/json",
+            "ETag": self.etag,
+            "Cache-Control": "public, max-age=%d" % max_age,
+        }
+
+    def send(self) -> bytes:
+        """
+        Write the precomputed headers into the current response and return the body
+        If the client already holds this representation an empty 304 is sent instead
+
+        :return: bytes ready to be returned by the handler
+        """
+        cherrypy.response.headers.update(self.headers)
+        if_none_match = cherrypy.request.headers.get("If-None-Match")
+        if if_none_match is not None:
+            etags = [etag.strip() for etag in if_none_match.split(",")]
+            if self.etag in etags or "*" in etags:
+                cherrypy.response.status = 304
+                return b""
+        return self.body
+
+
+class StaticResponseCache:
+    """
+    Builds each registered payload once and keeps it until the configuration is reloaded
+    """
+
+    def __init__(self):
+        self.builders = {}
+        self.responses = {}
+        self.lock = threading.Lock()
+
+    def register(self, name: str, builder):
+        self.builders[name] = builder
+
+    def get(self, name: str) -> StaticResponse:
+        response = self.responses.get(name)
+        if response is None:
+            with self.lock:
+                response = self.responses.get(name)
+                if response is None:
+                    config = load_static_config()
+                    response = StaticResponse(
+                        self.builders[name](config),
+                        config.get("maxAge", DEFAULT_MAX_AGE),
+                    )
+                    self.responses[name] = response
+        return response
+
+    def reload(self):
+        """
+        Rebuild every payload from the current configuration
+        Subscribed to the engine graceful channel so a SIGHUP picks up a changed configuration file
+        """
+        try:
+            config = load_static_config()
+        except (OSError, ValueError) as e:
+            cherrypy.log("Unable to read static response configuration: %s" % e)
+            return
+        responses = {}
+        for name, builder in self.builders.items():
+            try:
+                responses[name] = StaticResponse(
+                    builder(config), config.get("maxAge", DEFAULT_MAX_AGE)
+                )
+            except (ValueError, TypeError, KeyError) as e:
+                # Keep serving the previous payload rather than an invalid one
+                cherrypy.log("Invalid static response configuration for %s: %s" % (name, e))
+                if name in self.responses:
+                    responses[name] = self.responses[name]
+        with self.lock:
+            self.responses = responses
+        cherrypy.log("Static responses reloaded: %s" % ", ".join(responses))
+
+
+def load_static_config() -> dict:
+    """
+    Read the static response configuration file
+    The path comes from cherrypy.config["static_responses_file"] and a missing file means defaults
+
+    :return: dict with the optional keys transports, timingCaps and maxAge
+    """
+    path = cherrypy.config.get("static_responses_file")
+    if not path or not os.path.isfile(path):
+        return {}
+    with open(path) as config_file:
+        return json.load(config_file)
+
+
+def build_transports(config: dict):
+    return config.get("transports", DEFAULT_TRANSPORTS)
+
+
+def build_timing_caps(config: dict) -> models.TimingCaps:
+    timing_config = config.get("timingCaps", {})
+    ntpServers = None
+    ptpMasters = None
+    if "ntpServers" in timing_config:
+        ntpServers = []
+        for server in timing_config["ntpServers"]:
+            server = dict(server)
+            server["ntpServerAddrType"] = NtpServerAddrType(server["ntpServerAddrType"])
+            server["authenticationOption"] = AuthenticationOption(
+                server["authenticationOption"]
+            )
+            ntpServers.append(models.ntpServer(**server))
+    if "ptpMasters" in timing_config:
+        ptpMasters = [models.ptpMaster(**master) for master in timing_config["ptpMasters"]]
+    return models.TimingCaps(ntpServers=ntpServers, ptpMasters=ptpMasters)
+
+
+static_responses = StaticResponseCache()
+static_responses.register("transports", build_transports)
+static_responses.register("timing_caps", build_timing_caps)
@@ -27,6 +27,7 @@ from abc import ABC, abstractmethod
 from . import models
 import re
 import pprint as pp
+from kubernetes import config as k8s_config
 
 #from .models import ProblemDetails
 
@@ -74,6 +75,48 @@ def ignore_none_value(data: dict) -> dict:
     return {key: val for key, val in data.items() if val is not None}
 
 
+def json_fields(*fields: str):
+    """
+    Class decorator that generates the to_json of a model from the names of its fields
+
+    The generated to_json returns the fields that aren't None, in the given order, and is equivalent to
+    ignore_none_value(dict(field=self.field, ...)) without building and filtering an intermediate dict
+
+    :param fields: Attributes of the model that go into its json representation
+    :type fields: String
+    """
+    lines = ["def to_json(self):", "    data = {}"]
+    for field in fields:
+        lines.append("    value = self.%s" % field)
+        lines.append("    if value is not None:")
+        lines.append("        data[%r] = value" % field)
+    lines.append("    return data")
+    namespace = {}
+    exec("\n".join(lines), namespace)
+
+    def decorator(cls):
+        to_json = namespace["to_json"]
+        to_json.__qualname__ = "%s.to_json" % cls.__qualname__
+        cls.to_json = to_json
+        return cls
+
+    return decorator
+
+
+def exclude_keys(data: dict, *keys: str) -> dict:
+    """
+    Copy of the dictionary without the given keys, the dictionary itself is left untouched
+
+    :param data: Dictionary containing data to be returned
+    :type data: dict
+    :param keys: Keys to leave out
+    :type keys: String
+    :return: New dictionary with the remaining keys
+    :rtype: dict
+    """
+    return {key: val for key, val in data.items() if key not in keys}
+
+
 def none_to_empty_brackets(data: dict) -> dict:
     """
     Replace values of dictionary keys with None value for empty brackets {}
@@ -132,6 +175,9 @@ def json_out(cls):
     def json_out_wrapper(func):
         def inner(*args, **kwargs):
             object_to_be_serialized = func(*args, **kwargs)
+            # Pre-serialised responses already carry their own headers
+            if isinstance(object_to_be_serialized, bytes):
+                return object_to_be_serialized
             if isinstance(object_to_be_serialized, models.ProblemDetails):
                 cherrypy.response.headers["Content-Type"] = "application/problem+json"
             else:
@@ -280,6 +326,26 @@ def object_to_mongodb_dict(obj, extra: dict = None) -> dict:
     return return_data
 
 
+def order_insensitive(value):
+    """
+    Hashable form of a json value in which the order of list items doesn't matter
+
+    Lists become multisets (item and number of occurrences) and dicts sets of (key, value) pairs,
+    both frozensets that cache their hash so comparing two of them is usually a single hash comparison
+    Scalars keep their type so that True and 1 (or 1 and 1.0) are still different
+    Unlike DeepDiff with ignore_order, repeated items count: [a, a, b] differs from [a, b] and from [a, b, b]
+    """
+    if isinstance(value, dict):
+        return frozenset((key, order_insensitive(val)) for key, val in value.items())
+    if isinstance(value, list):
+        counts = {}
+        for item in value:
+            item = order_insensitive(item)
+            counts[item] = counts.get(item, 0) + 1
+        return frozenset(counts.items())
+    return (type(value), value)
+
+
 def check_port(port, base=1024):
     """
     Check if an int port number is valid
@@ -295,6 +361,33 @@ def check_port(port, base=1024):
         raise argparse.ArgumentTypeError("%s is an invalid positive int value" % value)
     return value
 
+def access_token_error(kwargs: dict):
+    """
+    Validate the access token of a request with the OAuth server
+
+    :param kwargs: Query parameters of the request (access_token)
+    :type kwargs: dict
+    :return: Unauthorized if the access token is missing or invalid, None otherwise
+    """
+    access_token = kwargs.get("access_token")
+    if access_token is None:
+        return models.Unauthorized("No access token provided.")
+
+    oauth = cherrypy.config.get("oauth_server")
+    if oauth.validate_token(access_token) is False:
+        return models.Unauthorized("Invalid access token.")
+    return None
+
+def load_kubernetes_config():
+    """
+    Configure the Kubernetes client with the pod service account
+    Outside a cluster (e.g. the benchmarks) the kubeconfig is used instead (KUBECONFIG or ~/.kube/config)
+    """
+    try:
+        k8s_config.load_incluster_config()
+    except k8s_config.ConfigException:
+        k8s_config.load_kube_config()
+
 def trafficRuleToNetworkPolicy(nameSpace: str, appInstanceId: str, trafficRuleId: str, data: dict):
 
     networkPolicy = {
@@ -302,7 +395,10 @@ def trafficRuleToNetworkPolicy(nameSpace: str, appInstanceId: str, trafficRuleId
         "kind": "NetworkPolicy",
         "metadata": {
             "name": "networkpolicy-%s" %trafficRuleId,
-            "namespace": "%s" %nameSpace
+            "namespace": "%s" %nameSpace,
+            # Lets the reconciler list the NetworkPolicies of an application (the label with a selector)
+            "annotations": {"mep/appInstanceId": "%s" %appInstanceId},
+            "labels": {"mep/appInstanceId": "%s" %appInstanceId}
         },
         "spec": {
             "podSelector": {
@@ -314,4 +410,64 @@ def trafficRuleToNetworkPolicy(nameSpace: str, appInstanceId: str, trafficRuleId
         }
     }
     return networkPolicy
-    
\ No newline at end of file
+    
+def trafficRulesToNetworkPolicy(nameSpace: str, appInstanceId: str, data: list):
+    """
+    Single NetworkPolicy with the traffic rules of an application (MEP_NETWORK_POLICY_MODE=app, see reconciler)
+    The ingress and egress rules are deduplicated and the ones that only differ in the peers
+    (or only in the ports) are merged into one
+
+    :param data: TrafficRule.toNetworkPolicy() of each traffic rule of the application
+    :type data: List of dict
+    """
+    networkPolicy = trafficRuleToNetworkPolicy(
+        nameSpace=nameSpace,
+        appInstanceId=appInstanceId,
+        trafficRuleId="app-%s" % appInstanceId,
+        data=dict(
+            ingress=mergeNetworkPolicyRules([rule for policy in data for rule in policy["ingress"]], "from"),
+            egress=mergeNetworkPolicyRules([rule for policy in data for rule in policy["egress"]], "to"),
+        ),
+    )
+    return networkPolicy
+
+def mergeNetworkPolicyRules(rules: list, peersKey: str) -> list:
+    """
+    A NetworkPolicy rule allows the traffic of any of its peers on any of its ports (an empty list allows any)
+    so rules with the same peers can share their ports and rules with the same ports can share their peers
+
+    :param rules: Ingress or egress rules
+    :type rules: List of dict
+    :param peersKey: "from" for ingress rules and "to" for egress rules
+    :type peersKey: String
+    """
+
+    def key(items: list):
+        return tuple(sorted({json.dumps(item, sort_keys=True) for item in items}))
+
+    def unique(items: list) -> list:
+        seen = set()
+        result = []
+        for item in items:
+            itemKey = json.dumps(item, sort_keys=True)
+            if itemKey not in seen:
+                seen.add(itemKey)
+                result.append(item)
+        return result
+
+    def union(first: list, second: list) -> list:
+        # Nothing is added to an empty list (i.e. any peer or port is already allowed)
+        if not first or not second:
+            return []
+        return unique(first + second)
+
+    for sharedKey, mergedKey in ((peersKey, "ports"), ("ports", peersKey)):
+        merged = {}
+        for rule in rules:
+            shared = key(rule[sharedKey])
+            if shared in merged:
+                merged[shared][mergedKey] = union(merged[shared][mergedKey], rule[mergedKey])
+            else:
+                merged[shared] = {peersKey: unique(rule[peersKey]), "ports": unique(rule["ports"])}
+        rules = list(merged.values())
+    return rules
@@ -0,0 +1,98 @@
+# Copyright 2022 Centro ALGORITMI - University of Minho and Instituto de Telecomunicações - Aveiro
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+"""
+Merging of the ingress and egress rules of the traffic rules of an application into a single NetworkPolicy
+(mergeNetworkPolicyRules, MEP_NETWORK_POLICY_MODE=app)
+
+Run from mep_app_com: python -m unittest discover -s tests
+"""
+
+import unittest
+
+# The models are imported first, like the servers do (the utils import them back)
+from mp1 import models  # noqa: F401
+from mp1.utils import mergeNetworkPolicyRules
+
+
+def peer(cidr: str) -> dict:
+    return {"ipBlock": {"cidr": cidr}}
+
+
+def port(number: int) -> dict:
+    return {"port": number}
+
+
+class MergeNetworkPolicyRulesTest(unittest.TestCase):
+    def test_single_rule_is_kept(self):
+        rules = [{"to": [peer("10.0.0.0/24")], "ports": [port(80)]}]
+        self.assertEqual(mergeNetworkPolicyRules(rules, "to"), rules)
+
+    def test_same_peers_share_their_ports(self):
+        self.assertEqual(
+            mergeNetworkPolicyRules(
+                [{"to": [peer("10.0.0.0/24")], "ports": [port(80)]}, {"to": [peer("10.0.0.0/24")], "ports": [port(81)]}],
+                "to",
+            ),
+            [{"to": [peer("10.0.0.0/24")], "ports": [port(80), port(81)]}],
+        )
+
+    def test_same_ports_share_their_peers(self):
+        self.assertEqual(
+            mergeNetworkPolicyRules(
+                [{"from": [peer("10.0.0.0/24")], "ports": [port(80)]}, {"from": [peer("10.1.0.0/24")], "ports": [port(80)]}],
+                "from",
+            ),
+            [{"from": [peer("10.0.0.0/24"), peer("10.1.0.0/24")], "ports": [port(80)]}],
+        )
+
+    def test_duplicates_are_removed(self):
+        rule = {"to": [peer("10.0.0.0/24"), peer("10.0.0.0/24")], "ports": [port(80)]}
+        self.assertEqual(
+            mergeNetworkPolicyRules([rule, dict(rule)], "to"), [{"to": [peer("10.0.0.0/24")], "ports": [port(80)]}]
+        )
+
+    def test_order_of_the_peers_does_not_matter(self):
+        self.assertEqual(
+            mergeNetworkPolicyRules(
+                [
+                    {"to": [peer("10.0.0.0/24"), peer("10.1.0.0/24")], "ports": [port(80)]},
+                    {"to": [peer("10.1.0.0/24"), peer("10.0.0.0/24")], "ports": [port(81)]},
+                ],
+                "to",
+            ),
+            [{"to": [peer("10.0.0.0/24"), peer("10.1.0.0/24")], "ports": [port(80), port(81)]}],
+        )
+
+    def test_empty_list_allows_any(self):
+        # Any port of the first rule already allows the port of the second one
+        self.assertEqual(
+            mergeNetworkPolicyRules(
+                [{"to": [peer("10.0.0.0/24")], "ports": []}, {"to": [peer("10.0.0.0/24")], "ports": [port(80)]}],
+                "to",
+            ),
+            [{"to": [peer("10.0.0.0/24")], "ports": []}],
+        )
+
+    def test_different_peers_and_ports_are_kept_apart(self):
+        rules = [{"to": [peer("10.0.0.0/24")], "ports": [port(80)]}, {"to": [peer("10.1.0.0/24")], "ports": [port(81)]}]
+        self.assertEqual(mergeNetworkPolicyRules(rules, "to"), rules)
+
+    def test_no_rules(self):
+        self.assertEqual(mergeNetworkPolicyRules([], "from"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
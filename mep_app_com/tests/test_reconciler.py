@@ -0,0 +1,140 @@
+# Copyright 2022 Centro ALGORITMI - University of Minho and Instituto de Telecomunicações - Aveiro
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+"""
+Comparison of the NetworkPolicies (normalized_spec) and DNS records (Reconciler.dns_record_changes) of the
+reconciler with the traffic and DNS rules
+
+Run from mep_app_com: python -m unittest discover -s tests
+"""
+
+import unittest
+
+import cherrypy
+
+from mp1.reconciler import Reconciler, normalized_spec
+
+
+class FakeDatabase:
+    """
+    Collections of documents, queried by equality of their fields like MongoDb.query_col
+    """
+
+    def __init__(self, **collections):
+        self.collections = collections
+
+    def query_col(self, col: str, query: dict, fields=None, find_one=False, raw_query=None):
+        return [
+            dict(document)
+            for document in self.collections.get(col, [])
+            if all(document.get(key) == value for key, value in query.items())
+        ]
+
+
+def dns_rule(appInstanceId: str, domainName: str, ipAddress: str = "10.0.0.1", state: str = "ACTIVE") -> dict:
+    return dict(
+        appInstanceId=appInstanceId,
+        dnsRuleId="dns-%s" % domainName,
+        domainName=domainName,
+        ipAddressType="IP_V4",
+        ipAddress=ipAddress,
+        ttl=300,
+        state=state,
+    )
+
+
+def dns_record(appInstanceId: str, domainName: str, ipAddress: str = "10.0.0.1") -> dict:
+    return dict(domainName=domainName, ipAddress=ipAddress, ttl=300, appInstanceId=appInstanceId)
+
+
+class NormalizedSpecTest(unittest.TestCase):
+    def test_defaults_of_the_api_server(self):
+        sent = {
+            "podSelector": {"matchLabels": {"pod-template-hash": "app"}},
+            "policyTypes": ["Ingress", "Egress"],
+            "ingress": [{"from": [], "ports": [{"port": 80}]}],
+            "egress": [{"to": [{"ipBlock": {"cidr": "10.0.0.0/24"}}], "ports": []}],
+        }
+        read = {
+            "policyTypes": ["Ingress", "Egress"],
+            "podSelector": {"matchLabels": {"pod-template-hash": "app"}},
+            "ingress": [{"ports": [{"port": 80, "protocol": "TCP"}]}],
+            "egress": [{"to": [{"ipBlock": {"cidr": "10.0.0.0/24"}}]}],
+        }
+        self.assertEqual(normalized_spec(sent), normalized_spec(read))
+
+    def test_missing_rules(self):
+        spec = {"podSelector": {}, "policyTypes": ["Ingress"]}
+        self.assertEqual(normalized_spec(dict(spec, ingress=[], egress=[])), normalized_spec(spec))
+
+    def test_changes_are_detected(self):
+        spec = {"podSelector": {}, "ingress": [{"from": [], "ports": [{"port": 80}]}]}
+        self.assertNotEqual(
+            normalized_spec(spec), normalized_spec(dict(spec, ingress=[{"from": [], "ports": [{"port": 81}]}]))
+        )
+        self.assertNotEqual(
+            normalized_spec(spec),
+            normalized_spec(dict(spec, ingress=[{"from": [], "ports": [{"port": 80, "protocol": "UDP"}]}])),
+        )
+
+    def test_spec_is_not_changed(self):
+        spec = {"podSelector": {}, "ingress": [{"ports": [{"port": 80}]}]}
+        normalized_spec(spec)
+        self.assertEqual(spec, {"podSelector": {}, "ingress": [{"ports": [{"port": 80}]}]})
+
+
+class DnsRecordChangesTest(unittest.TestCase):
+    def changes(self, dnsRules: list, dnsRecords: list, appInstanceId: str = None) -> list:
+        cherrypy.thread_data.db = FakeDatabase(dnsRules=dnsRules, dnsRecords=dnsRecords)
+        self.addCleanup(delattr, cherrypy.thread_data, "db")
+        return [
+            (operation, record["domainName"], record["ipAddress"])
+            for operation, record in Reconciler(cherrypy.engine).dns_record_changes(appInstanceId)
+        ]
+
+    def test_nothing_to_change(self):
+        self.assertEqual(self.changes([dns_rule("app1", "a.mec")], [dns_record("app1", "a.mec")]), [])
+
+    def test_missing_record_is_created(self):
+        self.assertEqual(self.changes([dns_rule("app1", "a.mec")], []), [("create", "a.mec", "10.0.0.1")])
+
+    def test_record_without_rule_is_deleted(self):
+        self.assertEqual(self.changes([], [dns_record("app1", "a.mec")]), [("delete", "a.mec", "10.0.0.1")])
+
+    def test_inactive_rule_is_deleted(self):
+        self.assertEqual(
+            self.changes([dns_rule("app1", "a.mec", state="INACTIVE")], [dns_record("app1", "a.mec")]),
+            [("delete", "a.mec", "10.0.0.1")],
+        )
+
+    def test_changed_record_is_deleted_before_it_is_created(self):
+        self.assertEqual(
+            self.changes([dns_rule("app1", "a.mec", "10.0.0.2")], [dns_record("app1", "a.mec")]),
+            [("delete", "a.mec", "10.0.0.1"), ("create", "a.mec", "10.0.0.2")],
+        )
+
+    def test_only_the_records_of_the_application(self):
+        self.assertEqual(
+            self.changes(
+                [dns_rule("app1", "a.mec"), dns_rule("app2", "b.mec")],
+                [dns_record("app2", "c.mec")],
+                appInstanceId="app1",
+            ),
+            [("create", "a.mec", "10.0.0.1")],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
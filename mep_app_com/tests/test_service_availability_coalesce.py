@@ -0,0 +1,101 @@
+# Copyright 2022 Centro ALGORITMI - University of Minho and Instituto de Telecomunicações - Aveiro
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""
+Merging of the service changes of a coalescing window (ServiceAvailabilityNotification.coalesce)
+
+Run from mep_app_com: python -m unittest discover -s tests
+"""
+
+import unittest
+
+from mp1.models import ServiceAvailabilityNotification
+
+
+def reference(serInstanceId: str, changeType: str, state: str = "ACTIVE") -> dict:
+    return dict(
+        link=dict(href="/applications/app/services/%s" % serInstanceId),
+        serInstanceId=serInstanceId,
+        serName="service-%s" % serInstanceId,
+        state=state,
+        changeType=changeType,
+    )
+
+
+def change_types(serviceReferences: list) -> list:
+    return [(reference["serInstanceId"], reference["changeType"]) for reference in serviceReferences]
+
+
+class CoalesceTest(unittest.TestCase):
+    def coalesce(self, *changes) -> list:
+        return change_types(
+            ServiceAvailabilityNotification.coalesce([reference(*change) for change in changes])
+        )
+
+    def test_single_change_is_kept(self):
+        for changeType in ("ADDED", "REMOVED", "STATE_CHANGED", "ATTRIBUTES_CHANGED"):
+            self.assertEqual(self.coalesce(("s1", changeType)), [("s1", changeType)])
+
+    def test_added_stays_added(self):
+        self.assertEqual(
+            self.coalesce(("s1", "ADDED"), ("s1", "STATE_CHANGED"), ("s1", "ATTRIBUTES_CHANGED")),
+            [("s1", "ADDED")],
+        )
+
+    def test_added_then_removed_is_left_out(self):
+        self.assertEqual(self.coalesce(("s1", "ADDED"), ("s1", "STATE_CHANGED"), ("s1", "REMOVED")), [])
+
+    def test_added_removed_and_added_again_is_added(self):
+        self.assertEqual(self.coalesce(("s1", "ADDED"), ("s1", "REMOVED"), ("s1", "ADDED")), [("s1", "ADDED")])
+
+    def test_removed_gets_the_last_change(self):
+        self.assertEqual(self.coalesce(("s1", "STATE_CHANGED"), ("s1", "REMOVED")), [("s1", "REMOVED")])
+        self.assertEqual(self.coalesce(("s1", "ATTRIBUTES_CHANGED"), ("s1", "REMOVED")), [("s1", "REMOVED")])
+
+    def test_removed_then_added_is_added(self):
+        # The service came back, the subscriber gets it as new
+        self.assertEqual(self.coalesce(("s1", "REMOVED"), ("s1", "ADDED")), [("s1", "ADDED")])
+
+    def test_attributes_changed_wins_over_state_changed(self):
+        self.assertEqual(
+            self.coalesce(("s1", "ATTRIBUTES_CHANGED"), ("s1", "STATE_CHANGED")), [("s1", "ATTRIBUTES_CHANGED")]
+        )
+        self.assertEqual(
+            self.coalesce(("s1", "STATE_CHANGED"), ("s1", "ATTRIBUTES_CHANGED")), [("s1", "ATTRIBUTES_CHANGED")]
+        )
+        self.assertEqual(self.coalesce(("s1", "STATE_CHANGED"), ("s1", "STATE_CHANGED")), [("s1", "STATE_CHANGED")])
+
+    def test_last_state_is_sent(self):
+        serviceReferences = ServiceAvailabilityNotification.coalesce(
+            [reference("s1", "STATE_CHANGED", "SUSPENDED"), reference("s1", "STATE_CHANGED", "ACTIVE")]
+        )
+        self.assertEqual(serviceReferences[0]["state"], "ACTIVE")
+
+    def test_services_in_order_of_their_first_change(self):
+        self.assertEqual(
+            self.coalesce(("s2", "ADDED"), ("s1", "STATE_CHANGED"), ("s2", "STATE_CHANGED"), ("s3", "REMOVED")),
+            [("s2", "ADDED"), ("s1", "STATE_CHANGED"), ("s3", "REMOVED")],
+        )
+
+    def test_input_is_not_changed(self):
+        changes = [reference("s1", "ADDED"), reference("s1", "STATE_CHANGED")]
+        ServiceAvailabilityNotification.coalesce(changes)
+        self.assertEqual(change_types(changes), [("s1", "ADDED"), ("s1", "STATE_CHANGED")])
+
+    def test_empty_window(self):
+        self.assertEqual(ServiceAvailabilityNotification.coalesce([]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
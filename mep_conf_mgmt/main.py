@@ -22,6 +22,9 @@ from mm5.databases.dbmongo import MongoDb
 from typing import Type
 import cherrypy
 from mm5.utils import check_port
+from mm5.server_config import load_server_config, log_server_profile
+from mm5.supervisor import Supervisor, worker_count
+from mm5 import metrics, outbox, profiler, reconciler, request_timing, scheduler, tracing
 from mm5.models import *
 import json
 import os
@@ -119,12 +122,30 @@ def main(database: Type[DatabaseBase]):
     cherrypy.config.update(
         {"server.socket_host": "0.0.0.0", "server.socket_port": 8085}
     )
+    # Thread pool, socket queues, timeouts and keep-alive (see server_config.py)
+    cherrypy.config.update(load_server_config())
+    log_server_profile()
 
     # MEPM config (mm5 - extra mm5)
     mecpm_conf = {"/": {"request.dispatch": mepm_dispatcher}}
     cherrypy.tree.mount(None, "/mec_platform_mgmt/v1", config=mecpm_conf)
 
 
+    # Request, database and outbound call metrics served at /metrics
+    metrics.mount()
+    # Server-Timing header and slow request log
+    request_timing.mount()
+    # Spans exported with MEP_TRACING_EXPORTER (disabled by default)
+    tracing.mount("mm5")
+    # Sampling profiler at /debug/profile (only with MEP_PROFILER_TOKEN)
+    profiler.mount()
+    # Delayed callbacks and Kubernetes/DNS configuration (MEP_SCHEDULER_WORKERS threads)
+    scheduler.mount()
+    # Notifications to the MEC apps delivered with retries from the notificationOutbox collection
+    outbox.mount()
+    # NetworkPolicies and DNS records kept in line with the traffic and DNS rules
+    reconciler.mount()
+
     # Config 404 and 403 landing pages
     cherrypy.config.update({'error_page.404': error_page_404})
     cherrypy.config.update({'error_page.403': error_page_403})
@@ -179,7 +200,15 @@ if __name__ == "__main__":
     dnsApiServer = DnsApiServer(dns_api_addr, dns_api_port)
     cherrypy.config.update({"dns_api_server": dnsApiServer})
 
+    slow_request_threshold = int(os.environ.get("MEP_SLOW_REQUEST_MS", 500))
+    cherrypy.config.update({"slow_request_threshold": slow_request_threshold})
+
     with open("/var/run/secrets/kubernetes.io/serviceaccount/namespace") as namespace_file:
         cherrypy.config.update({"namespace":namespace_file.read()}) 
     
-    main(database)
+    # Several server processes sharing the port (SO_REUSEPORT) when MEP_WORKERS > 1
+    workers = worker_count()
+    if workers > 1:
+        Supervisor(workers, main, database).run()
+    else:
+        main(database)
@@ -16,7 +16,10 @@ import cherrypy
 import requests
 from mm5.models import *
 import time
-from cherrypy.process.plugins import BackgroundTask
+from mm5.outbox import outbox
+from mm5.reconciler import reconciler
+from mm5.scheduler import scheduler
+from mm5.tracing import propagate
 from kubernetes import client, config, utils
 from datetime import datetime
 
@@ -26,142 +29,52 @@ class CallbackController:
     def execute_callback(args, func, sleep_time: int = 10):
         """
         Send the callback to the specified url (i.e callbackreference)
-        Start a cherrypy BackgroundTask https://docs.cherrypy.dev/en/latest/pkg/cherrypy.process.plugins.html
-        Pass the callbackreference (i.e url to call) and the data
+        Schedule func(*args) to run in a worker of the scheduler (see scheduler.py) after sleep_time seconds
+        (the client might still be receiving the answer to its request and thus not be ready for the callback)
         """
-        data = args + [sleep_time]
-        # print(data)
-        callback_task = BackgroundTask(
-            interval=0,
-            function=func,
-            args=data,
-            bus=cherrypy.engine,
-        )
-        # Add the callback_task to itself to allow to cancel itself
-        # (needed since BackgroundTask is usually repeatable)
-        callback_task.args.insert(0, callback_task)
-        callback_task.start()
+        scheduler.schedule(sleep_time, propagate(func), *args)
 
     @staticmethod
-    def _notifyTermination(
-        task,
+    def notify_termination(
         subscription: AppTerminationNotificationSubscription,
         notification: AppTerminationNotification,
-        sleep_time: int,
+        sleep_time: int = 10,
     ):
         """
-        :param task: Reference to the background task itself
-        :type task: BackgroundTask
-        :param availability_notifications:  Used to obtain the callback references
-        :type availability_notifications: SerAvailabilityNotificationSubscription or List of SerAvailabilityNotificationSubscription (each one contains a callbackreference)
-        :param data: Data containing the information to be sent in a callback
-        :type data: Json/Dict
+        Write the notification to the notification outbox (see outbox.py), it is delivered from there after
+        sleep_time seconds, with retries if the subscriber can't be reached
+
+        :param subscription: Used to obtain the callback reference
+        :type subscription: AppTerminationNotificationSubscription
+        :param notification: Notification to be sent
+        :type notification: AppTerminationNotification
+        :param sleep_time: Seconds to wait before sending the notification
+        :type sleep_time: int
         """
-        # cherrypy.log("Starting callback function")
-        # Wait for a bit since client might still be receiving the answer from the subscriptions and thus might
-        # not be ready to receive the callback
-        time.sleep(sleep_time)
-        requests.post(
-            subscription.callbackReference,
-            data=json.dumps(notification, cls=NestedEncoder),
-            headers={"Content-Type": "application/json"},
+        outbox.enqueue(
+            "app_termination",
+            [(subscription.callbackReference, json.dumps(notification, cls=NestedEncoder).encode("utf-8"))],
+            delay=sleep_time,
         )
 
-        task.cancel()
-
-    def configure_trafficRules(
-        appInstanceId:str,
-        trafficRules: List[TrafficRule],
-        sleep_time: int = 10,
-    ):
-        for rule in trafficRules:
-            callback_task = BackgroundTask(
-                interval=0,
-                function=CallbackController._configureRule,
-                args=[rule, sleep_time],
-                bus=cherrypy.engine,
-            )
-            # Add the callback_task to itself to allow to cancel itself
-            # (needed since BackgroundTask is usually repeatable)
-            callback_task.args.insert(0, callback_task)
-            callback_task.start()
-    
-    def configure_trafficRulesByDescriptor(
-        appInstanceId:str,
-        trafficRules: List[TrafficRuleDescriptor],
-        sleep_time: int = 10,
-    ):
-        for rule in trafficRules:
-            callback_task = BackgroundTask(
-                interval=0,
-                function=CallbackController._configureTrafficRule,
-                args=[appInstanceId, rule.trafficRule, sleep_time],
-                bus=cherrypy.engine,
-            )
-            # Add the callback_task to itself to allow to cancel itself
-            # (needed since BackgroundTask is usually repeatable)
-            callback_task.args.insert(0, callback_task)
-            callback_task.start()
-    
-    @staticmethod
-    def _configureTrafficRule(
-        task,
-        appInstanceId: str,
-        trafficRule: TrafficRule,
-        sleep_time: int,
-    ):
-        nameSpace = cherrypy.config.get("namespace")
-        cherrypy.log("Starting rule configuration function")
-        networkPolicy = trafficRuleToNetworkPolicy(nameSpace=nameSpace, appInstanceId=appInstanceId, trafficRuleId=trafficRule.trafficRuleId, data=trafficRule.toNetworkPolicy())
-        # cherrypy.log("Network Policy")
-        # cherrypy.log(json.dumps(networkPolicy))
-
-        time.sleep(sleep_time)
-        config.load_incluster_config()
-        k8s_client = client.ApiClient()
-
-        utils.create_from_dict(k8s_client, networkPolicy)
-        
-        cherrypy.log("Traffic Rule Id %s created: %f" %(trafficRule.trafficRuleId, time.time()))
-
-        task.cancel()
-
-    @staticmethod
-    def _removeTrafficRule(
-        task,
+    def reconcile_rules(
         appInstanceId: str,
-        trafficRule: TrafficRule,
-        sleep_time: int,
+        sleep_time: int = 10,
     ):
-        
-        # cherrypy.log("Starting rule configuration function")
-        networkPolicy = "networkpolicy-%s" %trafficRule['trafficRuleId']
-        nameSpace = cherrypy.config.get("namespace")
-        # cherrypy.log("Network Policy")
-        # cherrypy.log(json.dumps(networkPolicy))
-
-        time.sleep(sleep_time)
-        config.load_incluster_config()
-        k8s_client = client.ApiClient()
-        api_instance = client.NetworkingV1Api(k8s_client)
-        api_instance.delete_namespaced_network_policy(name=networkPolicy, namespace=nameSpace)
-        
-        cherrypy.log("Traffic Rule Id %s removed: %f" %(trafficRule['trafficRuleId'], time.time()))
-
-        task.cancel()
-
+        """
+        Make the NetworkPolicies and DNS records of the application match its traffic and DNS rules
+        after sleep_time seconds (see reconciler.py), the rules must already be written to the database
+        """
+        reconciler.trigger(appInstanceId, sleep_time)
 
     @staticmethod
     def _create_secret(
-        task,
         appInstanceId: str,
         data: dict,
-        sleep_time: int,
     ):
 
         # cherrypy.log("Creating secret with MEC App token")
 
-        time.sleep(sleep_time)
         
         secret = {
             "apiVersion":"v1",
@@ -174,82 +87,26 @@ class CallbackController:
             "data": data
         }
 
-        config.load_incluster_config()
+        load_kubernetes_config()
         k8s_client = client.ApiClient()
-        utils.create_from_dict(k8s_client, secret)
+        with outbound("kubernetes", "create_secret"):
+            utils.create_from_dict(k8s_client, secret)
 
 
-        task.cancel()
-
     def _remove_secret(
-        task,
         appInstanceId: str,
-        sleep_time: int,
     ):
-        time.sleep(sleep_time)
         secret = "%s-secret" %appInstanceId
         namespace = appInstanceId
-        config.load_incluster_config()
+        load_kubernetes_config()
         k8s_client = client.CoreV1Api()
-        k8s_client.delete_namespaced_secret(name=secret, namespace=namespace)
-
-        task.cancel()
-
-    def configure_DnsRulesByDescriptor(
-        appInstanceId:str,
-        dnsRules: List[DNSRuleDescriptor],
-        sleep_time: int = 10,
-    ):
-        for rule in dnsRules:
-            callback_task = BackgroundTask(
-                interval=0,
-                function=CallbackController._configureDnsRule,
-                args=[appInstanceId, rule.dnsRule, sleep_time],
-                bus=cherrypy.engine,
-            )
-            # Add the callback_task to itself to allow to cancel itself
-            # (needed since BackgroundTask is usually repeatable)
-            callback_task.args.insert(0, callback_task)
-            callback_task.start()
-
-    def _configureDnsRule(
-        task,
-        appInstanceId: str,
-        dnsRule: DnsRule,
-        sleep_time: int,
-    ):
-        time.sleep(sleep_time)
-        # cherrypy.log("Starting rule configuration function")
-        dnsApiServer = cherrypy.config.get("dns_api_server")
-        dnsApiServer.create_record(dnsRule.domainName, dnsRule.ipAddress, dnsRule.ttl)
-        
-        cherrypy.log("DNS Rule Id %s created: %f" %(dnsRule.dnsRuleId, time.time()))
-
-        task.cancel()
-
-
-    def _removeDnsRule(
-        task,
-        appInstanceId: str,
-        dnsRule: DnsRule,
-        sleep_time: int,
-    ):
-        time.sleep(sleep_time)
-        # cherrypy.log("Starting rule configuration function")
-        dnsApiServer = cherrypy.config.get("dns_api_server")
-        dnsApiServer.remove_record(dnsRule['domainName'])
-        
-        cherrypy.log("DNS Rule Id %s removed: %f" %(dnsRule['dnsRuleId'], time.time()))
-
-        task.cancel()
+        with outbound("kubernetes", "delete_secret"):
+            k8s_client.delete_namespaced_secret(name=secret, namespace=namespace)
 
     def _gracefulTerminationChecker(
-        task,
         appInstanceId: str,
         lifecycleOperationOccurrenceId: str,
-        sleep_time: int,
     ):
-        time.sleep(sleep_time)
         cherrypy.log("Graceful termination checker")
 
         lcmOppOcc = cherrypy.thread_data.db.query_col(
@@ -271,38 +128,15 @@ class CallbackController:
             oauth.delete_client(appStatus['oauth']['client_id'], appStatus['oauth']['client_secret'])
 
             query = {"appInstanceId": appInstanceId}
-            
-            result = cherrypy.thread_data.db.query_col(
-                "trafficRules", 
-                query=query,
-                fields=dict(appInstanceId=0)
-            )
-
-            for rule in result:
 
-                CallbackController.execute_callback(
-                    args=[appInstanceId, rule],
-                    func=CallbackController._removeTrafficRule,
-                    sleep_time=0
-                )
-                
-                cherrypy.thread_data.db.remove(col= "trafficRules",
-                query=dict(trafficRuleId=rule['trafficRuleId']))
-                
+            # The reconciler removes the NetworkPolicies and DNS records of the rules
+            cherrypy.thread_data.db.remove_many("trafficRules", query)
 
             query = dict(appInstanceId=appInstanceId, state="ACTIVE")
 
-            result = cherrypy.thread_data.db.query_col("dnsRules", query)
+            cherrypy.thread_data.db.remove_many("dnsRules", query)
 
-            for rule in result:
-                CallbackController.execute_callback(
-                    args=[appInstanceId, rule],
-                    func=CallbackController._removeDnsRule,
-                    sleep_time=0
-                )
-                
-                cherrypy.thread_data.db.remove(col= "dnsRules",
-                query=dict(dnsRuleId=rule['dnsRuleId']))           
+            CallbackController.reconcile_rules(appInstanceId, sleep_time=0)
 
             appInstanceDict = dict(appInstanceId=appInstanceId)
 
@@ -324,7 +158,3 @@ class CallbackController:
                 dict(lifecycleOperationOccurrenceId=lifecycleOperationOccurrenceId), 
                 dict(operationStatus=OperationStatus.SUCCESSFULLY_DONE.name)
             )
-
-
-
-        task.cancel()
\ No newline at end of file
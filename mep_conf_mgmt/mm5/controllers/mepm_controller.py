@@ -16,11 +16,11 @@ import sys
 import jsonschema
 import uuid
 import base64
-import copy
 
 sys.path.append("../../")
 from mm5.models import *
 from hashlib import md5
+from mm5.request_timing import span
 from mm5.controllers.app_callback_controller import *
 from kubernetes import client, config
 
@@ -66,7 +66,7 @@ class MecPlatformMgMtController:
                 for resource in k8s_config['manifest']:
                     if resource['kind'] in ['ReplicaSet', 'StatefulSet', 'DaemonSet', 'Job', 'Deployment']:
                         labels = resource['metadata']['labels']
-                        config.load_incluster_config()
+                        load_kubernetes_config()
                         k8s_client = client.CoreV1Api()
                         label = list(labels.items())[0]
                         selector = label[0]+'='+label[1]
@@ -107,7 +107,8 @@ class MecPlatformMgMtController:
                 return error.message()
 
             try:
-                configRequest = ConfigPlatformForAppRequest.from_json(data)
+                with span("validate"):
+                    configRequest = ConfigPlatformForAppRequest.from_json(data)
             except (TypeError, jsonschema.exceptions.ValidationError) as e:
                 error = BadRequest(e)
                 return error.message()  
@@ -117,12 +118,6 @@ class MecPlatformMgMtController:
                 for ruleDescriptor in configRequest.appTrafficRule:
 
                     rule = ruleDescriptor.trafficRule
-                        
-                    CallbackController.execute_callback(
-                        args=[appInstanceId, rule],
-                        func=CallbackController._configureTrafficRule,
-                        sleep_time=0
-                    )
 
                     cherrypy.thread_data.db.create(
                         "trafficRules",
@@ -137,12 +132,6 @@ class MecPlatformMgMtController:
                 for ruleDescriptor in configRequest.appDNSRule:
 
                     rule = ruleDescriptor.dnsRule
-                        
-                    CallbackController.execute_callback(
-                        args=[appInstanceId, rule],
-                        func=CallbackController._configureDnsRule,
-                        sleep_time=0
-                    )
 
                     lastModified = cherrypy.response.headers['Date']
 
@@ -152,6 +141,9 @@ class MecPlatformMgMtController:
                         } | rule.to_json()
                     cherrypy.thread_data.db.create("dnsRules", new_rec)
 
+            # NetworkPolicies and DNS records of the rules
+            CallbackController.reconcile_rules(appInstanceId, sleep_time=0)
+
             appState  = AppInstanceState(InstantiationState.INSTANTIATED.value, OperationalState.STARTED.value)
             appStatusDict = dict(
                 nsId=nsId,
@@ -237,9 +229,9 @@ class MecPlatformMgMtController:
                     maxGracefulTimeout=updateState.gracefulStopTimeout,
                     _links=subscription._links
                 )
-            CallbackController.execute_callback(
-                args=[subscription, notification],
-                func=CallbackController._callback_function,
+            CallbackController.notify_termination(
+                subscription=subscription,
+                notification=notification,
                 sleep_time=10
             )
 
@@ -296,7 +288,7 @@ class MecPlatformMgMtController:
         # for filtering after saving to the database
         try:
             # Verify the requestion body if its correct about its schema:
-            termination = TerminateAppInstance.from_json(copy.deepcopy(data))
+            termination = TerminateAppInstance.from_json(data)
 
         except (TypeError, jsonschema.exceptions.ValidationError) as e:
             error = BadRequest(e)
@@ -333,9 +325,9 @@ class MecPlatformMgMtController:
                         _links=subscription._links
                     )
 
-                CallbackController.execute_callback(
-                    args=[subscription, notification],
-                    func=CallbackController._notifyTermination,
+                CallbackController.notify_termination(
+                    subscription=subscription,
+                    notification=notification,
                     sleep_time=0
                 )
 
@@ -387,38 +379,15 @@ class MecPlatformMgMtController:
             oauth.delete_client(app['oauth']['client_id'], app['oauth']['client_secret'])
 
             query = {"appInstanceId": appInstanceId}
-            
-            result = cherrypy.thread_data.db.query_col(
-                "trafficRules", 
-                query=query,
-                fields=dict(appInstanceId=0, nsId=0)
-            )
-
-            for rule in result:
 
-                CallbackController.execute_callback(
-                    args=[appInstanceId, rule],
-                    func=CallbackController._removeTrafficRule,
-                    sleep_time=0
-                )
-                
-                cherrypy.thread_data.db.remove(col= "trafficRules",
-                query=dict(trafficRuleId=rule['trafficRuleId']))
-                
+            # The reconciler removes the NetworkPolicies and DNS records of the rules
+            cherrypy.thread_data.db.remove_many("trafficRules", query)
 
             query = dict(appInstanceId=appInstanceId, state="ACTIVE")
 
-            result = cherrypy.thread_data.db.query_col("dnsRules", query)
+            cherrypy.thread_data.db.remove_many("dnsRules", query)
 
-            for rule in result:
-                CallbackController.execute_callback(
-                    args=[appInstanceId, rule],
-                    func=CallbackController._removeDnsRule,
-                    sleep_time=0
-                )
-                
-                cherrypy.thread_data.db.remove(col= "dnsRules",
-                query=dict(dnsRuleId=rule['dnsRuleId']))           
+            CallbackController.reconcile_rules(appInstanceId, sleep_time=0)
 
 
             appInstanceDict = dict(appInstanceId=appInstanceId)
@@ -481,12 +450,6 @@ class MecPlatformMgMtController:
         for ruleDescriptor in configRequest.appTrafficRule:
 
             rule = ruleDescriptor.trafficRule
-                
-            CallbackController.execute_callback(
-                args=[appInstanceId, rule],
-                func=CallbackController._configureTrafficRule,
-                sleep_time=0
-            )
 
             cherrypy.thread_data.db.create(
                 "trafficRules",
@@ -500,12 +463,6 @@ class MecPlatformMgMtController:
         for ruleDescriptor in configRequest.appDNSRule:
 
             rule = ruleDescriptor.dnsRule
-                
-            CallbackController.execute_callback(
-                args=[appInstanceId, rule],
-                func=CallbackController._configureDnsRule,
-                sleep_time=0
-            )
 
             lastModified = cherrypy.response.headers['Date']
 
@@ -515,6 +472,9 @@ class MecPlatformMgMtController:
                 } | rule.to_json()
             cherrypy.thread_data.db.create("dnsRules", new_rec)
 
+        # NetworkPolicies and DNS records of the rules
+        CallbackController.reconcile_rules(appInstanceId, sleep_time=0)
+
         cherrypy.response.status = 204
         return None
 
@@ -644,12 +604,6 @@ class MecPlatformMgMtController:
                 return error.message()           
             
 
-            CallbackController.execute_callback(
-                args=[appInstanceId, trafficRule],
-                func=CallbackController._configureTrafficRule,
-                sleep_time=5
-            )
-
             cherrypy.thread_data.db.create(
                 "trafficRules",
                 object_to_mongodb_dict(
@@ -658,6 +612,8 @@ class MecPlatformMgMtController:
                 )
             )
 
+            CallbackController.reconcile_rules(appInstanceId, sleep_time=5)
+
             cherrypy.response.status = 201
             return trafficRule
 
@@ -715,12 +671,6 @@ class MecPlatformMgMtController:
         if appStatus['indication'] == IndicationType.READY.name or appStatus['indication'] == "STARTING":
 
             for rule in trafficRules:
-                
-                CallbackController.execute_callback(
-                    args=[appInstanceId, rule],
-                    func=CallbackController._configureTrafficRule,
-                    sleep_time=5
-                )
 
                 cherrypy.thread_data.db.create(
                     "trafficRules",
@@ -730,6 +680,8 @@ class MecPlatformMgMtController:
                     )
                 )
 
+            CallbackController.reconcile_rules(appInstanceId, sleep_time=5)
+
             cherrypy.response.status = 201
             return trafficRules
 
@@ -778,15 +730,14 @@ class MecPlatformMgMtController:
         if cherrypy.thread_data.db.count_documents("dnsRules", query) > 0:
             cherrypy.thread_data.db.remove("dnsRules", query)
 
-        dnsApiServer = cherrypy.config.get("dns_api_server")
-
-        dnsApiServer.create_record(new_rec["domainName"], new_rec["ipAddress"], new_rec["ttl"])
-
         new_rec = {
             "appInstanceId": appInstanceId, 
             "lastModified": lastModified,
             } | new_rec
         cherrypy.thread_data.db.create("dnsRules", new_rec)
+
+        # The DNS record is created (and the one of a replaced rule removed) by the reconciler
+        CallbackController.reconcile_rules(appInstanceId, sleep_time=0)
    
         cherrypy.response.status = 200
         return dnsRule
@@ -844,6 +795,9 @@ class MecPlatformMgMtController:
                 "lastModified": lastModified,
                 } | new_rec
             cherrypy.thread_data.db.create("dnsRules", new_rec)
+
+        # The DNS records of the rules are created by the reconciler
+        CallbackController.reconcile_rules(appInstanceId, sleep_time=0)
    
         cherrypy.response.status = 200
         return data
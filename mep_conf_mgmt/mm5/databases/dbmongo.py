@@ -14,12 +14,53 @@
 
 from .database_base import DatabaseBase
 from ..utils import mongodb_query_replace, NestedEncoder
-from pymongo import MongoClient
+from .. import metrics
+from pymongo import MongoClient, ReturnDocument, monitoring
 from typing import Union
 import cherrypy
 import json
 
 
+class CommandTimer(monitoring.CommandListener):
+    """
+    Times every MongoDB command from the driver events and labels it with the collection
+    The collection is only known when the command starts, it is kept by request_id until it ends
+    """
+
+    # Commands issued by the MEP (handshakes, heartbeats and sessions are not measured)
+    COMMANDS = {
+        "find", "getMore", "insert", "update", "delete", "findAndModify",
+        "aggregate", "count", "distinct", "createIndexes",
+    }
+
+    def __init__(self):
+        self.collections = {}
+
+    def started(self, event):
+        if event.command_name in self.COMMANDS:
+            if event.command_name == "getMore":
+                collection = event.command.get("collection")
+            else:
+                collection = event.command.get(event.command_name)
+            self.collections[event.request_id] = str(collection)
+
+    def succeeded(self, event):
+        self.observe(event, "ok")
+
+    def failed(self, event):
+        self.observe(event, "error")
+
+    def observe(self, event, outcome: str):
+        collection = self.collections.pop(event.request_id, None)
+        if collection is not None:
+            metrics.observe_mongodb(
+                collection, event.command_name, outcome, event.duration_micros / 1e6
+            )
+
+
+command_timer = CommandTimer()
+
+
 class MongoDb(DatabaseBase):
     def __init__(self, ip, port, username, password, database):
         self.ip = ip
@@ -36,7 +77,8 @@ class MongoDb(DatabaseBase):
         # host=%s\tport=%s\tusername=%s\tpassword=%s\tdatabase=%s'''
         # % (self.ip, self.port, self.username, self.password, self.database)
         # )
-        self.client = MongoClient(host=self.ip, port=self.port, username=self.username, password=self.password)[self.database]
+        self.client = MongoClient(host=self.ip, port=self.port, username=self.username, password=self.password,
+                                  event_listeners=[command_timer])[self.database]
         # Add database to each thread (https://github.com/cherrypy/tools/blob/master/Databases)
         cherrypy.thread_data.db = self
 
@@ -57,6 +99,19 @@ class MongoDb(DatabaseBase):
         data = collection.insert_one(indata)
         return data.inserted_id
 
+    def create_many(self, col: str, indata: list):
+        """
+        Add multiple entries at database in a single command
+        :param col: collection
+        :param indata: list of contents to be added
+        :return: database ids of the inserted elements.
+        """
+
+        # Get the collection
+        collection = self.client[col]
+        data = collection.insert_many(indata)
+        return data.inserted_ids
+
     def remove(self, col: str, query: dict):
         """
         Remove a document from the database
@@ -109,6 +164,43 @@ class MongoDb(DatabaseBase):
         # Updates and returns the UpdateResult type.
         return collection.update_one(query, data_to_update)
 
+    def upsert(self, col: str, query: dict, update: dict):
+        """
+        Applies the update operators to the first entry that matches the query, inserting it if there is none
+        :param col: collection
+        :param query: query in mongodb syntax (used as is), its equality fields are part of an inserted entry
+        :param update: update operators (e.g $push, $setOnInsert)
+        :return: UpdateResult, upserted_id is set when the entry was inserted
+        """
+        collection = self.client[col]
+        return collection.update_one(query, update, upsert=True)
+
+    def find_one_and_update(self, col: str, query: dict, update: dict, sort: list = None):
+        """
+        Atomically updates the first entry that matches the query (e.g to claim it)
+        :param col: collection
+        :param query: query in mongodb syntax (used as is, operators such as $lte are allowed)
+        :param update: update operators (e.g $set, $inc)
+        :param sort: list of (field, direction) deciding which entry is the first
+        :return: document after the update or None if no document matched
+        """
+        collection = self.client[col]
+        data = collection.find_one_and_update(query, update, sort=sort, return_document=ReturnDocument.AFTER)
+        if data is not None:
+            # Like query_col the internal id isn't returned
+            del data["_id"]
+        return data
+
+    def create_index(self, col: str, keys: list):
+        """
+        Creates an index if it doesn't exist yet
+        :param col: collection
+        :param keys: list of (field, direction)
+        :return: name of the index
+        """
+        collection = self.client[col]
+        return collection.create_index(keys)
+
 
 
     def query_col(
@@ -0,0 +1,227 @@
+# Copyright 2022 Centro ALGORITMI - University of Minho and Instituto de Telecomunicações - Aveiro
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""
+Prometheus metrics
+
+Requests are labelled by RoutesDispatcher route name (the name given in main.py), MongoDB commands
+by collection and command and outbound calls by target (oauth, dns_api, kubernetes, callback).
+Notifications of the outbox are counted by kind and outcome (delivered, retried, dead, short_circuited,
+coalesced into a waiting one) and the circuit breaker of each callback destination exposes its state and current timeout.
+The reconciler counts the changes it applies by target (network_policy, dns_record), operation and outcome
+and exposes the drift found by its last reconciliation of every application.
+Every update is a single observation on a labelled child, no lock is held around the measured code.
+MongoDB and outbound call durations are also added to the timing breakdown of the current request
+and, when tracing is enabled, recorded as client spans.
+With several worker processes PROMETHEUS_MULTIPROC_DIR must be set so /metrics aggregates all of them.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+import cherrypy
+import routes
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+from . import request_timing, tracing
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Notifications can wait for their retries
+LAG_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+
+HTTP_REQUESTS = Counter(
+    "mep_http_requests_total",
+    "HTTP requests handled",
+    ["route", "method", "status"],
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "mep_http_request_duration_seconds",
+    "Time to handle an HTTP request",
+    ["route", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+MONGODB_COMMAND_DURATION = Histogram(
+    "mep_mongodb_command_duration_seconds",
+    "Time of a MongoDB command as reported by the driver",
+    ["collection", "command", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+OUTBOUND_REQUEST_DURATION = Histogram(
+    "mep_outbound_request_duration_seconds",
+    "Time of a call to a service outside the MEP",
+    ["target", "operation", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+NOTIFICATIONS = Counter(
+    "mep_notifications_total",
+    "Delivery attempts of the notifications of the outbox",
+    ["kind", "outcome"],
+)
+NOTIFICATION_DELIVERY_LAG = Histogram(
+    "mep_notification_delivery_lag_seconds",
+    "Time from a notification being written to the outbox to its delivery",
+    ["kind"],
+    buckets=LAG_BUCKETS,
+)
+NOTIFICATION_OUTBOX_PENDING = Gauge(
+    "mep_notification_outbox_pending",
+    "Notifications of the outbox waiting to be delivered (as seen by the last sweep)",
+    multiprocess_mode="livemax",
+)
+CALLBACK_CIRCUIT_STATE = Gauge(
+    "mep_callback_circuit_state",
+    "State of the circuit breaker of a callback destination (0 closed, 1 half open, 2 open)",
+    ["destination"],
+    multiprocess_mode="livemax",
+)
+CALLBACK_TIMEOUT = Gauge(
+    "mep_callback_timeout_seconds",
+    "Timeout of the next delivery to a callback destination, from its latency",
+    ["destination"],
+    multiprocess_mode="livemax",
+)
+RECONCILE_CHANGES = Counter(
+    "mep_reconcile_changes_total",
+    "Changes applied by the reconciler to make the NetworkPolicies and DNS records match the rules",
+    ["target", "operation", "outcome"],
+)
+RECONCILE_DRIFT = Gauge(
+    "mep_reconcile_drift",
+    "Changes needed by the last reconciliation of every application",
+    ["target"],
+    multiprocess_mode="livemax",
+)
+RECONCILE_DURATION = Histogram(
+    "mep_reconcile_duration_seconds",
+    "Time of a reconciliation of one application (app) or every one (all)",
+    ["scope"],
+    buckets=LATENCY_BUCKETS,
+)
+
+
+def observe_mongodb(collection: str, command: str, outcome: str, duration: float):
+    MONGODB_COMMAND_DURATION.labels(collection, command, outcome).observe(duration)
+    request_timing.record("mongodb.%s.%s" % (collection, command), duration)
+    tracing.record_span(
+        "mongodb.%s.%s" % (collection, command),
+        duration,
+        **{"db.system": "mongodb", "db.operation": command, "db.collection": collection}
+    )
+
+
+@contextmanager
+def outbound(target: str, operation: str):
+    """
+    Measures a call to a service outside the MEP
+    The outcome is error when the block raises
+    The block runs inside a client span, headers built with tracing.inject in it carry that span
+
+    :param target: oauth, dns_api, kubernetes or callback
+    :param operation: what is being done (e.g register, create_record)
+    """
+    outcome = "error"
+    start = time.perf_counter()
+    try:
+        with tracing.span(
+            "%s.%s" % (target, operation),
+            tracing.SPAN_KIND_CLIENT,
+            **{"peer.service": target}
+        ):
+            yield
+        outcome = "ok"
+    finally:
+        duration = time.perf_counter() - start
+        OUTBOUND_REQUEST_DURATION.labels(target, operation, outcome).observe(duration)
+        request_timing.record("%s.%s" % (target, operation), duration)
+
+
+class RequestMetricsTool(cherrypy.Tool):
+    """
+    Counts and times every request
+    Enabled for the whole server with tools.request_metrics.on
+    """
+
+    def __init__(self):
+        super().__init__("on_start_resource", self.start, priority=5)
+
+    def _setup(self):
+        super()._setup()
+        cherrypy.request.hooks.attach("before_handler", self.route, priority=5)
+        cherrypy.request.hooks.attach("on_end_request", self.end, priority=95)
+
+    def start(self):
+        cherrypy.request.metrics_start = time.perf_counter()
+        cherrypy.request.metrics_route = "unmatched"
+
+    def route(self):
+        request = cherrypy.request
+        if isinstance(request.dispatch, cherrypy.dispatch.RoutesDispatcher):
+            # RoutesDispatcher registers the route name as the controller of the match
+            match = routes.request_config().mapper_dict
+            if match:
+                request.metrics_route = match["controller"]
+        else:
+            request.metrics_route = request.script_name + request.path_info
+
+    def end(self):
+        request = cherrypy.request
+        start = getattr(request, "metrics_start", None)
+        if start is None:
+            return
+        status = str(cherrypy.response.status).split(" ", 1)[0]
+        HTTP_REQUESTS.labels(request.metrics_route, request.method, status).inc()
+        HTTP_REQUEST_DURATION.labels(request.metrics_route, request.method, status).observe(
+            time.perf_counter() - start
+        )
+
+
+class MetricsController:
+    @cherrypy.expose
+    def index(self):
+        if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        cherrypy.response.headers["Content-Type"] = CONTENT_TYPE_LATEST
+        return generate_latest(registry)
+
+
+def mount():
+    """
+    Enables the request metrics for every application and serves them at /metrics
+    """
+    cherrypy.tools.request_metrics = RequestMetricsTool()
+    cherrypy.config.update({"tools.request_metrics.on": True})
+    cherrypy.tree.mount(
+        MetricsController(), "/metrics", config={"/": {"tools.trailing_slash.on": False}}
+    )
+
+
+def mark_process_dead(pid: int):
+    """
+    Drops the live gauges of a worker process that exited (multiprocess mode)
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
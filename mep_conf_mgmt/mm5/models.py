@@ -20,11 +20,15 @@ from jsonschema import validate
 import cherrypy
 from urllib import request, parse
 from .utils import *
+from .metrics import outbound
+from .tracing import inject, propagate
 from .enums import *
 from .mepm_exceptions import *
 from .schemas import *
 from uuid import UUID
 import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import pprint # Dictionaries pretty print (for testing)
 
@@ -227,12 +231,12 @@ class FilteringCriteria:
     @staticmethod
     def from_json(data: dict) -> FilteringCriteria:
         validate(instance=data, schema=filteringcriteria_schema)
-        tmp_states = data.pop("states", None)
+        tmp_states = data.get("states")
         if tmp_states == None:
             states = None
         else:
             states = [ServiceState[state] for state in tmp_states]
-        isLocal = data.pop("isLocal", None)
+        isLocal = data.get("isLocal")
 
         # Since only one is acceptable start all as none and then set only the one presented in the data
         # the validation from json schema deals with the mutually exclusive part
@@ -248,7 +252,7 @@ class FilteringCriteria:
         elif "serNames" in data:
             identifier_data["serNames"] = data["serNames"]
         elif "serInstanceIds" in data:
-            identifier_data["serInstanceIds"] = data["serInstanceId"]
+            identifier_data["serInstanceIds"] = data["serInstanceIds"]
 
         # The object is created from the two known variables and from the dictionary setting only one identifier data
         return FilteringCriteria(states=states, isLocal=isLocal, **identifier_data)
@@ -318,10 +322,12 @@ class ServiceAvailabilityNotification:
             self.changeType = changeType
 
         @staticmethod
-        def from_json(data: dict):
+        def from_json(data: dict, changeType: str = None):
             """
             :param data: Data used to generate a ServiceReference
             :type data: JSON / Python Dict
+            :param changeType: Type of the change, overrides the one in data (if any)
+            :type changeType: ChangeType
             :return: ServiceReference
             """
             # Link is weird - ETSI overall structure for the _link type is really confusing
@@ -329,7 +335,7 @@ class ServiceAvailabilityNotification:
             serInstanceId = data.get("serInstanceId")
             state = data.get("state")
             serName = data.get("serName")
-            changeType = ChangeType(data.get("changeType"))
+            changeType = ChangeType(changeType or data.get("changeType"))
             return ServiceAvailabilityNotification.ServiceReferences(
                 link=link,
                 serInstanceId=serInstanceId,
@@ -367,9 +373,8 @@ class ServiceAvailabilityNotification:
         serviceReferences = []
 
         for service in data:
-            service["changeType"] = changeType
             tmpReference = ServiceAvailabilityNotification.ServiceReferences.from_json(
-                data=service
+                data=service, changeType=changeType
             )
             serviceReferences.append(tmpReference)
         return ServiceAvailabilityNotification(
@@ -423,10 +428,10 @@ class SerAvailabilityNotificationSubscription:
         filteringCriteria = {}
         if "filteringCriteria" in data:
             filteringCriteria = FilteringCriteria.from_json(
-                data.pop("filteringCriteria")
+                data["filteringCriteria"]
             )
         return SerAvailabilityNotificationSubscription(
-            filteringCriteria=filteringCriteria, **data
+            filteringCriteria=filteringCriteria, **exclude_keys(data, "filteringCriteria")
         )
 
     def to_json(self):
@@ -459,12 +464,12 @@ class OAuth2Info:
     @staticmethod
     def from_json(data: dict) -> OAuth2Info:
         # list(set()) to ignore possible duplicates from the user
-        data["grantTypes"] = list(set(data["grantTypes"]))
-        if 1 > len(data["grantTypes"]) > 4:
+        grantTypes = list(set(data["grantTypes"]))
+        if 1 > len(grantTypes) > 4:
             raise InvalidGrantType
 
-        grantTypes = [GrantTypes(grantType) for grantType in data.pop("grantTypes")]
-        return OAuth2Info(grantTypes=grantTypes, **data)
+        grantTypes = [GrantTypes(grantType) for grantType in grantTypes]
+        return OAuth2Info(grantTypes=grantTypes, **exclude_keys(data, "grantTypes"))
 
     def to_json(self):
         return dict(grantTypes=self.grantTypes, tokenEndpoint=self.tokenEndpoint)
@@ -594,10 +599,15 @@ class TransportInfo:
 
     @staticmethod
     def from_json(data: dict) -> TransportInfo:
-        _type = TransportType(data.pop("type"))
-        endpoint = EndPointInfo.from_json(data.pop("endpoint"))
-        security = SecurityInfo.from_json(data.pop("security"))
-        return TransportInfo(type=_type, endpoint=endpoint, security=security, **data)
+        _type = TransportType(data["type"])
+        endpoint = EndPointInfo.from_json(data["endpoint"])
+        security = SecurityInfo.from_json(data["security"])
+        return TransportInfo(
+            type=_type,
+            endpoint=endpoint,
+            security=security,
+            **exclude_keys(data, "type", "endpoint", "security"),
+        )
 
     def to_json(self):
         return ignore_none_value(
@@ -679,26 +689,29 @@ class ServiceInfo:
         # Validate the json via jsonschema
         validate(instance=data, schema=serviceinfo_schema)
         identifier_data = {}
-        categoryref = data.pop("serCategory", None)
+        categoryref = data.get("serCategory")
         if categoryref is not None:
             identifier_data["serCategory"] = CategoryRef(**categoryref)
-        identifier_data["serName"] = data.pop("serName", None)
-
-        # Each required element or element that can't be automatically generated from the unpacking is popped
-        # to avoid having the function received the element twice and throwing an exception
-        state = ServiceState(data.pop("state"))
-        transportInfo = TransportInfo.from_json(data.pop("transportInfo"))
-        serializer = SerializerType(data.pop("serializer"))
+        identifier_data["serName"] = data.get("serName")
+
+        # Each required element or element that can't be automatically generated from the unpacking is left out
+        # of it to avoid having the function received the element twice and throwing an exception
+        # (data itself is never modified, the request body can still be used by the caller)
+        state = ServiceState(data["state"])
+        transportInfo = TransportInfo.from_json(data["transportInfo"])
+        serializer = SerializerType(data["serializer"])
         scopeOfLocality = None
         if "scopeOfLocality" in data.keys():
-            scopeOfLocality = LocalityType(data.pop("scopeOfLocality"))
+            scopeOfLocality = LocalityType(data["scopeOfLocality"])
 
         return ServiceInfo(
             state=state,
             transportInfo=transportInfo,
             serializer=serializer,
             scopeOfLocality=scopeOfLocality,
-            **data,
+            **exclude_keys(
+                data, "serCategory", "serName", "state", "transportInfo", "serializer", "scopeOfLocality"
+            ),
             **identifier_data,
         )
 
@@ -952,9 +965,9 @@ class AppTerminationNotificationSubscription:
 
     def from_json(data: dict):
         validate(instance=data, schema=appTerminationNotificationSubscription_schema)
-        callbackReference = data.pop("callbackReference")
-        appInstanceId = data.pop("appInstanceId")
-        subscriptionType = data.pop("subscriptionType")
+        callbackReference = data["callbackReference"]
+        appInstanceId = data["appInstanceId"]
+        subscriptionType = data["subscriptionType"]
         try:
             _links = Links.from_json(data["_links"])
         except KeyError:
@@ -1134,19 +1147,19 @@ class TrafficFilter:
         # cherrypy.log(json.dumps(data))
         # First validate the json via jsonschema
         validate(instance=data, schema=trafficFilter_schema)
-        srcAddress = data.pop("srcAddress") if "srcAddress" in data else None
-        dstAddress = data.pop("dstAddress") if "dstAddress" in data else None
-        srcPort = data.pop("srcPort") if "srcPort" in data else None
-        dstPort = data.pop("dstPort") if "dstPort" in data else None
-        protocol = data.pop("protocol") if "protocol" in data else None
-        token = data.pop("token") if "token" in data else None
-        srcTunnelAddress = data.pop("srcTunnelAddress") if "srcTunnelAddress" in data else None
-        tgtTunnelAddress = data.pop("tgtTunnelAddress") if "tgtTunnelAddress" in data else None
-        srcTunnelPort = data.pop("srcTunnelPort") if "srcTunnelPort" in data else None
-        dstTunnelPort = data.pop("dstTunnelPort") if "dstTunnelPort" in data else None
-        qCI = data.pop("qCI") if "qCI" in data else None
-        dSCP = data.pop("dSCP") if "dSCP" in data else None
-        tC = data.pop("tC") if "tC" in data else None
+        srcAddress = data.get("srcAddress")
+        dstAddress = data.get("dstAddress")
+        srcPort = data.get("srcPort")
+        dstPort = data.get("dstPort")
+        protocol = data.get("protocol")
+        token = data.get("token")
+        srcTunnelAddress = data.get("srcTunnelAddress")
+        tgtTunnelAddress = data.get("tgtTunnelAddress")
+        srcTunnelPort = data.get("srcTunnelPort")
+        dstTunnelPort = data.get("dstTunnelPort")
+        qCI = data.get("qCI")
+        dSCP = data.get("dSCP")
+        tC = data.get("tC")
 
         return TrafficFilter(srcAddress = srcAddress, dstAddress = dstAddress, srcPort = srcPort,
                              dstPort = dstPort, protocol = protocol, token = token,
@@ -1176,9 +1189,9 @@ class TunnelInfo:
         # First validate the json via jsonschema
         validate(instance=data, schema=tunnelInfo_schema)
 
-        tunnelType = data.pop("tunnelType")
-        tunnelDstAddress = data.pop("tunnelDstAddress") if "tunnelDstAddress" in data else None
-        tunnelSrcAddress = data.pop("tunnelSrcAddress") if "tunnelSrcAddress" in data else None
+        tunnelType = data["tunnelType"]
+        tunnelDstAddress = data.get("tunnelDstAddress")
+        tunnelSrcAddress = data.get("tunnelSrcAddress")
 
         return TunnelInfo(tunnelType = tunnelType, tunnelDstAddress = tunnelDstAddress,
                           tunnelSrcAddress = tunnelSrcAddress)
@@ -1209,11 +1222,11 @@ class DestinationInterface:
         # cherrypy.log(json.dumps(data))
         validate(instance=data, schema=destinationInterface_schema)
 
-        interfaceType = data.pop("interfaceType")
-        tunnelInfo = TunnelInfo.from_json(data.pop("tunnelInfo")) if "tunnelInfo" in data else None
-        srcMacAddress = data.pop("srcMacAddress") if "srcMacAddress" in data else None
-        dstMacAddress = data.pop("dstMacAddress") if "dstMacAddress" in data else None
-        dstIpAddress = data.pop("dstIpAddress") if "dstIpAddress" in data else None
+        interfaceType = data["interfaceType"]
+        tunnelInfo = TunnelInfo.from_json(data["tunnelInfo"]) if "tunnelInfo" in data else None
+        srcMacAddress = data.get("srcMacAddress")
+        dstMacAddress = data.get("dstMacAddress")
+        dstIpAddress = data.get("dstIpAddress")
 
         return DestinationInterface(interfaceType = interfaceType, tunnelInfo = tunnelInfo,
                                     srcMacAddress = srcMacAddress, dstMacAddress = dstMacAddress,
@@ -1251,19 +1264,19 @@ class TrafficRule:
         # cherrypy.log("TrafficRule from_json data:")
         # cherrypy.log(json.dumps(data))
 
-        trafficRuleId = data.pop("trafficRuleId")
-        filterType = data.pop("filterType")
-        priority = data.pop("priority")
-        trafficFilters = data.pop("trafficFilter")
+        trafficRuleId = data["trafficRuleId"]
+        filterType = data["filterType"]
+        priority = data["priority"]
+        trafficFilters = data["trafficFilter"]
         trafficFilter = []
         for filter in trafficFilters:
             trafficFilter.append(TrafficFilter.from_json(filter))
-        action = data.pop("action")
-        dstInterfaces = data.pop("dstInterface")
+        action = data["action"]
+        dstInterfaces = data["dstInterface"]
         dstInterface = []
         for interface in dstInterfaces:
             dstInterface.append(DestinationInterface.from_json(interface))
-        state = data.pop("state")
+        state = data["state"]
 
         return TrafficRule(trafficRuleId = trafficRuleId, filterType = filterType,
                             priority = priority, trafficFilter = trafficFilter, action = action,
@@ -1381,9 +1394,9 @@ class ServiceLivenessInfo:
         # cherrypy.log("validate service liveness info")
         validate(instance=data, schema=serviceLivenessInfo_schema)
 
-        state = data.pop("state")
-        timeStamp = data.pop("timeStamp")
-        interval = data.pop("interval")
+        state = data["state"]
+        timeStamp = data["timeStamp"]
+        interval = data["interval"]
 
         return ServiceLivenessInfo(state, timeStamp, interval)
 
@@ -1400,7 +1413,7 @@ class ServiceLivenessUpdate:
         # First validate the json via jsonschema
         # cherrypy.log("validate service liveness update")
         validate(instance=data, schema=serviceLivenessUpdate_schema)
-        state = data.pop("state")
+        state = data["state"]
 
         return ServiceLivenessUpdate(state)
 
@@ -1451,15 +1464,15 @@ class TransportDescriptor:
         # First validate the json via jsonschema
         validate(instance=data, schema=transportDescriptor_schema)
 
-        name = data.pop("name")
-        description = data.pop("description", None)
-        type = TransportType(data.pop("type"))
+        name = data["name"]
+        description = data.get("description")
+        type = TransportType(data["type"])
 
         # Always "HTTP" since is a REST API? TODO: Check this
-        protocol = data.pop("protocol")
-        version = data.pop("version")
-        security = SecurityInfo.from_json(data.pop("security"))
-        implSpecificInfo = data.pop("implSpecificInfo", None)
+        protocol = data["protocol"]
+        version = data["version"]
+        security = SecurityInfo.from_json(data["security"])
+        implSpecificInfo = data.get("implSpecificInfo")
 
         return TransportDescriptor(name, description, type, protocol, version, security, implSpecificInfo)
 
@@ -1489,10 +1502,10 @@ class ServiceDescriptor:
     def from_json(data: dict) -> ServiceDescriptor:
         validate(instance=data, schema=serviceDescriptor_schema)
 
-        serName = data.pop("serName")
-        serCategory = data.pop("serCategory")
-        version = data.pop("version")
-        transportsSupported = data.pop("transportsSupported")
+        serName = data["serName"]
+        serCategory = data["serCategory"]
+        version = data["version"]
+        transportsSupported = data["transportsSupported"]
 
         return ServiceDescriptor(serName, serCategory, version, transportsSupported)
 
@@ -1516,7 +1529,7 @@ class FeatureDependency:
     def from_json(data: dict) -> FeatureDependency:
         validate(instance=data, schema=featureDependency_schema)
 
-        return FeatureDependency(data.pop("featureName"), data.pop("version"))
+        return FeatureDependency(data["featureName"], data["version"])
 
 
 class Transports:
@@ -1537,8 +1550,8 @@ class Transports:
     def from_json(data: dict) -> Transports:
         validate(instance=data, schema=transports_schema)
 
-        transport = TransportDescriptor.from_json(data.pop("transport"))
-        serializers = [SerializerType(s) for s in data.pop("serializers")]
+        transport = TransportDescriptor.from_json(data["transport"])
+        serializers = [SerializerType(s) for s in data["serializers"]]
 
         return Transports(transport, serializers)
 
@@ -1571,9 +1584,9 @@ class TransportDependency:
         # First validate the json via jsonschema
         validate(instance=data, schema=transportDependency_schema)
 
-        transport = TransportDescriptor.from_json(data.pop("transport"))
-        serializers = [SerializerType(s) for s in data.pop("serializers")]
-        labels = data.pop("labels")
+        transport = TransportDescriptor.from_json(data["transport"])
+        serializers = [SerializerType(s) for s in data["serializers"]]
+        labels = data["labels"]
 
         return TransportDependency(transport, serializers, labels)
 
@@ -1620,15 +1633,15 @@ class ServiceDependency:
         # First validate the json via jsonschema
         validate(instance=data, schema=serviceDependency_schema)
 
-        serName = data.pop("serName")
-        serCategory = data.pop("serCategory", None)
+        serName = data["serName"]
+        serCategory = data.get("serCategory")
         
         if serCategory is not None:
             serCategory = CategoryRef(**serCategory)
        
-        version = data.pop("version")
+        version = data["version"]
         
-        serTransportDependencies = data.pop("serTransportDependencies", None)
+        serTransportDependencies = data.get("serTransportDependencies")
         if serTransportDependencies is not None:
             serTransportDependencies = [TransportDependency.from_json(td) for td in serTransportDependencies]
         else:
@@ -1645,7 +1658,7 @@ class ServiceDependency:
                 TransportDependency(transp_descript, [SerializerType.JSON], ["A"])
                 ]
 
-        requestedPermissions = data.pop("requestedPermissions", None)             
+        requestedPermissions = data.get("requestedPermissions")             
 
         return ServiceDependency(serName, serCategory, version, serTransportDependencies, requestedPermissions)
 
@@ -1694,7 +1707,7 @@ class LatencyDescriptor:
 
     @staticmethod
     def from_json(data: dict) -> LatencyDescriptor:
-        return LatencyDescriptor(int(data.pop("maxLatency")))
+        return LatencyDescriptor(int(data["maxLatency"]))
 
 
 class UserContextTransferCapility:
@@ -1918,10 +1931,10 @@ class ChangeAppInstanceState:
     
     def from_json(data: dict):
         validate(data, schema=changeAppInstanceState_schema)
-        appInstanceId = data.pop("appInstanceId")
-        changeStateTo = ChangeStateTo(data.pop("changeStateTo"))
-        stopType = StopType(data.pop("stopType"))
-        gracefulStopTimeout = int(data.pop("gracefulStopTimeout"))
+        appInstanceId = data["appInstanceId"]
+        changeStateTo = ChangeStateTo(data["changeStateTo"])
+        stopType = StopType(data["stopType"])
+        gracefulStopTimeout = int(data["gracefulStopTimeout"])
 
         return ChangeAppInstanceState(
             appInstanceId=appInstanceId,
@@ -1949,10 +1962,10 @@ class TerminateAppInstance:
     
     def from_json(data: dict):
         validate(data, schema=terminateAppInstance_schema)
-        appInstanceId = data.pop("appInstanceId")
-        terminationType = TerminationType(data.pop("terminationType"))
+        appInstanceId = data["appInstanceId"]
+        terminationType = TerminationType(data["terminationType"])
         try:
-            gracefulStopTimeout = int(data.pop("gracefulStopTimeout"))
+            gracefulStopTimeout = int(data["gracefulStopTimeout"])
         except KeyError:
             gracefulStopTimeout = 0
 
@@ -2014,11 +2027,11 @@ class Links_:
     @classmethod
     def from_json(data: dict) -> Links_:
         #validate(data, schema=links__schema)
-        self_ = LinkType.from_json(data.pop("self"))
-        instantiate = LinkType.from_json(data.pop("instantiate"))
-        terminate = LinkType.from_json(data.pop("terminate"))
-        operate = LinkType.from_json(data.pop("operate"))
-        configure_platform_for_app = LinkType.from_json(data.pop("configurePlatformForApp"))
+        self_ = LinkType.from_json(data["self"])
+        instantiate = LinkType.from_json(data["instantiate"])
+        terminate = LinkType.from_json(data["terminate"])
+        operate = LinkType.from_json(data["operate"])
+        configure_platform_for_app = LinkType.from_json(data["configurePlatformForApp"])
         return Links_(self_=self_, instantiate=instantiate, terminate=terminate, operate=operate, configure_platform_for_app=configure_platform_for_app)
 
 
@@ -2063,7 +2076,8 @@ class OAuthServer:
         self.port = port
     
     def register(self):
-        response = requests.get("http://%s:%s/register" %(self.url, self.port))
+        with outbound("oauth", "register"):
+            response = requests.get("http://%s:%s/register" %(self.url, self.port), headers=inject())
         response = json.loads(response.content)
         if (response['message'] == 'Client registered successfully'):
             response.pop('message')
@@ -2073,7 +2087,8 @@ class OAuthServer:
             
     def get_token(self, client_id:str, client_secret:str):
         credentials = dict(grant_type="client_credentials", client_id=client_id, client_secret=client_secret)
-        response = requests.post("http://%s:%s/token" %(self.url, self.port), json=credentials)
+        with outbound("oauth", "get_token"):
+            response = requests.post("http://%s:%s/token" %(self.url, self.port), json=credentials, headers=inject())
         if response.status_code == 200:
             token = json.loads(response.content)['access_token']
             return token
@@ -2082,40 +2097,102 @@ class OAuthServer:
     
     def validate_token(self, access_token:str):
         data = dict(access_token=access_token)
-        response = requests.post("http://%s:%s/validate_token" %(self.url, self.port), json=data)
+        with outbound("oauth", "validate_token"):
+            response = requests.post("http://%s:%s/validate_token" %(self.url, self.port), json=data, headers=inject())
         return response.status_code == 200
     
     def delete_client(self, client_id:str, client_secret:str):
         credentials = dict(client_id=client_id, client_secret=client_secret)
-        response = requests.post("http://%s:%s/delete" %(self.url, self.port), json=credentials)        
+        with outbound("oauth", "delete_client"):
+            response = requests.post("http://%s:%s/delete" %(self.url, self.port), json=credentials, headers=inject())
         return response.status_code == 200
 
 
 class DnsApiServer:
-    def __init__(self, url: str, port: str, zone: str = "zone0") -> None:
+    def __init__(
+            self, url: str, port: str, zone: str = "zone0", concurrency: int = 4, timeout: float = 10
+    ) -> None:
+        """
+        :param concurrency: Requests of a batch of records sent at the same time
+        :param timeout: Seconds to wait for the DNS API to connect and to answer
+        """
         self.url = url
         self.port = port
         self.zone = zone
+        self.timeout = timeout
+        # Keep-alive connection of each thread to the DNS API (a requests.Session isn't shared between threads)
+        self.local = threading.local()
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="dns_api")
+
+    def session(self) -> requests.Session:
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        return self.local.session
 
     def create_record(self, domain: str, ip: str, ttl: int):
+        return self.create_records([(domain, ip, ttl)])[0]
 
-        headers = {"Content-Type": "application/json"}
-        query = {"name": domain, "ip": ip, "ttl": ttl}
+    def remove_record(self, domain: str):
+        return self.remove_records([domain])[0]
 
+    def create_records(self, records: list, throttle=None) -> list:
+        """
+        Create many records, concurrency requests at a time on the keep-alive connections of the threads
+        The DNS API has no bulk endpoint and a connection carries one request at a time (no pipelining), so
+        each record is still a request but a batch takes about len(records) / concurrency round-trips
+
+        :param records: Domain name, IP address and TTL of each record
+        :type records: List of (String, String, int)
+        :param throttle: Function called before each request (e.g to limit the requests per second)
+        :return: Whether each record was created
+        """
+        headers = inject({"Content-Type": "application/json"})
         url_0 = 'http://%s:%s/dns_support/v1/api/%s/record' % (self.url, self.port, self.zone)
 
-        response = requests.post(url_0, headers=headers, params=query)
+        return self._send_all(
+            "create_record",
+            [dict(method="POST", url=url_0, headers=headers, params={"name": domain, "ip": ip, "ttl": ttl})
+             for domain, ip, ttl in records],
+            throttle,
+        )
 
-        # print(f"\n# DNS rule creation #\nresponse: {response.json()}\n")
+    def remove_records(self, domains: list, throttle=None) -> list:
+        """
+        Remove many records, concurrency requests at a time (see create_records)
 
-        return response.status_code == 200
+        :param domains: Domain name of each record
+        :type domains: List of String
+        :param throttle: Function called before each request (e.g to limit the requests per second)
+        :return: Whether each record was removed
+        """
+        headers = inject({"Content-Type": "application/json"})
+        url = 'http://%s:%s/dns_support/v1/api/%s/record' % (self.url, self.port, self.zone)
 
-    def remove_record(self, domain: str):
-        
-        headers = {"Content-Type": "application/json"}
-        
-        url = 'http://%s:%s/dns_support/v1/api/%s/record?name=%s' %(self.url, self.port, self.zone, domain)
-        
-        response = requests.delete(url, headers=headers)
+        return self._send_all(
+            "remove_record",
+            [dict(method="DELETE", url=url, headers=headers, params={"name": domain}) for domain in domains],
+            throttle,
+        )
+
+    def _send_all(self, operation: str, requests_kwargs: list, throttle=None) -> list:
+        """
+        A connection error (or timeout) fails the records that weren't sent yet too (they would wait for the
+        same error)
+        """
+        failed = threading.Event()
+
+        def send_record(kwargs: dict) -> bool:
+            if failed.is_set():
+                return False
+            if throttle is not None:
+                throttle()
+            try:
+                with outbound("dns_api", operation):
+                    response = self.session().request(timeout=self.timeout, **kwargs)
+            except requests.RequestException as e:
+                failed.set()
+                cherrypy.log("DNS API %s of %s failed: %s" % (operation, kwargs["params"]["name"], e))
+                return False
+            return response.status_code == 200
 
-        return response.status_code == 200
\ No newline at end of file
+        return list(self.executor.map(propagate(send_record), requests_kwargs))
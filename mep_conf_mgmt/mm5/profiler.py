@@ -0,0 +1,145 @@
+# Copyright 2022 Centro ALGORITMI - University of Minho and Instituto de Telecomunicações - Aveiro
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""
+Sampling profiler for a live server
+
+GET /debug/profile?seconds=10&interval=10 samples the stacks of every thread of the process (CherryPy
+workers, background tasks, ...) every interval milliseconds and returns them collapsed, one
+"thread;outer;...;inner count" line per distinct stack, ready for flamegraph.pl or speedscope.
+The endpoint only exists when MEP_PROFILER_TOKEN is set and requires "Authorization: Bearer <token>".
+Only one profile runs at a time, the duration is capped by MEP_PROFILER_MAX_SECONDS and the interval
+can not go below MIN_INTERVAL so the sampler (which holds the GIL while walking the stacks) stays cheap.
+With several worker processes each profile covers the worker that received the request.
+"""
+
+import hmac
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+import cherrypy
+
+from . import models
+from .utils import NestedEncoder, json_out
+
+DEFAULT_SECONDS = 10
+DEFAULT_MAX_SECONDS = 60
+# Milliseconds
+DEFAULT_INTERVAL = 10
+MIN_INTERVAL = 5
+MAX_INTERVAL = 1000
+MAX_DEPTH = 128
+
+_running = threading.Lock()
+
+
+def thread_label(thread: threading.Thread) -> str:
+    # Threads of the same pool are merged ("CP Server Thread-12" -> "CP Server Thread")
+    return re.sub(r"[-_ ]?\d+$", "", thread.name) if thread is not None else "unknown"
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return "%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+
+def sample(seconds: float, interval: float) -> Counter:
+    """
+    Samples the stacks of every other thread until seconds have passed
+
+    :param seconds: duration of the profile
+    :param interval: seconds between samples
+    :return: Counter of collapsed stacks
+    """
+    own = threading.get_ident()
+    stacks = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        threads = {thread.ident: thread for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_DEPTH:
+                stack.append(frame_label(frame))
+                frame = frame.f_back
+            stack.append(thread_label(threads.get(ident)))
+            stacks[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return stacks
+
+
+def collapse(stacks: Counter) -> bytes:
+    return "".join(
+        "%s %d\n" % (stack, count) for stack, count in stacks.most_common()
+    ).encode("utf-8")
+
+
+class ProfilerController:
+    def __init__(self, token: str, max_seconds: float):
+        self.token = token
+        self.max_seconds = max_seconds
+
+    @cherrypy.expose
+    @json_out(cls=NestedEncoder)
+    def index(self, seconds: str = None, interval: str = None):
+        authorization = cherrypy.request.headers.get("Authorization", "")
+        if not hmac.compare_digest(authorization.encode(), ("Bearer %s" % self.token).encode()):
+            return models.Forbidden("A valid profiler token is required").message()
+
+        try:
+            seconds = float(seconds) if seconds is not None else DEFAULT_SECONDS
+            interval = int(interval) if interval is not None else DEFAULT_INTERVAL
+        except ValueError:
+            return models.BadRequest("seconds must be a number and interval an integer").message()
+        if not 0 < seconds <= self.max_seconds:
+            return models.BadRequest(
+                "seconds must be greater than 0 and at most %s" % self.max_seconds
+            ).message()
+        if not MIN_INTERVAL <= interval <= MAX_INTERVAL:
+            return models.BadRequest(
+                "interval must be between %d and %d milliseconds" % (MIN_INTERVAL, MAX_INTERVAL)
+            ).message()
+
+        if not _running.acquire(blocking=False):
+            return models.Conflict("A profile is already running").message()
+        try:
+            cherrypy.log("Profiling for %ss every %dms" % (seconds, interval))
+            stacks = sample(seconds, interval / 1000)
+        finally:
+            _running.release()
+
+        cherrypy.response.headers["Content-Type"] = "text/plain; charset=utf-8"
+        cherrypy.response.headers["X-Profile-Samples"] = str(sum(stacks.values()))
+        return collapse(stacks)
+
+
+def mount():
+    """
+    Serves the profiler at /debug/profile when MEP_PROFILER_TOKEN is set
+    """
+    token = os.environ.get("MEP_PROFILER_TOKEN")
+    if not token:
+        return
+    max_seconds = float(os.environ.get("MEP_PROFILER_MAX_SECONDS", DEFAULT_MAX_SECONDS))
+    cherrypy.tree.mount(
+        ProfilerController(token, max_seconds),
+        "/debug/profile",
+        config={"/": {"tools.trailing_slash.on": False}},
+    )
+    cherrypy.log("Profiler enabled at /debug/profile (at most %ss per profile)" % max_seconds)
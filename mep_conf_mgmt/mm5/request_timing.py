@@ -0,0 +1,144 @@
+# Copyright 2022 Centro ALGORITMI - University of Minho and Instituto de Telecomunicações - Aveiro
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""
+Per request timing breakdown
+
+While a request is handled every measured step (MongoDB commands, OAuth/DNS/Kubernetes calls and
+the spans opened by the controllers) is added to a recorder kept in the handling thread.
+The totals are sent in the Server-Timing header and requests slower than slow_request_threshold
+(milliseconds) are logged with their breakdown.
+Steps measured outside a request (background tasks) are ignored.
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+import cherrypy
+
+DEFAULT_SLOW_REQUEST_THRESHOLD = 500
+
+_local = threading.local()
+
+
+class SpanRecorder:
+    def __init__(self):
+        self.start = time.perf_counter()
+        # name -> [number of times, total seconds], kept in the order the steps first happened
+        self.steps = {}
+
+    def add(self, name: str, duration: float):
+        step = self.steps.get(name)
+        if step is None:
+            self.steps[name] = [1, duration]
+        else:
+            step[0] += 1
+            step[1] += duration
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def server_timing(self) -> str:
+        entries = [
+            '%s;desc="%d";dur=%.1f' % (name, count, duration * 1000)
+            for name, (count, duration) in self.steps.items()
+        ]
+        entries.append("total;dur=%.1f" % (self.elapsed() * 1000))
+        return ", ".join(entries)
+
+    def breakdown(self) -> dict:
+        return {
+            name: {"count": count, "ms": round(duration * 1000, 1)}
+            for name, (count, duration) in self.steps.items()
+        }
+
+
+def record(name: str, duration: float):
+    """
+    Adds a measured step to the request being handled by this thread (if any)
+
+    :param name: step name (Server-Timing token, e.g. mongodb.services.find)
+    :param duration: seconds
+    """
+    recorder = getattr(_local, "recorder", None)
+    if recorder is not None:
+        recorder.add(name, duration)
+
+
+@contextmanager
+def span(name: str):
+    """
+    Measures a block of a controller (e.g. validation or diff) as one step of the request
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+class ServerTimingTool(cherrypy.Tool):
+    """
+    Enabled for the whole server with tools.server_timing.on
+    """
+
+    def __init__(self):
+        super().__init__("on_start_resource", self.start, priority=5)
+
+    def _setup(self):
+        super()._setup()
+        cherrypy.request.hooks.attach("before_finalize", self.header, priority=90)
+        cherrypy.request.hooks.attach("on_end_request", self.end, priority=90)
+
+    def start(self):
+        _local.recorder = SpanRecorder()
+
+    def header(self):
+        recorder = getattr(_local, "recorder", None)
+        if recorder is not None:
+            cherrypy.response.headers["Server-Timing"] = recorder.server_timing()
+
+    def end(self):
+        recorder = getattr(_local, "recorder", None)
+        _local.recorder = None
+        if recorder is None:
+            return
+        elapsed = recorder.elapsed() * 1000
+        threshold = cherrypy.config.get(
+            "slow_request_threshold", DEFAULT_SLOW_REQUEST_THRESHOLD
+        )
+        if elapsed >= threshold:
+            request = cherrypy.request
+            cherrypy.log(
+                "Slow request: %s"
+                % json.dumps(
+                    {
+                        "method": request.method,
+                        "path": request.script_name + request.path_info,
+                        "status": str(cherrypy.response.status),
+                        "ms": round(elapsed, 1),
+                        "steps": recorder.breakdown(),
+                    }
+                )
+            )
+
+
+def mount():
+    """
+    Enables the timing breakdown for every application
+    """
+    cherrypy.tools.server_timing = ServerTimingTool()
+    cherrypy.config.update({"tools.server_timing.on": True})
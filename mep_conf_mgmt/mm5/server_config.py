@@ -0,0 +1,130 @@
+# Copyright 2022 Centro ALGORITMI - University of Minho and Instituto de Telecomunicações - Aveiro
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+import os
+
+import cherrypy
+
+# Environment variable -> (CherryPy server setting, type, minimum value)
+# Thread pool max and accepted queue size accept -1 (no limit)
+SERVER_SETTINGS = {
+    "MEP_SERVER_THREAD_POOL": ("server.thread_pool", int, 1),
+    "MEP_SERVER_THREAD_POOL_MAX": ("server.thread_pool_max", int, -1),
+    "MEP_SERVER_SOCKET_QUEUE_SIZE": ("server.socket_queue_size", int, 1),
+    "MEP_SERVER_SOCKET_TIMEOUT": ("server.socket_timeout", int, 1),
+    "MEP_SERVER_MAX_REQUEST_BODY_SIZE": ("server.max_request_body_size", int, 0),
+    "MEP_SERVER_ACCEPTED_QUEUE_SIZE": ("server.accepted_queue_size", int, -1),
+    "MEP_SERVER_ACCEPTED_QUEUE_TIMEOUT": ("server.accepted_queue_timeout", int, 0),
+    "MEP_SERVER_PROTOCOL_VERSION": ("server.protocol_version", str, None),
+    "MEP_SERVER_NODELAY": ("server.nodelay", bool, None),
+}
+
+PROTOCOL_VERSIONS = ("HTTP/1.0", "HTTP/1.1")
+
+SERVER_PROFILES = {
+    # CherryPy defaults
+    "default": {},
+    # Recommended for a MEP serving many MEC apps: blocking OAuth/DNS/database calls need more threads,
+    # keep-alive (HTTP/1.1) connections are kept for 30s and a burst of connections waits in the queues
+    "high-throughput": {
+        "server.thread_pool": 64,
+        "server.thread_pool_max": 256,
+        "server.socket_queue_size": 1024,
+        "server.socket_timeout": 30,
+        "server.max_request_body_size": 1048576,
+        "server.accepted_queue_size": 2048,
+        "server.accepted_queue_timeout": 10,
+        "server.protocol_version": "HTTP/1.1",
+        "server.nodelay": True,
+    },
+}
+
+
+def parse_setting(env_name: str, value: str):
+    """
+    Converts and validates the value of one of the SERVER_SETTINGS environment variables
+
+    :param env_name: name of the environment variable
+    :param value: raw value of the environment variable
+    :return: value with the type expected by CherryPy
+    """
+    _, value_type, minimum = SERVER_SETTINGS[env_name]
+    if value_type is bool:
+        if value.lower() in ("1", "true", "yes", "on"):
+            return True
+        if value.lower() in ("0", "false", "no", "off"):
+            return False
+        raise ValueError("%s must be a boolean, got %s" % (env_name, value))
+    if value_type is str:
+        if value not in PROTOCOL_VERSIONS:
+            raise ValueError(
+                "%s must be one of %s, got %s" % (env_name, ", ".join(PROTOCOL_VERSIONS), value)
+            )
+        return value
+    try:
+        value = value_type(value)
+    except ValueError:
+        raise ValueError("%s must be an integer, got %s" % (env_name, value))
+    if value < minimum:
+        raise ValueError("%s must be at least %d, got %d" % (env_name, minimum, value))
+    return value
+
+
+def load_server_config(environ=None) -> dict:
+    """
+    Builds the CherryPy server settings from the selected profile (MEP_SERVER_PROFILE)
+    overridden by the individual MEP_SERVER_* environment variables
+
+    :param environ: mapping with the environment variables (defaults to os.environ)
+    :return: dict to be given to cherrypy.config.update
+    """
+    if environ is None:
+        environ = os.environ
+
+    profile = environ.get("MEP_SERVER_PROFILE", "default")
+    if profile not in SERVER_PROFILES:
+        raise ValueError(
+            "MEP_SERVER_PROFILE must be one of %s, got %s" % (", ".join(SERVER_PROFILES), profile)
+        )
+    config = dict(SERVER_PROFILES[profile])
+
+    for env_name, (setting, _, _) in SERVER_SETTINGS.items():
+        value = environ.get(env_name)
+        if value is not None and value != "":
+            config[setting] = parse_setting(env_name, value)
+
+    thread_pool = config.get("server.thread_pool", cherrypy.server.thread_pool)
+    thread_pool_max = config.get("server.thread_pool_max", cherrypy.server.thread_pool_max)
+    if thread_pool_max != -1 and thread_pool_max < thread_pool:
+        raise ValueError(
+            "MEP_SERVER_THREAD_POOL_MAX (%d) is lower than MEP_SERVER_THREAD_POOL (%d)"
+            % (thread_pool_max, thread_pool)
+        )
+
+    config["server_profile"] = profile
+    return config
+
+
+def log_server_profile():
+    """
+    Logs the effective server settings (after every config update was applied)
+    """
+    settings = ", ".join(
+        "%s=%s" % (setting.split(".", 1)[1], getattr(cherrypy.server, setting.split(".", 1)[1]))
+        for setting, _, _ in SERVER_SETTINGS.values()
+    )
+    cherrypy.log(
+        "Server profile %s: %s"
+        % (cherrypy.config.get("server_profile", "default"), settings)
+    )
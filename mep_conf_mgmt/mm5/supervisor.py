@@ -0,0 +1,173 @@
+# Copyright 2022 Centro ALGORITMI - University of Minho and Instituto de Telecomunicações - Aveiro
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""
+Pre-fork supervisor
+
+Starts MEP_WORKERS server processes that bind the same address with SO_REUSEPORT, so the kernel
+balances connections between them and each one has its own GIL and database connections.
+Crashed workers are started again and SIGTERM/SIGINT/SIGHUP are forwarded to every worker, where SIGHUP
+publishes the engine graceful channel (e.g the static responses are rebuilt).
+
+The Mm5 controllers keep no state in memory, everything is kept in the database
+"""
+
+import os
+import signal
+import threading
+import time
+import traceback
+
+import cherrypy
+from cherrypy._cpserver import Server
+
+from . import metrics
+
+# A worker that exits sooner than this after being started is restarted with a delay
+MIN_WORKER_UPTIME = 5
+RESTART_DELAY = 1
+
+
+def worker_count() -> int:
+    """
+    Number of server processes requested with MEP_WORKERS (1 means no supervisor)
+    """
+    workers = int(os.environ.get("MEP_WORKERS", 1))
+    if workers < 1:
+        raise ValueError("MEP_WORKERS must be at least 1, got %d" % workers)
+    return workers
+
+
+class ReusePortServer(Server):
+    """
+    CherryPy server that binds its socket with SO_REUSEPORT next to the other workers
+    """
+
+    reuse_port = True
+
+    def start(self):
+        if not self.httpserver:
+            self.httpserver, self.bind_addr = self.httpserver_from_self()
+        self.httpserver.reuse_port = True
+
+        # Same as ServerAdapter.start without the free port check, the address is in use by the other workers
+        self.interrupt = None
+        thread = threading.Thread(target=self._start_http_thread)
+        thread.name = "HTTPServer " + thread.name
+        thread.start()
+
+        self.wait()
+        self.running = True
+        self.bus.log("Serving on %s (SO_REUSEPORT)" % self.description)
+
+    start.priority = 75
+
+
+class Supervisor:
+    def __init__(self, workers: int, target, *args):
+        """
+        :param workers: number of worker processes
+        :param target: function that configures and starts the server (main)
+        :param args: arguments given to target
+        """
+        self.workers = workers
+        self.target = target
+        self.args = args
+        self.children = {}
+        self.started = {}
+        self.stopping = False
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGHUP, self.forward)
+
+        # Metric files of the workers (PROMETHEUS_MULTIPROC_DIR) from a previous run are stale
+        metrics_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+        if metrics_dir:
+            os.makedirs(metrics_dir, exist_ok=True)
+            for name in os.listdir(metrics_dir):
+                if name.endswith(".db"):
+                    os.remove(os.path.join(metrics_dir, name))
+
+        cherrypy.log("Starting %d worker processes" % self.workers)
+        for index in range(self.workers):
+            self.spawn(index)
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+
+            index = self.children.pop(pid, None)
+            if index is None:
+                continue
+            metrics.mark_process_dead(pid)
+            if self.stopping:
+                continue
+
+            cherrypy.log(
+                "Worker %d (pid %d) exited with status %d, restarting"
+                % (index, pid, os.waitstatus_to_exitcode(status))
+            )
+            if time.time() - self.started[index] < MIN_WORKER_UPTIME:
+                time.sleep(RESTART_DELAY)
+            if not self.stopping:
+                self.spawn(index)
+
+        cherrypy.log("All worker processes exited")
+
+    def spawn(self, index: int):
+        pid = os.fork()
+        if pid == 0:
+            self.run_worker(index)
+        self.children[pid] = index
+        self.started[index] = time.time()
+
+    def run_worker(self, index: int):
+        # Signals are handled by the CherryPy engine in the worker
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(signum, signal.SIG_DFL)
+
+        exit_code = 0
+        try:
+            cherrypy.server.unsubscribe()
+            cherrypy.server = ReusePortServer()
+            cherrypy.server.subscribe()
+            cherrypy.config.update({"worker_index": index})
+            if hasattr(cherrypy.engine, "signal_handler"):
+                # A forked worker counts as daemonized, the default SIGHUP handler would re-execute main.py
+                # in it (and start a supervisor with its own workers)
+                cherrypy.engine.signal_handler.handlers["SIGHUP"] = cherrypy.engine.graceful
+            self.target(*self.args)
+            if hasattr(cherrypy.engine, "signal_handler"):
+                cherrypy.engine.signal_handler.subscribe()
+            cherrypy.engine.block()
+        except BaseException:
+            cherrypy.log("Worker %d failed:\n%s" % (index, traceback.format_exc()))
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+
+    def stop(self, signum, frame):
+        self.stopping = True
+        self.forward(signal.SIGTERM, frame)
+
+    def forward(self, signum, frame):
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
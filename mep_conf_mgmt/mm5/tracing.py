@@ -0,0 +1,415 @@
+# Copyright 2022 Centro ALGORITMI - University of Minho and Instituto de Telecomunicações - Aveiro
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""
+Distributed tracing compatible with OpenTelemetry
+
+The trace context is read from and sent in the W3C traceparent header, spans are exported as
+OTLP/JSON (to a collector over HTTP or to a local file, one TracesData document per line).
+The current span is kept per thread; work handed to a BackgroundTask carries the context of the
+request that created it (see propagate) so a provisioning request can be followed across threads.
+
+Configuration (tracing is disabled unless an exporter is selected):
+    MEP_TRACING_EXPORTER        none, file or otlp
+    MEP_TRACING_FILE            path of the file exporter (default /tmp/mep-traces.jsonl)
+    MEP_TRACING_OTLP_ENDPOINT   OTLP/HTTP traces endpoint (default http://localhost:4318/v1/traces)
+"""
+
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import cherrypy
+import requests
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_local = threading.local()
+
+
+class SpanContext:
+    def __init__(self, trace_id: str, span_id: str, sampled: bool = True):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    def traceparent(self) -> str:
+        return "00-%s-%s-%s" % (self.trace_id, self.span_id, "01" if self.sampled else "00")
+
+    @staticmethod
+    def from_traceparent(header: str):
+        """
+        :return: SpanContext or None if the header is missing or invalid
+        """
+        if not header:
+            return None
+        match = TRACEPARENT.match(header.strip().lower())
+        if match is None or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+            return None
+        return SpanContext(match.group(1), match.group(2), int(match.group(3), 16) & 1 == 1)
+
+
+class Span:
+    def __init__(self, name: str, kind: int, parent: SpanContext = None, start_ns: int = None):
+        trace_id = parent.trace_id if parent is not None else "%032x" % random.getrandbits(128)
+        sampled = parent.sampled if parent is not None else True
+        self.context = SpanContext(trace_id, "%016x" % random.getrandbits(64), sampled)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.name = name
+        self.kind = kind
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns = None
+        self.attributes = {}
+        self.status = STATUS_OK
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def end(self, end_ns: int = None):
+        self.end_ns = end_ns if end_ns is not None else time.time_ns()
+        if self.context.sampled:
+            tracer.processor.on_end(self)
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.context.trace_id,
+            "spanId": self.context.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [otlp_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": self.status},
+        }
+        if self.parent_id is not None:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def otlp_attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+############################################ EXPORTERS ############################################
+
+
+class SpanExporter:
+    """
+    Receives batches of finished spans as an OTLP/JSON TracesData document
+    """
+
+    def export(self, traces_data: dict):
+        pass
+
+    def shutdown(self):
+        pass
+
+
+class FileSpanExporter(SpanExporter):
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def export(self, traces_data: dict):
+        line = json.dumps(traces_data) + "\n"
+        with self.lock:
+            with open(self.path, "a") as traces_file:
+                traces_file.write(line)
+
+
+class OtlpHttpSpanExporter(SpanExporter):
+    def __init__(self, endpoint: str, timeout: float = 5):
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def export(self, traces_data: dict):
+        try:
+            self.session.post(
+                self.endpoint,
+                data=json.dumps(traces_data),
+                headers={"Content-Type": "application/json"},
+                timeout=self.timeout,
+            )
+        except requests.exceptions.RequestException as e:
+            cherrypy.log("Unable to export spans to %s: %s" % (self.endpoint, e))
+
+    def shutdown(self):
+        self.session.close()
+
+
+class BatchSpanProcessor:
+    """
+    Queues finished spans and exports them from its own thread
+    Spans are dropped when the queue is full so a slow exporter never blocks a request
+    """
+
+    def __init__(self, exporter: SpanExporter, service_name: str, max_queue_size: int = 2048,
+                 max_batch_size: int = 256, schedule_delay: float = 2):
+        self.exporter = exporter
+        self.service_name = service_name
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.max_batch_size = max_batch_size
+        self.schedule_delay = schedule_delay
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="span-exporter", daemon=True)
+        self.thread.start()
+
+    def on_end(self, span: Span):
+        try:
+            self.queue.put_nowait(span)
+        except queue.Full:
+            pass
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.stopped.wait(self.schedule_delay)
+            self.flush()
+
+    def flush(self):
+        while not self.queue.empty():
+            batch = []
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    self.exporter.export(self.traces_data(batch))
+                except Exception as e:
+                    # The batch is lost but the thread keeps exporting the next ones (e.g disk full)
+                    cherrypy.log("Unable to export %d spans: %s" % (len(batch), e))
+
+    def traces_data(self, spans: list) -> dict:
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": [otlp_attribute("service.name", self.service_name)]},
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "mep"},
+                            "spans": [span.to_otlp() for span in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+
+    def shutdown(self):
+        self.stopped.set()
+        self.thread.join(timeout=self.schedule_delay + 1)
+        self.flush()
+        self.exporter.shutdown()
+
+
+class NoopSpanProcessor:
+    def on_end(self, span: Span):
+        pass
+
+    def shutdown(self):
+        pass
+
+
+class Tracer:
+    def __init__(self):
+        self.processor = NoopSpanProcessor()
+        self.enabled = False
+
+    def configure(self, exporter: SpanExporter, service_name: str):
+        self.processor = BatchSpanProcessor(exporter, service_name)
+        self.enabled = True
+
+    def shutdown(self):
+        self.processor.shutdown()
+
+
+tracer = Tracer()
+
+
+############################################ CONTEXT ############################################
+
+
+def current_context():
+    """
+    :return: SpanContext of the span active in this thread or None
+    """
+    span = getattr(_local, "span", None)
+    if span is not None:
+        return span.context
+    return getattr(_local, "remote", None)
+
+
+@contextmanager
+def span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes):
+    """
+    Opens a child of the current span, it is the current span inside the block
+    Does nothing when tracing is disabled
+    """
+    if not tracer.enabled:
+        yield None
+        return
+    new_span = Span(name, kind, current_context())
+    for key, value in attributes.items():
+        new_span.set_attribute(key, value)
+    previous = getattr(_local, "span", None)
+    _local.span = new_span
+    try:
+        yield new_span
+    except BaseException:
+        new_span.status = STATUS_ERROR
+        raise
+    finally:
+        _local.span = previous
+        new_span.end()
+
+
+def record_span(name: str, duration: float, kind: int = SPAN_KIND_CLIENT, **attributes):
+    """
+    Adds an already finished child of the current span (e.g. from the MongoDB command listener)
+
+    :param duration: seconds
+    """
+    if not tracer.enabled or current_context() is None:
+        return
+    end_ns = time.time_ns()
+    finished = Span(name, kind, current_context(), start_ns=end_ns - int(duration * 1e9))
+    for key, value in attributes.items():
+        finished.set_attribute(key, value)
+    finished.end(end_ns)
+
+
+def inject(headers: dict = None) -> dict:
+    """
+    Adds the traceparent of the current span to the headers of an outbound request
+
+    :return: the headers (a new dict when None was given)
+    """
+    if headers is None:
+        headers = {}
+    context = current_context()
+    if tracer.enabled and context is not None:
+        headers["traceparent"] = context.traceparent()
+    return headers
+
+
+def propagate(func):
+    """
+    Binds func to the trace context of the caller, to be used when handing work to another thread
+    The work runs inside a span named after func
+    """
+    if not tracer.enabled:
+        return func
+    context = current_context()
+
+    @wraps(func)
+    def traced(*args, **kwargs):
+        previous_span = getattr(_local, "span", None)
+        previous_remote = getattr(_local, "remote", None)
+        _local.span = None
+        _local.remote = context
+        try:
+            with span(func.__name__):
+                return func(*args, **kwargs)
+        finally:
+            _local.span = previous_span
+            _local.remote = previous_remote
+
+    return traced
+
+
+class TracingTool(cherrypy.Tool):
+    """
+    Opens a server span for every request, continuing the trace of the caller (traceparent)
+    Enabled for the whole server with tools.tracing.on
+    """
+
+    def __init__(self):
+        super().__init__("on_start_resource", self.start, priority=5)
+
+    def _setup(self):
+        super()._setup()
+        cherrypy.request.hooks.attach("before_finalize", self.finalize, priority=95)
+        cherrypy.request.hooks.attach("on_end_request", self.end, priority=95)
+
+    def start(self):
+        request = cherrypy.request
+        _local.remote = SpanContext.from_traceparent(request.headers.get("traceparent"))
+        server_span = Span(
+            "%s %s" % (request.method, request.script_name), SPAN_KIND_SERVER, _local.remote
+        )
+        server_span.set_attribute("http.method", request.method)
+        server_span.set_attribute("http.target", request.script_name + request.path_info)
+        _local.span = server_span
+
+    def finalize(self):
+        server_span = getattr(_local, "span", None)
+        if server_span is not None:
+            cherrypy.response.headers["traceparent"] = server_span.context.traceparent()
+
+    def end(self):
+        server_span = getattr(_local, "span", None)
+        _local.span = None
+        _local.remote = None
+        if server_span is None:
+            return
+        route = getattr(cherrypy.request, "metrics_route", None)
+        if route is not None:
+            server_span.name = "%s %s" % (cherrypy.request.method, route)
+            server_span.set_attribute("http.route", route)
+        status = str(cherrypy.response.status).split(" ", 1)[0]
+        server_span.set_attribute("http.status_code", int(status))
+        if status.startswith("5"):
+            server_span.status = STATUS_ERROR
+        server_span.end()
+
+
+def mount(service_name: str):
+    """
+    Selects the exporter from the environment and enables the server spans
+    """
+    exporter_name = os.environ.get("MEP_TRACING_EXPORTER", "none").lower()
+    if exporter_name == "file":
+        exporter = FileSpanExporter(os.environ.get("MEP_TRACING_FILE", "/tmp/mep-traces.jsonl"))
+    elif exporter_name == "otlp":
+        exporter = OtlpHttpSpanExporter(
+            os.environ.get("MEP_TRACING_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+        )
+    else:
+        return
+
+    tracer.configure(exporter, service_name)
+    cherrypy.tools.tracing = TracingTool()
+    cherrypy.config.update({"tools.tracing.on": True})
+    cherrypy.engine.subscribe("stop", tracer.shutdown)
+    cherrypy.log("Tracing enabled, exporting spans with the %s exporter" % exporter_name)
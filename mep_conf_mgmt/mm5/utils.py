@@ -27,6 +27,7 @@ from abc import ABC, abstractmethod
 from . import models
 import re
 import pprint as pp
+from kubernetes import config as k8s_config
 
 #from .models import ProblemDetails
 
@@ -74,6 +75,20 @@ def ignore_none_value(data: dict) -> dict:
     return {key: val for key, val in data.items() if val is not None}
 
 
+def exclude_keys(data: dict, *keys: str) -> dict:
+    """
+    Copy of the dictionary without the given keys, the dictionary itself is left untouched
+
+    :param data: Dictionary containing data to be returned
+    :type data: dict
+    :param keys: Keys to leave out
+    :type keys: String
+    :return: New dictionary with the remaining keys
+    :rtype: dict
+    """
+    return {key: val for key, val in data.items() if key not in keys}
+
+
 def none_to_empty_brackets(data: dict) -> dict:
     """
     Replace values of dictionary keys with None value for empty brackets {}
@@ -134,6 +149,9 @@ def json_out(cls):
     def json_out_wrapper(func):
         def inner(*args, **kwargs):
             object_to_be_serialized = func(*args, **kwargs)
+            # Pre-serialised responses already carry their own headers
+            if isinstance(object_to_be_serialized, bytes):
+                return object_to_be_serialized
             if isinstance(object_to_be_serialized, models.ProblemDetails):
                 cherrypy.response.headers["Content-Type"] = "application/problem+json"
             else:
@@ -297,6 +315,16 @@ def check_port(port, base=1024):
         raise argparse.ArgumentTypeError("%s is an invalid positive int value" % value)
     return value
 
+def load_kubernetes_config():
+    """
+    Configure the Kubernetes client with the pod service account
+    Outside a cluster (e.g. the benchmarks) the kubeconfig is used instead (KUBECONFIG or ~/.kube/config)
+    """
+    try:
+        k8s_config.load_incluster_config()
+    except k8s_config.ConfigException:
+        k8s_config.load_kube_config()
+
 def trafficRuleToNetworkPolicy(nameSpace: str, appInstanceId: str, trafficRuleId: str, data: dict):
 
     networkPolicy = {
@@ -304,7 +332,10 @@ def trafficRuleToNetworkPolicy(nameSpace: str, appInstanceId: str, trafficRuleId
         "kind": "NetworkPolicy",
         "metadata": {
             "name": "networkpolicy-%s" %trafficRuleId,
-            "namespace": "%s" %nameSpace
+            "namespace": "%s" %nameSpace,
+            # Lets the reconciler list the NetworkPolicies of an application (the label with a selector)
+            "annotations": {"mep/appInstanceId": "%s" %appInstanceId},
+            "labels": {"mep/appInstanceId": "%s" %appInstanceId}
         },
         "spec": {
             "podSelector": {
@@ -315,4 +346,65 @@ def trafficRuleToNetworkPolicy(nameSpace: str, appInstanceId: str, trafficRuleId
             "egress": data["egress"]
         }
     }
-    return networkPolicy
\ No newline at end of file
+    return networkPolicy
+
+def trafficRulesToNetworkPolicy(nameSpace: str, appInstanceId: str, data: list):
+    """
+    Single NetworkPolicy with the traffic rules of an application (MEP_NETWORK_POLICY_MODE=app, see reconciler)
+    The ingress and egress rules are deduplicated and the ones that only differ in the peers
+    (or only in the ports) are merged into one
+
+    :param data: TrafficRule.toNetworkPolicy() of each traffic rule of the application
+    :type data: List of dict
+    """
+    networkPolicy = trafficRuleToNetworkPolicy(
+        nameSpace=nameSpace,
+        appInstanceId=appInstanceId,
+        trafficRuleId="app-%s" % appInstanceId,
+        data=dict(
+            ingress=mergeNetworkPolicyRules([rule for policy in data for rule in policy["ingress"]], "from"),
+            egress=mergeNetworkPolicyRules([rule for policy in data for rule in policy["egress"]], "to"),
+        ),
+    )
+    return networkPolicy
+
+def mergeNetworkPolicyRules(rules: list, peersKey: str) -> list:
+    """
+    A NetworkPolicy rule allows the traffic of any of its peers on any of its ports (an empty list allows any)
+    so rules with the same peers can share their ports and rules with the same ports can share their peers
+
+    :param rules: Ingress or egress rules
+    :type rules: List of dict
+    :param peersKey: "from" for ingress rules and "to" for egress rules
+    :type peersKey: String
+    """
+
+    def key(items: list):
+        return tuple(sorted({json.dumps(item, sort_keys=True) for item in items}))
+
+    def unique(items: list) -> list:
+        seen = set()
+        result = []
+        for item in items:
+            itemKey = json.dumps(item, sort_keys=True)
+            if itemKey not in seen:
+                seen.add(itemKey)
+                result.append(item)
+        return result
+
+    def union(first: list, second: list) -> list:
+        # Nothing is added to an empty list (i.e. any peer or port is already allowed)
+        if not first or not second:
+            return []
+        return unique(first + second)
+
+    for sharedKey, mergedKey in ((peersKey, "ports"), ("ports", peersKey)):
+        merged = {}
+        for rule in rules:
+            shared = key(rule[sharedKey])
+            if shared in merged:
+                merged[shared][mergedKey] = union(merged[shared][mergedKey], rule[mergedKey])
+            else:
+                merged[shared] = {peersKey: unique(rule[peersKey]), "ports": unique(rule["ports"])}
+        rules = list(merged.values())
+    return rules